@@ -0,0 +1,93 @@
+import hashlib
+import os
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Optional
+import db
+from logger import logger
+
+ANALYZER_CACHE_SIZE = int(os.getenv("ANALYZER_CACHE_SIZE", 1024))
+ANALYZER_CACHE_TTL = float(os.getenv("ANALYZER_CACHE_TTL", 3600))
+ANALYZER_CACHE_PERSIST = os.getenv("ANALYZER_CACHE_PERSIST", "false").lower() in ("1", "true", "yes")
+
+# Part of every key; bumped whenever normalize_text changes, so persisted results of the old normalization are
+# never served for texts it used to merge
+CACHE_KEY_VERSION = 2
+
+# Emoji presentation selector, present in some copies of the same emoji and not in others
+VARIATION_SELECTOR = "\ufe0f"
+
+def _separator(char: str) -> bool:
+    # Punctuation, spaces and control characters; "/" is kept as in the answer format
+    return char != "/" and unicodedata.category(char)[0] in "PZC"
+
+def normalize_text(message: str) -> str:
+    # Reposts differ in punctuation, case and line breaks, not in meaning. Emoji are kept: channels mark a threat
+    # and its all-clear with 🔴/🟢 over the same text.
+    text = message.casefold().replace("ё", "е").replace(VARIATION_SELECTOR, "")
+    return " ".join("".join(" " if _separator(c) else c for c in text).split())
+
+def cache_key(message: str, source: str, prompt_version: str) -> str:
+    raw = f"{CACHE_KEY_VERSION}\x00{prompt_version}\x00{source or ''}\x00{normalize_text(message)}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+class AnalysisCache:
+    def __init__(self, maxsize: int = ANALYZER_CACHE_SIZE, ttl: float = ANALYZER_CACHE_TTL, persist: bool = ANALYZER_CACHE_PERSIST):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.persist = persist
+        self.entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self.hits = 0
+        self.db_hits = 0
+        self.misses = 0
+
+    async def get(self, key: str) -> Optional[str]:
+        entry = self.entries.get(key)
+        if entry is not None:
+            expires_at, result = entry
+            if expires_at > time.monotonic():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return result
+            self.entries.pop(key, None)
+
+        if self.persist:
+            try:
+                result = await db.get_cached_analysis(key, self.ttl)
+            except Exception:
+                logger.error("[CACHE] Failed to read analyzer cache from DB", exc_info=True)
+                result = None
+            if result is not None:
+                self._remember(key, result)
+                self.db_hits += 1
+                return result
+
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, result: str):
+        self._remember(key, result)
+        if self.persist:
+            try:
+                await db.save_cached_analysis(key, result)
+            except Exception:
+                logger.error("[CACHE] Failed to write analyzer cache to DB", exc_info=True)
+
+    def _remember(self, key: str, result: str):
+        self.entries[key] = (time.monotonic() + self.ttl, result)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.db_hits + self.misses
+        return {
+            "size": len(self.entries),
+            "hits": self.hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.db_hits) / lookups, 4) if lookups else 0.0,
+        }
+
+analysis_cache = AnalysisCache()
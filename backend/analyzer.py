@@ -1,112 +1,389 @@
-from openai import OpenAI
-from ollama import Client
-import openai
-import os
-from dotenv import load_dotenv
-from config import ANALYZER_REGIONS, REGIONS, TELEGRAM_CHANNELS
-from logger import logger
-
-load_dotenv()
-
-def analyze_message(message: str, source: str, channel_name: str) -> str:
-    prompt = f"""
-Проанализируй следующий текст и выдай результат СТРОГО в формате:
-
-[УРОВЕНЬ]/[РЕГИОН]/[ТИП ОПАСНОСТИ]
-
-УРОВЕНЬ:  
-- HD — высокий уровень опасности (по умолчанию для ракетной и воздушной тревоги, если не указано иное)  
-- MD — повышенный уровень опасности (включая "внимание", "повышенная готовность")  
-- AC — отмена тревоги или отсутствие угрозы
-
-РЕГИОН:  
-Выводи точное официальное название субъекта Российской Федерации.  
-Если в сообщении указан город или населённый пункт, определи, к какому субъекту он относится, и выведи именно субъект РФ.  
-Разрешается использовать только следующие названия (в точности как написано, без изменений):  
-$1
-$2
-ТИП ОПАСНОСТИ:  
-Только одно из: UAV, AIR, ROCKET, UB, ALL
-
-$3
-СОКРАЩЕНИЯ:
-UAV - беспилотный летательный аппарат, БПЛА  
-AIR - воздушная опасность  
-ROCKET - ракетная опасность  
-UB - безэкипажный катер
-ALL - все опасности.
-         
-ПРАВИЛА:
-- САМОЕ ГЛАВНОЕ: Сообщения, не содержащие необходимой информации, игнорировать (выводить пустую строку).
-- Для ракетной и воздушной опасности по умолчанию уровень HD, если не указано иное.  
-- Если тревога отменена, использовать AC.  
-- Если сообщение содержит "внимание", "повышенная готовность" и подобные — использовать MD.  
-- Если несколько регионов — вывести для каждого отдельную запись через запятую без пробела после запятой (например: MD/Рязанская область/UAV,HD/Республика Мордовия/UAV).  
-- Использовать только символ "/" для разделения.  
-- Выводить только итоговую строку, без лишних слов, кавычек и пояснений.
-- Если написано "наблюдается сбитие", "пролетают" и т.п., то уровень HD.
-- Если сначала написано "БПЛА пролетают регион N", а затем "Регион M на подлете", то означает, что в обоих регионах атака БПЛА (UAV), при этом у региона М средняя опасность, у региона N - высокая
-- Если сообщение содержит формулировки вроде "тишина", "чистое небо", "регион чисто", "угрозы не фиксируются", "не фиксируем угроз", "угроз нет", трактовать это как AC (отсутствие угроз) и ALL (все угрозы), например AC/Брянская область/ALL.
-- Если формулировки вроде "тишина", "чистое небо", "угрозы не фиксируются", "не фиксируем угроз", "угроз нет" указаны глобально ("по всей России", "угроз не фиксируется по стране") — выдать AC (отсутствие угроз) и ALL (все угрозы) для региона "Россия".
-- МВШ (малый воздушный шар) квалифицировать как Воздушную угрозу (AIR)
-
-Текст для анализа:  
-{message}
-"""
-    if source and source in TELEGRAM_CHANNELS:
-        prompt = prompt.replace("$1", f"{", ".join(ANALYZER_REGIONS[source])}\n")
-        if "Россия" in ANALYZER_REGIONS[source]:
-            prompt = prompt.replace("$2", "Регион \"Россия\" использовать только при глобальных уведомлениях (например, \"по всей России\", \"угроз не фиксируется по стране\") и зачастую только для AC.\n")
-        else:
-            prompt = prompt.replace("$2", "")
-    else:
-        prompt = prompt.replace("$1", f"{", ".join(REGIONS)}\n")
-        prompt = prompt.replace("$2", "Регион \"Россия\" использовать только при глобальных уведомлениях (например, \"по всей России\", \"угроз не фиксируется по стране\") и зачастую только для AC.\n")
-
-    if channel_name and channel_name not in ["@radaronebot (/report)", "Admin"]: prompt = prompt.replace("$3", f"НАЗВАНИЕ ТЕЛЕГРАМ-КАНАЛА (используй для формирования более корректного названия): {channel_name}\n")
-    else: prompt = prompt.replace("$3", "")
-
-    try:
-        openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        logger.info(f"[GPT] Analyzing message using OpenAI")
-        response = openai_client.chat.completions.create(
-            model="o3-mini",
-            messages=[
-                {"role": "system", "content": "ЧЕТКО СЛЕДУЙ ИНСТРУКЦИЯМ, ДАННЫМ В СООБЩЕНИИ"},
-                {"role": "user", "content": prompt}
-            ]
-        )
-        result = response.choices[0].message.content.strip()
-        logger.info(f"[GPT] Analysis result: {result}")
-        return result
-
-    except Exception as openai_error:
-        if isinstance(openai_error, openai.RateLimitError): logger.error("[GPT] Error in analyze_message(), rate limit exceeded — trying Ollama")
-        elif isinstance(openai_error, openai.PermissionDeniedError): logger.error("[GPT] Error in analyze_message(), unsupported request country — trying Ollama")
-        elif isinstance(openai_error, openai.AuthenticationError): logger.error("[GPT] Error in analyze_message(), authentication error — trying Ollama")
-        else: logger.error("[GPT] Error in analyze_message() — trying Ollama", exc_info=True)
-
-        try:
-            ollama_model = os.getenv("OLLAMA_MODEL")
-            logger.info(f"[OLLAMA] Sending request to Ollama (model {ollama_model})")
-            ollama_client = Client(
-                host="https://ollama.com",
-                headers={"Authorization": f"Bearer {os.getenv("OLLAMA_API_KEY")}"}
-            )
-            messages = [
-                {
-                    'role': 'user',
-                    'content': "ЧЕТКО СЛЕДУЙ ИНСТРУКЦИЯМ, ДАННЫМ В СООБЩЕНИИ\n" + prompt,
-                },
-            ]
-
-            result = ""
-            for part in ollama_client.chat(ollama_model, messages=messages, stream=True):
-                result += f"{part['message']['content']}\n"
-            result = result.replace("\n", "")
-            logger.info(f"[OLLAMA] Analysis result: {result}")
-            return result
-
-        except Exception as ollama_error:
-            logger.error("[OLLAMA] Critical error while using Ollama", exc_info=True)
-            return "AC/Россия/ALL"
+import asyncio
+import hashlib
+import os
+import re
+import time
+from contextlib import aclosing
+from typing import AsyncIterator, Optional
+from dotenv import load_dotenv
+from config import ANALYZER_REGIONS, REGIONS, TELEGRAM_CHANNELS
+from analysis_cache import analysis_cache, cache_key
+from classifier import CLASSIFIER_MODE, classify, compare_with_llm
+from gazetteer import candidate_regions
+from providers import AllProvidersFailed, ProviderRouter, build_providers
+from ledger import CallRecord, ledger
+from logger import logger
+
+load_dotenv()
+
+ANALYZER_CONCURRENCY = int(os.getenv("ANALYZER_CONCURRENCY", 4))
+ANALYZER_REGION_PREFILTER = os.getenv("ANALYZER_REGION_PREFILTER", "true").lower() in ("1", "true", "yes")
+ANALYZER_BATCH_WINDOW = float(os.getenv("ANALYZER_BATCH_WINDOW", 0))
+ANALYZER_BATCH_SIZE = int(os.getenv("ANALYZER_BATCH_SIZE", 8))
+
+FAILSAFE_RESULT = "AC/Россия/ALL"
+
+ENTRY_SEPARATOR = re.compile(r"[,\n]")
+LINE_SEPARATOR = re.compile(r"\n")
+
+def split_entries(result: str) -> list[str]:
+    return [e.strip() for e in ENTRY_SEPARATOR.split(result) if e.strip()]
+
+def is_reliable(call: CallRecord, entries: list[str]) -> bool:
+    return not call.failsafe and not call.fallbacks and FAILSAFE_RESULT not in entries
+
+class AnalyzerEngine:
+    def __init__(self, router: Optional[ProviderRouter] = None):
+        self.router = router or ProviderRouter(build_providers())
+        self.semaphore = asyncio.Semaphore(ANALYZER_CONCURRENCY)
+        self.batcher = AnalyzerBatcher(self, ANALYZER_BATCH_WINDOW, ANALYZER_BATCH_SIZE)
+
+    async def analyze_stream(
+        self,
+        messages: list[dict],
+        separator: re.Pattern = ENTRY_SEPARATOR,
+        call: Optional[CallRecord] = None,
+    ) -> AsyncIterator[str]:
+        # Yields each "STATUS/REGION/TYPE" entry (or each line for batches) as soon as the separator after it arrives
+        async with self.semaphore:
+            seen = set()
+            current = None
+            buffer = ""
+            try:
+                async with aclosing(self.router.stream(messages, call)) as stream:
+                    async for provider, chunk in stream:
+                        if chunk is None:
+                            if seen:
+                                # Entries already went out, another provider's answer would be mixed into them
+                                logger.warning(f"[GPT] {provider.name} failed mid-answer, keeping {len(seen)} entries")
+                                return
+                            continue
+                        if provider is not current:
+                            current, buffer = provider, ""
+                        *entries, buffer = separator.split(buffer + chunk)
+                        for entry in entries:
+                            entry = entry.strip()
+                            if entry and entry not in seen:
+                                seen.add(entry)
+                                yield entry
+            except AllProvidersFailed:
+                if seen:
+                    return
+                logger.error("[GPT] Critical error: every analyzer provider failed, using failsafe result")
+                if call:
+                    call.failsafe = True
+                yield FAILSAFE_RESULT
+                return
+            entry = buffer.strip()
+            if entry and entry not in seen:
+                yield entry
+
+_engine: Optional[AnalyzerEngine] = None
+
+def get_engine() -> AnalyzerEngine:
+    # Created on first use, inside the running loop its clients and batcher timers are bound to
+    global _engine
+    if _engine is None:
+        _engine = AnalyzerEngine()
+        logger.info(
+            f"[GPT] Analyzer engine created (concurrency {ANALYZER_CONCURRENCY}, "
+            f"providers {[p.name for p in _engine.router.providers]})"
+        )
+    return _engine
+
+SYSTEM_PROMPT = """ЧЕТКО СЛЕДУЙ ИНСТРУКЦИЯМ.
+Проанализируй текст из сообщения пользователя и выдай результат СТРОГО в формате:
+
+[УРОВЕНЬ]/[РЕГИОН]/[ТИП ОПАСНОСТИ]
+
+УРОВЕНЬ:  
+- HD — высокий уровень опасности (по умолчанию для ракетной и воздушной тревоги, если не указано иное)  
+- MD — повышенный уровень опасности (включая "внимание", "повышенная готовность")  
+- AC — отмена тревоги или отсутствие угрозы
+
+РЕГИОН:  
+Выводи точное официальное название субъекта Российской Федерации.  
+Если в сообщении указан город или населённый пункт, определи, к какому субъекту он относится, и выведи именно субъект РФ.  
+Разрешается использовать только названия из списка "РЕГИОНЫ" в сообщении пользователя (в точности как написано, без изменений).
+
+ТИП ОПАСНОСТИ:  
+Только одно из: UAV, AIR, ROCKET, UB, ALL
+
+СОКРАЩЕНИЯ:
+UAV - беспилотный летательный аппарат, БПЛА  
+AIR - воздушная опасность  
+ROCKET - ракетная опасность  
+UB - безэкипажный катер
+ALL - все опасности.
+         
+ПРАВИЛА:
+- САМОЕ ГЛАВНОЕ: Сообщения, не содержащие необходимой информации, игнорировать (выводить пустую строку).
+- Для ракетной и воздушной опасности по умолчанию уровень HD, если не указано иное.  
+- Если тревога отменена, использовать AC.  
+- Если сообщение содержит "внимание", "повышенная готовность" и подобные — использовать MD.  
+- Если несколько регионов — вывести для каждого отдельную запись через запятую без пробела после запятой (например: MD/Рязанская область/UAV,HD/Республика Мордовия/UAV).  
+- Использовать только символ "/" для разделения.  
+- Выводить только итоговую строку, без лишних слов, кавычек и пояснений.
+- Если написано "наблюдается сбитие", "пролетают" и т.п., то уровень HD.
+- Если сначала написано "БПЛА пролетают регион N", а затем "Регион M на подлете", то означает, что в обоих регионах атака БПЛА (UAV), при этом у региона М средняя опасность, у региона N - высокая
+- Если сообщение содержит формулировки вроде "тишина", "чистое небо", "регион чисто", "угрозы не фиксируются", "не фиксируем угроз", "угроз нет", трактовать это как AC (отсутствие угроз) и ALL (все угрозы), например AC/Брянская область/ALL.
+- Если формулировки вроде "тишина", "чистое небо", "угрозы не фиксируются", "не фиксируем угроз", "угроз нет" указаны глобально ("по всей России", "угроз не фиксируется по стране") — выдать AC (отсутствие угроз) и ALL (все угрозы) для региона "Россия".
+- МВШ (малый воздушный шар) квалифицировать как Воздушную угрозу (AIR)
+"""
+
+RUSSIA_HINT = "Регион \"Россия\" использовать только при глобальных уведомлениях (например, \"по всей России\", \"угроз не фиксируется по стране\") и зачастую только для AC.\n"
+CHANNEL_HINT = "НАЗВАНИЕ ТЕЛЕГРАМ-КАНАЛА (используй для формирования более корректного названия): {}\n"
+INTERNAL_CHANNELS = ["@radaronebot (/report)", "Admin"]
+BATCH_HINT = """В запросе несколько сообщений, перед каждым стоит его номер в квадратных скобках.
+Проанализируй каждое сообщение отдельно по тем же правилам и для каждого выведи отдельную строку вида "номер: результат", например:
+1: MD/Рязанская область/UAV,HD/Республика Мордовия/UAV
+2: 
+Если сообщение не содержит необходимой информации, оставь после двоеточия пустоту. Не пропускай номера и не объединяй сообщения.
+"""
+BATCH_REGIONS_HINT = """У каждого сообщения свой список "РЕГИОНЫ" сразу после его номера: для этого сообщения используй только названия из его списка.
+"""
+BATCH_LINE = re.compile(r"^\[?(\d+)\]?\s*:\s*(.*)$")
+
+class SourcePrompt:
+    def __init__(self, regions: list[str]):
+        self.regions = regions
+        # Full region list, used whenever the gazetteer can't narrow the candidates down
+        self.full_list = f"РЕГИОНЫ:\n{", ".join(regions)}\n"
+        self.prefix = RUSSIA_HINT if "Россия" in regions else ""
+
+def _compile_source_prompts() -> dict[str, SourcePrompt]:
+    prompts = {source: SourcePrompt(regions) for source, regions in ANALYZER_REGIONS.items() if source in TELEGRAM_CHANNELS}
+    prompts[None] = SourcePrompt(REGIONS)
+    return prompts
+
+SOURCE_PROMPTS = _compile_source_prompts()
+
+# Changes whenever the prompt wording changes, so caches and metrics never mix results of different prompts
+PROMPT_VERSION = hashlib.sha1(
+    "\x00".join([SYSTEM_PROMPT, RUSSIA_HINT, CHANNEL_HINT, BATCH_HINT, BATCH_REGIONS_HINT] + [p.full_list for p in SOURCE_PROMPTS.values()]).encode("utf-8")
+).hexdigest()[:12]
+
+def _region_list(source_prompt: SourcePrompt, regions: set[str]) -> str:
+    narrowed = [r for r in source_prompt.regions if r in regions]
+    if len(narrowed) < len(source_prompt.regions):
+        logger.debug(f"[GPT] Prompt narrowed to {len(narrowed)}/{len(source_prompt.regions)} regions")
+        return f"РЕГИОНЫ:\n{", ".join(narrowed)}\n"
+    return source_prompt.full_list
+
+def _candidates(message: str, source_prompt: SourcePrompt) -> list[str]:
+    return candidate_regions(message, source_prompt.regions) if ANALYZER_REGION_PREFILTER else source_prompt.regions
+
+def source_prompt_for(source: str) -> SourcePrompt:
+    return SOURCE_PROMPTS.get(source) or SOURCE_PROMPTS[None]
+
+def build_messages(message: str, source: str, channel_name: str) -> list[dict]:
+    # Static system prompt first and the message last, so provider prefix caching covers everything but the tail
+    source_prompt = source_prompt_for(source)
+    parts = [source_prompt.prefix, _region_list(source_prompt, set(_candidates(message, source_prompt)))]
+    if channel_name and channel_name not in INTERNAL_CHANNELS:
+        parts.append(CHANNEL_HINT.format(channel_name))
+    parts.append(f"\nТекст для анализа:\n{message}\n")
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": "".join(parts)},
+    ]
+
+def build_batch_messages(items: list["BatchItem"]) -> list[dict]:
+    # Posts of sources with the same region list share one list in the header, a batch that mixes sources gives
+    # every post its own list after its number
+    prompts = [source_prompt_for(item.source) for item in items]
+    candidates = [set(_candidates(item.message, prompt)) for item, prompt in zip(items, prompts)]
+    mixed = len(set(prompts)) > 1
+
+    parts = [RUSSIA_HINT if any(prompt.prefix for prompt in prompts) else ""]
+    if mixed:
+        parts += [BATCH_HINT, BATCH_REGIONS_HINT]
+    else:
+        parts += [_region_list(prompts[0], set().union(*candidates)), BATCH_HINT]
+    for i, (item, prompt, regions) in enumerate(zip(items, prompts, candidates), 1):
+        parts.append(f"\n[{i}]\n")
+        if mixed:
+            parts.append(_region_list(prompt, regions))
+        if item.channel_name and item.channel_name not in INTERNAL_CHANNELS:
+            parts.append(CHANNEL_HINT.format(item.channel_name))
+        parts.append(f"Текст для анализа:\n{item.message}\n")
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": "".join(parts)},
+    ]
+
+class BatchItem:
+    def __init__(self, message: str, source: str, channel_name: str, call: CallRecord):
+        self.message = message
+        self.source = source
+        self.channel_name = channel_name
+        self.call = call
+        # Entries for this message, None marks the end of its answer
+        self.entries: asyncio.Queue[str | None] = asyncio.Queue()
+        self.done = False
+
+    def put(self, entry: str):
+        self.call.entry()
+        self.entries.put_nowait(entry)
+
+    def finish(self, entries: list[str]):
+        if self.done:
+            return
+        self.done = True
+        for entry in entries:
+            self.put(entry)
+        self.call.latency_ms = self.call.elapsed_ms()
+        self.entries.put_nowait(None)
+
+class AnalyzerBatcher:
+    # Posts that arrive within a short window share one request, whatever channel they come from: the prompt is
+    # sent once and the model answers one numbered line per post, which is routed back to the waiting caller.
+    def __init__(self, engine: AnalyzerEngine, window: float, max_size: int):
+        self.engine = engine
+        self.window = window
+        self.max_size = max_size
+        self.pending: list[BatchItem] = []
+        self.timer: Optional[asyncio.TimerHandle] = None
+        self.tasks: set[asyncio.Task] = set()
+        self.batches = 0
+        self.items = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.window > 0 and self.max_size > 1
+
+    async def submit(self, message: str, source: str, channel_name: str, call: CallRecord) -> AsyncIterator[str]:
+        item = BatchItem(message, source, channel_name, call)
+        self.pending.append(item)
+        if len(self.pending) >= self.max_size:
+            self.flush()
+        elif len(self.pending) == 1:
+            self.timer = asyncio.get_running_loop().call_later(self.window, self.flush)
+
+        while (entry := await item.entries.get()) is not None:
+            yield entry
+
+    def flush(self):
+        if self.timer:
+            self.timer.cancel()
+            self.timer = None
+        items, self.pending = self.pending, []
+        if not items:
+            return
+        task = asyncio.create_task(self.run(items))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def single(self, item: BatchItem):
+        # Regular single-message prompt and streaming, the item's call is filled in by the engine directly
+        async for entry in self.engine.analyze_stream(build_messages(item.message, item.source, item.channel_name), call=item.call):
+            item.put(entry)
+        item.finish([])
+
+    async def run(self, items: list[BatchItem]):
+        self.batches += 1
+        self.items += len(items)
+        batch_call = CallRecord("batch")
+        shared = []
+        try:
+            if len(items) == 1:
+                await self.single(items[0])
+            else:
+                logger.info(f"[GPT] Analyzing batch of {len(items)} messages")
+                failsafe = False
+                async for line in self.engine.analyze_stream(
+                    build_batch_messages(items), separator=LINE_SEPARATOR, call=batch_call
+                ):
+                    if line == FAILSAFE_RESULT:
+                        failsafe = True
+                        break
+                    match = BATCH_LINE.match(line)
+                    if not match:
+                        logger.warning(f"[GPT] Unexpected batch answer line: {line!r}")
+                        continue
+                    index = int(match.group(1)) - 1
+                    if 0 <= index < len(items) and not items[index].done:
+                        item = items[index]
+                        # Shared before finish, the caller decides on caching as soon as the item is done
+                        item.call.share(batch_call, len(items))
+                        shared.append(item)
+                        item.finish(split_entries(match.group(2)))
+                missing = [item for item in items if not item.done]
+                if missing and not failsafe:
+                    # No line for these posts (skipped by the model or cut off): an empty answer would read as
+                    # "no alerts", so each is asked again on its own
+                    logger.warning(f"[GPT] Batch answer has no line for {len(missing)} messages, analyzing them separately")
+                    await asyncio.gather(*(self.single(item) for item in missing))
+        except Exception:
+            logger.error("[GPT] Error while analyzing batch", exc_info=True)
+        for item in items:
+            if not item.done:
+                # Whatever is still unanswered here failed together with the request
+                item.call.share(batch_call, len(items))
+                shared.append(item)
+                item.finish([FAILSAFE_RESULT])
+        for item in items:
+            if item in shared:
+                # Tokens are known only now that the whole answer has arrived
+                item.call.share(batch_call, len(items))
+            ledger.record(item.call)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "batches": self.batches,
+            "items": self.items,
+            "avg_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+        }
+
+async def analyze_message_stream(message: str, source: str, channel_name: str) -> AsyncIterator[str]:
+    call = CallRecord(source)
+    rule_result = classify(message, source) if CLASSIFIER_MODE in ("on", "shadow") else None
+    if rule_result is not None and CLASSIFIER_MODE == "on":
+        logger.info(f"[RULES] Analysis result: {rule_result}")
+        call.rule_hit = True
+        for entry in split_entries(rule_result):
+            call.entry()
+            yield entry
+        ledger.record(call)
+        return
+
+    key = cache_key(message, source, PROMPT_VERSION)
+    cached = await analysis_cache.get(key)
+    if cached is not None:
+        logger.info(f"[GPT] Cached analysis result: {cached}")
+        compare_with_llm(rule_result, cached, message)
+        call.cache_hit = True
+        for entry in split_entries(cached):
+            call.entry()
+            yield entry
+        ledger.record(call)
+        return
+
+    engine = get_engine()
+    entries = []
+    if engine.batcher.enabled:
+        # The batcher fills in and records the call itself, it knows how the request was shared
+        async for entry in engine.batcher.submit(message, source, channel_name, call):
+            entries.append(entry)
+            yield entry
+    else:
+        async for entry in engine.analyze_stream(build_messages(message, source, channel_name), call=call):
+            call.entry()
+            entries.append(entry)
+            paused = time.monotonic()
+            yield entry
+            # Time the caller spends handling an entry is not analyzer latency
+            call.started += time.monotonic() - paused
+        ledger.record(call)
+
+    # The failsafe and answers that involved a failed provider are not reliable, a later repost must still reach the LLM
+    if is_reliable(call, entries):
+        result = ",".join(entries)
+        await analysis_cache.set(key, result)
+        compare_with_llm(rule_result, result, message)
+
+async def analyze_message(message: str, source: str, channel_name: str) -> str:
+    return ",".join([
+        entry async for entry in analyze_message_stream(message, source=source, channel_name=channel_name)
+    ])
@@ -0,0 +1,90 @@
+"""Compares the fast t.me extractor with BeautifulSoup: output and time per page.
+
+benchmarks/fixtures holds synthetic pages generated from a template of the t.me/s markup, with made-up posts under
+made-up channel names. They keep the benchmark and the extractor tests runnable offline and check the markup
+handling, but their timings are not those of real channel pages. For those, run with --record: it downloads the
+current pages of the channels into benchmarks/pages, and both sets are measured.
+"""
+import argparse
+import asyncio
+import glob
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import aiohttp
+from config import TELEGRAM_CHANNELS
+from extractor import extract_posts_bs4, extract_posts_fast
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+PAGES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pages")
+
+async def record(channels: list[str]):
+    os.makedirs(PAGES_DIR, exist_ok=True)
+    async with aiohttp.ClientSession() as session:
+        for channel in channels:
+            async with session.get(f"https://t.me/s/{channel}") as response:
+                response.raise_for_status()
+                page = await response.text()
+            with open(os.path.join(PAGES_DIR, f"{channel}.html"), "w", encoding="utf-8") as f:
+                f.write(page)
+            print(f"recorded {channel} ({len(page)} bytes)")
+
+def timeit(func, page: str, after, rounds: int) -> float:
+    start = time.perf_counter()
+    for _ in range(rounds):
+        func(page, after)
+    return (time.perf_counter() - start) / rounds * 1000
+
+def bench(rounds: int):
+    pages = sorted(glob.glob(os.path.join(FIXTURES_DIR, "*.html"))) + sorted(glob.glob(os.path.join(PAGES_DIR, "*.html")))
+    if not pages:
+        print(f"No pages in {FIXTURES_DIR} or {PAGES_DIR}")
+        return 1
+
+    mismatches = 0
+    total_fast = total_bs4 = 0.0
+    print(f"{'page':<30}{'posts':>7}{'bs4 ms':>10}{'fast ms':>10}{'delta ms':>10}{'speedup':>9}")
+    for path in pages:
+        with open(path, encoding="utf-8") as f:
+            page = f.read()
+
+        expected = extract_posts_bs4(page)
+        actual = extract_posts_fast(page)
+        if actual != expected:
+            mismatches += 1
+            print(f"MISMATCH in {os.path.basename(path)}")
+            for a, b in zip(expected["posts"], actual["posts"]):
+                if a != b:
+                    print(f"  bs4:  {a}\n  fast: {b}")
+            if expected["channel_name"] != actual["channel_name"]:
+                print(f"  title bs4: {expected['channel_name']!r} fast: {actual['channel_name']!r}")
+
+        # Steady state: everything but the newest post is already behind the watermark
+        after = expected["posts"][-2]["post_id"] if len(expected["posts"]) > 1 else None
+        if after is not None and extract_posts_fast(page, after)["posts"] != expected["posts"][-2:]:
+            mismatches += 1
+            print(f"MISMATCH in {os.path.basename(path)} after {after}")
+        bs4_ms = timeit(extract_posts_bs4, page, None, rounds)
+        fast_ms = timeit(extract_posts_fast, page, None, rounds)
+        delta_ms = timeit(extract_posts_fast, page, after, rounds)
+        total_bs4 += bs4_ms
+        total_fast += fast_ms
+        print(f"{os.path.basename(path):<30}{len(expected['posts']):>7}{bs4_ms:>10.2f}{fast_ms:>10.2f}{delta_ms:>10.2f}{bs4_ms / fast_ms:>8.1f}x")
+
+    print(f"{'total':<30}{'':>7}{total_bs4:>10.2f}{total_fast:>10.2f}{'':>10}{total_bs4 / total_fast:>8.1f}x")
+    print("outputs identical" if not mismatches else f"{mismatches} page(s) differ")
+    return 1 if mismatches else 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the fast t.me extractor with BeautifulSoup on synthetic fixtures and recorded pages")
+    parser.add_argument("--record", action="store_true", help="download t.me/s pages of the channels into benchmarks/pages first")
+    parser.add_argument("--rounds", type=int, default=50)
+    parser.add_argument("channels", nargs="*", default=TELEGRAM_CHANNELS)
+    args = parser.parse_args()
+
+    if args.record:
+        asyncio.run(record(args.channels))
+    sys.exit(bench(args.rounds))
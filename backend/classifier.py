@@ -0,0 +1,126 @@
+import os
+import re
+from typing import Optional
+from config import ANALYZER_REGIONS, REGIONS, TELEGRAM_CHANNELS
+from gazetteer import find_regions, has_unplaced_names, is_global
+from logger import logger
+
+CLASSIFIER_MODE = os.getenv("CLASSIFIER_MODE", "shadow").lower()
+CLASSIFIER_MAX_LENGTH = int(os.getenv("CLASSIFIER_MAX_LENGTH", 280))
+
+def _compile(pattern: str) -> re.Pattern:
+    return re.compile(rf"(?<![\w-])(?:{pattern})", flags=re.IGNORECASE)
+
+TYPE_PATTERNS = {
+    "UAV": _compile(r"бпла|беспилотн\w*|дрон\w*|🛸"),
+    "AIR": _compile(r"мвш|воздушн\w*\s+(?:шар\w*|опасност\w*|угроз\w*|тревог\w*|атак\w*)|авиаци\w*"),
+    "ROCKET": _compile(r"ракетн\w*|ракет[аыу]?(?![\w-])"),
+    "UB": _compile(r"бэк|безэкипажн\w*|катер\w*"),
+}
+
+ALL_CLEAR_PATTERN = _compile(
+    r"тишин\w*|чист\w*\s+неб\w*|(?:регион|небо)\s+чист\w*|угроз\w*\s+не\s+фиксиру\w*|не\s+фиксиру\w*\s+угроз\w*|угроз\w*\s+нет"
+)
+AC_PATTERN = _compile(r"отбой|отбоя|отменен\w*|отменён\w*|отмена")
+MD_PATTERN = _compile(r"внимани\w*|повышенн\w*\s+готовност\w*|на\s+подл[её]т\w*")
+HD_STRONG_PATTERN = _compile(r"пролета\w*|пролет\w*|пролёт\w*|сбит\w*|наблюдает\w*|работа\w*\s+пво")
+HD_WEAK_PATTERN = _compile(r"тревог\w*|атак\w*")
+DANGER_PATTERN = _compile(r"опасност\w*")
+# "Угрозы БПЛА не наблюдается", "атака отражена": threat words that report its absence or end
+NEGATION_PATTERN = _compile(
+    r"не\s+наблюда\w*|не\s+фиксиру\w*|не\s+зафиксирова\w*|миновал\w*|снят\w*|отраж[её]н\w*|ликвидир\w*|ликвидирова\w*"
+)
+# Hedged or questioning wording is left to the LLM
+UNCERTAIN_PATTERN = re.compile(r"\?|возможн\w*|вероятн\w*|не\s+исключ\w*|уточня\w*", flags=re.IGNORECASE)
+
+class ClassifierStats:
+    def __init__(self):
+        self.calls = 0
+        self.fired = 0
+        self.shadow_agree = 0
+        self.shadow_disagree = 0
+
+    def stats(self) -> dict:
+        compared = self.shadow_agree + self.shadow_disagree
+        return {
+            "mode": CLASSIFIER_MODE,
+            "calls": self.calls,
+            "fired": self.fired,
+            "fire_rate": round(self.fired / self.calls, 4) if self.calls else 0.0,
+            "shadow_agree": self.shadow_agree,
+            "shadow_disagree": self.shadow_disagree,
+            "shadow_agreement": round(self.shadow_agree / compared, 4) if compared else 0.0,
+        }
+
+classifier_stats = ClassifierStats()
+
+def _triples(result: str) -> set[tuple[str, ...]]:
+    return {
+        tuple(p.strip() for p in chunk.split("/"))
+        for chunk in result.replace("\n", ",").split(",")
+        if chunk.count("/") == 2
+    }
+
+def _status(text: str, attack_type: Optional[str]) -> Optional[str]:
+    ac = AC_PATTERN.search(text) is not None
+    md = MD_PATTERN.search(text) is not None
+    hd_strong = HD_STRONG_PATTERN.search(text) is not None
+    hd_weak = HD_WEAK_PATTERN.search(text) is not None or (
+        attack_type in ("ROCKET", "AIR") and DANGER_PATTERN.search(text) is not None
+    )
+
+    if ac:
+        # "Отбой ракетной тревоги": the alarm word is what gets cancelled, not a second status
+        return "AC" if not (md or hd_strong) else None
+    if NEGATION_PATTERN.search(text):
+        # Never an active threat; whether it is an all-clear is left to the LLM
+        return None
+    if md:
+        return "MD" if not hd_strong else None
+    if hd_strong or hd_weak:
+        return "HD"
+    return None
+
+def classify(message: str, source: str) -> Optional[str]:
+    classifier_stats.calls += 1
+    if len(message) > CLASSIFIER_MAX_LENGTH or UNCERTAIN_PATTERN.search(message):
+        return None
+
+    types = [t for t, pattern in TYPE_PATTERNS.items() if pattern.search(message)]
+    regions = find_regions(message)
+    global_scope = is_global(message)
+    if global_scope:
+        if regions:
+            return None
+        regions = ["Россия"]
+    # Another place the gazetteer can't resolve would be silently dropped from the answer
+    if not regions or has_unplaced_names(message):
+        return None
+
+    allowed = ANALYZER_REGIONS[source] if source in TELEGRAM_CHANNELS else REGIONS
+    if any(r not in allowed for r in regions):
+        return None
+
+    if ALL_CLEAR_PATTERN.search(message):
+        if types or MD_PATTERN.search(message) or HD_STRONG_PATTERN.search(message):
+            return None
+        status, attack_type = "AC", "ALL"
+    else:
+        if len(types) != 1:
+            return None
+        attack_type = types[0]
+        status = _status(message, attack_type)
+        if status is None or (global_scope and status != "AC"):
+            return None
+
+    classifier_stats.fired += 1
+    return ",".join(f"{status}/{region}/{attack_type}" for region in regions)
+
+def compare_with_llm(rule_result: Optional[str], llm_result: str, message: str):
+    if rule_result is None:
+        return
+    if _triples(rule_result) == _triples(llm_result):
+        classifier_stats.shadow_agree += 1
+    else:
+        classifier_stats.shadow_disagree += 1
+        logger.info(f"[RULES] Shadow mismatch: rules={rule_result!r} llm={llm_result!r} message={message[:120]!r}")
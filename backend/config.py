@@ -1,244 +1,440 @@
-ANALYZER_REGIONS = {
-    "radarrussiia": [
-        "Республика Адыгея",
-        "Республика Алтай",
-        "Республика Башкортостан",
-        "Республика Бурятия",
-        "Республика Дагестан",
-        "Республика Ингушетия",
-        "Кабардино-Балкарская Республика",
-        "Республика Калмыкия",
-        "Карачаево-Черкесская Республика",
-        "Республика Карелия",
-        "Республика Коми",
-        "Республика Крым",
-        "Республика Марий Эл",
-        "Республика Мордовия",
-        "Республика Саха (Якутия)",
-        "Республика Северная Осетия (Алания)",
-        "Республика Татарстан",
-        "Республика Тыва",
-        "Удмуртская Республика",
-        "Республика Хакасия",
-        "Чеченская Республика",
-        "Чувашская Республика",
-        "Алтайский край",
-        "Забайкальский край",
-        "Камчатский край",
-        "Краснодарский край",
-        "Красноярский край",
-        "Пермский край",
-        "Приморский край",
-        "Ставропольский край",
-        "Хабаровский край",
-        "Амурская область",
-        "Архангельская область",
-        "Астраханская область",
-        "Белгородская область",
-        "Брянская область",
-        "Владимирская область",
-        "Волгоградская область",
-        "Вологодская область",
-        "Воронежская область",
-        "Ивановская область",
-        "Иркутская область",
-        "Калининградская область",
-        "Калужская область",
-        "Кемеровская область",
-        "Кировская область",
-        "Костромская область",
-        "Курганская область",
-        "Курская область",
-        "Ленинградская область",
-        "Липецкая область",
-        "Магаданская область",
-        "Мурманская область",
-        "Нижегородская область",
-        "Новгородская область",
-        "Новосибирская область",
-        "Омская область",
-        "Оренбургская область",
-        "Орловская область",
-        "Пензенская область",
-        "Псковская область",
-        "Ростовская область",
-        "Рязанская область",
-        "Самарская область",
-        "Саратовская область",
-        "Сахалинская область",
-        "Свердловская область",
-        "Смоленская область",
-        "Тамбовская область",
-        "Тверская область",
-        "Томская область",
-        "Тульская область",
-        "Тюменская область",
-        "Ульяновская область",
-        "Челябинская область",
-        "Ярославская область",
-        "Санкт-Петербург",
-        "Севастополь",
-        "Еврейская автономная область",
-        "Ненецкий автономный округ",
-        "Ханты-Мансийский автономный округ",
-        "Чукотский автономный округ",
-        "Ямало-Ненецкий автономный округ",
-        "Россия"
-    ],
-    "RDFradar": [
-        "Москва",
-        "Московская область"
-    ],
-    "lpr1_Kherson_alarm": [
-        "Запорожская область",
-        "Херсонская область"
-    ],
-    "lpr1_LDPR_alarm": [
-        "Донецкая Народная Республика",
-        "Луганская Народная Республика"
-    ],
-}
-
-REGIONS = [
-    "Республика Адыгея",
-    "Республика Алтай",
-    "Республика Башкортостан",
-    "Республика Бурятия",
-    "Республика Дагестан",
-    "Республика Ингушетия",
-    "Кабардино-Балкарская Республика",
-    "Республика Калмыкия",
-    "Карачаево-Черкесская Республика",
-    "Республика Карелия",
-    "Республика Коми",
-    "Республика Крым",
-    "Республика Марий Эл",
-    "Республика Мордовия",
-    "Республика Саха (Якутия)",
-    "Республика Северная Осетия (Алания)",
-    "Республика Татарстан",
-    "Республика Тыва",
-    "Удмуртская Республика",
-    "Республика Хакасия",
-    "Чеченская Республика",
-    "Чувашская Республика",
-    "Алтайский край",
-    "Забайкальский край",
-    "Камчатский край",
-    "Краснодарский край",
-    "Красноярский край",
-    "Пермский край",
-    "Приморский край",
-    "Ставропольский край",
-    "Хабаровский край",
-    "Амурская область",
-    "Архангельская область",
-    "Астраханская область",
-    "Белгородская область",
-    "Брянская область",
-    "Владимирская область",
-    "Волгоградская область",
-    "Вологодская область",
-    "Воронежская область",
-    "Ивановская область",
-    "Иркутская область",
-    "Калининградская область",
-    "Калужская область",
-    "Кемеровская область",
-    "Кировская область",
-    "Костромская область",
-    "Курганская область",
-    "Курская область",
-    "Ленинградская область",
-    "Липецкая область",
-    "Магаданская область",
-    "Московская область",
-    "Мурманская область",
-    "Нижегородская область",
-    "Новгородская область",
-    "Новосибирская область",
-    "Омская область",
-    "Оренбургская область",
-    "Орловская область",
-    "Пензенская область",
-    "Псковская область",
-    "Ростовская область",
-    "Рязанская область",
-    "Самарская область",
-    "Саратовская область",
-    "Сахалинская область",
-    "Свердловская область",
-    "Смоленская область",
-    "Тамбовская область",
-    "Тверская область",
-    "Томская область",
-    "Тульская область",
-    "Тюменская область",
-    "Ульяновская область",
-    "Челябинская область",
-    "Ярославская область",
-    "Москва",
-    "Санкт-Петербург",
-    "Севастополь",
-    "Еврейская автономная область",
-    "Ненецкий автономный округ",
-    "Ханты-Мансийский автономный округ",
-    "Чукотский автономный округ",
-    "Ямало-Ненецкий автономный округ",
-    "Запорожская область",
-    "Херсонская область",
-    "Донецкая Народная Республика",
-    "Луганская Народная Республика",
-    "Россия"
-]
-
-TELEGRAM_CHANNELS = [
-    "radarrussiia",
-    "RDFradar",
-    "lpr1_Kherson_alarm",
-    "lpr1_LDPR_alarm"
-]
-
-BANWORDS = [
-    "силами противовоздушной обороны",
-    "движение автотранспорта",
-    "чп москва",
-    "поздравляем",
-    "аэропорт",
-    "спасибо",
-    "собрано",
-    "участие в сборе",
-    "дорогие наши близкие",
-    "отчет",
-    "отчёт",
-    "основной канал",
-    "max",
-    "благодарим",
-    "рэбы и моги",
-    "не реклама",
-    "❤️",
-    "cloudtips",
-    "средства",
-    "наши близкие"
-]
-
-ATTACK_TYPES = ["UAV", "AIR", "ROCKET", "UB", "ALL"]
-EXPANDED_ATTACK_TYPES = ["UAV", "AIR", "ROCKET", "UB"]
-
-UB_ALLOWED_REGIONS = [
-    "Республика Крым",
-    "Севастополь",
-    "Краснодарский край",
-    "Херсонская область",
-    "Запорожская область",
-    "Донецкая Народная Республика",
-    "Ростовская область"
-]
-
-ALL_AC_EXCLUDED_REGIONS = [
-    "Россия",
-    "Херсонская область",
-    "Запорожская область",
-    "Донецкая Народная Республика",
-    "Луганская Народная Республика"
-]
+ANALYZER_REGIONS = {
+    "radarrussiia": [
+        "Республика Адыгея",
+        "Республика Алтай",
+        "Республика Башкортостан",
+        "Республика Бурятия",
+        "Республика Дагестан",
+        "Республика Ингушетия",
+        "Кабардино-Балкарская Республика",
+        "Республика Калмыкия",
+        "Карачаево-Черкесская Республика",
+        "Республика Карелия",
+        "Республика Коми",
+        "Республика Крым",
+        "Республика Марий Эл",
+        "Республика Мордовия",
+        "Республика Саха (Якутия)",
+        "Республика Северная Осетия (Алания)",
+        "Республика Татарстан",
+        "Республика Тыва",
+        "Удмуртская Республика",
+        "Республика Хакасия",
+        "Чеченская Республика",
+        "Чувашская Республика",
+        "Алтайский край",
+        "Забайкальский край",
+        "Камчатский край",
+        "Краснодарский край",
+        "Красноярский край",
+        "Пермский край",
+        "Приморский край",
+        "Ставропольский край",
+        "Хабаровский край",
+        "Амурская область",
+        "Архангельская область",
+        "Астраханская область",
+        "Белгородская область",
+        "Брянская область",
+        "Владимирская область",
+        "Волгоградская область",
+        "Вологодская область",
+        "Воронежская область",
+        "Ивановская область",
+        "Иркутская область",
+        "Калининградская область",
+        "Калужская область",
+        "Кемеровская область",
+        "Кировская область",
+        "Костромская область",
+        "Курганская область",
+        "Курская область",
+        "Ленинградская область",
+        "Липецкая область",
+        "Магаданская область",
+        "Мурманская область",
+        "Нижегородская область",
+        "Новгородская область",
+        "Новосибирская область",
+        "Омская область",
+        "Оренбургская область",
+        "Орловская область",
+        "Пензенская область",
+        "Псковская область",
+        "Ростовская область",
+        "Рязанская область",
+        "Самарская область",
+        "Саратовская область",
+        "Сахалинская область",
+        "Свердловская область",
+        "Смоленская область",
+        "Тамбовская область",
+        "Тверская область",
+        "Томская область",
+        "Тульская область",
+        "Тюменская область",
+        "Ульяновская область",
+        "Челябинская область",
+        "Ярославская область",
+        "Санкт-Петербург",
+        "Севастополь",
+        "Еврейская автономная область",
+        "Ненецкий автономный округ",
+        "Ханты-Мансийский автономный округ",
+        "Чукотский автономный округ",
+        "Ямало-Ненецкий автономный округ",
+        "Россия"
+    ],
+    "RDFradar": [
+        "Москва",
+        "Московская область"
+    ],
+    "lpr1_Kherson_alarm": [
+        "Запорожская область",
+        "Херсонская область"
+    ],
+    "lpr1_LDPR_alarm": [
+        "Донецкая Народная Республика",
+        "Луганская Народная Республика"
+    ],
+}
+
+REGIONS = [
+    "Республика Адыгея",
+    "Республика Алтай",
+    "Республика Башкортостан",
+    "Республика Бурятия",
+    "Республика Дагестан",
+    "Республика Ингушетия",
+    "Кабардино-Балкарская Республика",
+    "Республика Калмыкия",
+    "Карачаево-Черкесская Республика",
+    "Республика Карелия",
+    "Республика Коми",
+    "Республика Крым",
+    "Республика Марий Эл",
+    "Республика Мордовия",
+    "Республика Саха (Якутия)",
+    "Республика Северная Осетия (Алания)",
+    "Республика Татарстан",
+    "Республика Тыва",
+    "Удмуртская Республика",
+    "Республика Хакасия",
+    "Чеченская Республика",
+    "Чувашская Республика",
+    "Алтайский край",
+    "Забайкальский край",
+    "Камчатский край",
+    "Краснодарский край",
+    "Красноярский край",
+    "Пермский край",
+    "Приморский край",
+    "Ставропольский край",
+    "Хабаровский край",
+    "Амурская область",
+    "Архангельская область",
+    "Астраханская область",
+    "Белгородская область",
+    "Брянская область",
+    "Владимирская область",
+    "Волгоградская область",
+    "Вологодская область",
+    "Воронежская область",
+    "Ивановская область",
+    "Иркутская область",
+    "Калининградская область",
+    "Калужская область",
+    "Кемеровская область",
+    "Кировская область",
+    "Костромская область",
+    "Курганская область",
+    "Курская область",
+    "Ленинградская область",
+    "Липецкая область",
+    "Магаданская область",
+    "Московская область",
+    "Мурманская область",
+    "Нижегородская область",
+    "Новгородская область",
+    "Новосибирская область",
+    "Омская область",
+    "Оренбургская область",
+    "Орловская область",
+    "Пензенская область",
+    "Псковская область",
+    "Ростовская область",
+    "Рязанская область",
+    "Самарская область",
+    "Саратовская область",
+    "Сахалинская область",
+    "Свердловская область",
+    "Смоленская область",
+    "Тамбовская область",
+    "Тверская область",
+    "Томская область",
+    "Тульская область",
+    "Тюменская область",
+    "Ульяновская область",
+    "Челябинская область",
+    "Ярославская область",
+    "Москва",
+    "Санкт-Петербург",
+    "Севастополь",
+    "Еврейская автономная область",
+    "Ненецкий автономный округ",
+    "Ханты-Мансийский автономный округ",
+    "Чукотский автономный округ",
+    "Ямало-Ненецкий автономный округ",
+    "Запорожская область",
+    "Херсонская область",
+    "Донецкая Народная Республика",
+    "Луганская Народная Республика",
+    "Россия"
+]
+
+TELEGRAM_CHANNELS = [
+    "radarrussiia",
+    "RDFradar",
+    "lpr1_Kherson_alarm",
+    "lpr1_LDPR_alarm"
+]
+
+BANWORDS = [
+    "силами противовоздушной обороны",
+    "движение автотранспорта",
+    "чп москва",
+    "поздравляем",
+    "аэропорт",
+    "спасибо",
+    "собрано",
+    "участие в сборе",
+    "дорогие наши близкие",
+    "отчет",
+    "отчёт",
+    "основной канал",
+    "max",
+    "благодарим",
+    "рэбы и моги",
+    "не реклама",
+    "❤️",
+    "cloudtips",
+    "средства",
+    "наши близкие"
+]
+
+ATTACK_TYPES = ["UAV", "AIR", "ROCKET", "UB", "ALL"]
+EXPANDED_ATTACK_TYPES = ["UAV", "AIR", "ROCKET", "UB"]
+
+UB_ALLOWED_REGIONS = [
+    "Республика Крым",
+    "Севастополь",
+    "Краснодарский край",
+    "Херсонская область",
+    "Запорожская область",
+    "Донецкая Народная Республика",
+    "Ростовская область"
+]
+
+ALL_AC_EXCLUDED_REGIONS = [
+    "Россия",
+    "Херсонская область",
+    "Запорожская область",
+    "Донецкая Народная Республика",
+    "Луганская Народная Республика"
+]
+
+CITY_REGIONS = {
+    "Майкоп": "Республика Адыгея",
+    "Горно-Алтайск": "Республика Алтай",
+    "Уфа": "Республика Башкортостан",
+    "Стерлитамак": "Республика Башкортостан",
+    "Салават": "Республика Башкортостан",
+    "Улан-Удэ": "Республика Бурятия",
+    "Махачкала": "Республика Дагестан",
+    "Дербент": "Республика Дагестан",
+    "Каспийск": "Республика Дагестан",
+    "Магас": "Республика Ингушетия",
+    "Назрань": "Республика Ингушетия",
+    "Нальчик": "Кабардино-Балкарская Республика",
+    "Элиста": "Республика Калмыкия",
+    "Черкесск": "Карачаево-Черкесская Республика",
+    "Петрозаводск": "Республика Карелия",
+    "Сыктывкар": "Республика Коми",
+    "Ухта": "Республика Коми",
+    "Симферополь": "Республика Крым",
+    "Керчь": "Республика Крым",
+    "Феодосия": "Республика Крым",
+    "Евпатория": "Республика Крым",
+    "Джанкой": "Республика Крым",
+    "Ялта": "Республика Крым",
+    "Саки": "Республика Крым",
+    "Армянск": "Республика Крым",
+    "Йошкар-Ола": "Республика Марий Эл",
+    "Саранск": "Республика Мордовия",
+    "Якутск": "Республика Саха (Якутия)",
+    "Владикавказ": "Республика Северная Осетия (Алания)",
+    "Моздок": "Республика Северная Осетия (Алания)",
+    "Казань": "Республика Татарстан",
+    "Набережные Челны": "Республика Татарстан",
+    "Елабуга": "Республика Татарстан",
+    "Нижнекамск": "Республика Татарстан",
+    "Альметьевск": "Республика Татарстан",
+    "Кызыл": "Республика Тыва",
+    "Ижевск": "Удмуртская Республика",
+    "Сарапул": "Удмуртская Республика",
+    "Абакан": "Республика Хакасия",
+    "Грозный": "Чеченская Республика",
+    "Чебоксары": "Чувашская Республика",
+    "Новочебоксарск": "Чувашская Республика",
+    "Барнаул": "Алтайский край",
+    "Чита": "Забайкальский край",
+    "Петропавловск-Камчатский": "Камчатский край",
+    "Краснодар": "Краснодарский край",
+    "Новороссийск": "Краснодарский край",
+    "Сочи": "Краснодарский край",
+    "Туапсе": "Краснодарский край",
+    "Анапа": "Краснодарский край",
+    "Геленджик": "Краснодарский край",
+    "Ейск": "Краснодарский край",
+    "Армавир": "Краснодарский край",
+    "Темрюк": "Краснодарский край",
+    "Тамань": "Краснодарский край",
+    "Тихорецк": "Краснодарский край",
+    "Кропоткин": "Краснодарский край",
+    "Приморско-Ахтарск": "Краснодарский край",
+    "Славянск-на-Кубани": "Краснодарский край",
+    "Красноярск": "Красноярский край",
+    "Пермь": "Пермский край",
+    "Владивосток": "Приморский край",
+    "Ставрополь": "Ставропольский край",
+    "Пятигорск": "Ставропольский край",
+    "Невинномысск": "Ставропольский край",
+    "Хабаровск": "Хабаровский край",
+    "Благовещенск": "Амурская область",
+    "Архангельск": "Архангельская область",
+    "Северодвинск": "Архангельская область",
+    "Астрахань": "Астраханская область",
+    "Белгород": "Белгородская область",
+    "Шебекино": "Белгородская область",
+    "Грайворон": "Белгородская область",
+    "Валуйки": "Белгородская область",
+    "Губкин": "Белгородская область",
+    "Старый Оскол": "Белгородская область",
+    "Брянск": "Брянская область",
+    "Клинцы": "Брянская область",
+    "Новозыбков": "Брянская область",
+    "Климово": "Брянская область",
+    "Севск": "Брянская область",
+    "Трубчевск": "Брянская область",
+    "Владимир": "Владимирская область",
+    "Волгоград": "Волгоградская область",
+    "Камышин": "Волгоградская область",
+    "Вологда": "Вологодская область",
+    "Череповец": "Вологодская область",
+    "Воронеж": "Воронежская область",
+    "Борисоглебск": "Воронежская область",
+    "Россошь": "Воронежская область",
+    "Иваново": "Ивановская область",
+    "Иркутск": "Иркутская область",
+    "Калининград": "Калининградская область",
+    "Калуга": "Калужская область",
+    "Обнинск": "Калужская область",
+    "Кемерово": "Кемеровская область",
+    "Новокузнецк": "Кемеровская область",
+    "Киров": "Кировская область",
+    "Кострома": "Костромская область",
+    "Курган": "Курганская область",
+    "Курск": "Курская область",
+    "Рыльск": "Курская область",
+    "Суджа": "Курская область",
+    "Льгов": "Курская область",
+    "Курчатов": "Курская область",
+    "Глушково": "Курская область",
+    "Гатчина": "Ленинградская область",
+    "Кириши": "Ленинградская область",
+    "Усть-Луга": "Ленинградская область",
+    "Приморск": "Ленинградская область",
+    "Липецк": "Липецкая область",
+    "Елец": "Липецкая область",
+    "Магадан": "Магаданская область",
+    "Подольск": "Московская область",
+    "Коломна": "Московская область",
+    "Серпухов": "Московская область",
+    "Домодедово": "Московская область",
+    "Раменское": "Московская область",
+    "Мурманск": "Мурманская область",
+    "Оленегорск": "Мурманская область",
+    "Нижний Новгород": "Нижегородская область",
+    "Кстово": "Нижегородская область",
+    "Дзержинск": "Нижегородская область",
+    "Арзамас": "Нижегородская область",
+    "Великий Новгород": "Новгородская область",
+    "Новосибирск": "Новосибирская область",
+    "Омск": "Омская область",
+    "Оренбург": "Оренбургская область",
+    "Орск": "Оренбургская область",
+    "Орёл": "Орловская область",
+    "Ливны": "Орловская область",
+    "Пенза": "Пензенская область",
+    "Псков": "Псковская область",
+    "Ростов-на-Дону": "Ростовская область",
+    "Таганрог": "Ростовская область",
+    "Новошахтинск": "Ростовская область",
+    "Шахты": "Ростовская область",
+    "Миллерово": "Ростовская область",
+    "Каменск-Шахтинский": "Ростовская область",
+    "Азов": "Ростовская область",
+    "Новочеркасск": "Ростовская область",
+    "Рязань": "Рязанская область",
+    "Ряжск": "Рязанская область",
+    "Самара": "Самарская область",
+    "Тольятти": "Самарская область",
+    "Сызрань": "Самарская область",
+    "Саратов": "Саратовская область",
+    "Энгельс": "Саратовская область",
+    "Южно-Сахалинск": "Сахалинская область",
+    "Екатеринбург": "Свердловская область",
+    "Смоленск": "Смоленская область",
+    "Вязьма": "Смоленская область",
+    "Тамбов": "Тамбовская область",
+    "Мичуринск": "Тамбовская область",
+    "Тверь": "Тверская область",
+    "Ржев": "Тверская область",
+    "Торжок": "Тверская область",
+    "Томск": "Томская область",
+    "Тула": "Тульская область",
+    "Новомосковск": "Тульская область",
+    "Узловая": "Тульская область",
+    "Тюмень": "Тюменская область",
+    "Ульяновск": "Ульяновская область",
+    "Челябинск": "Челябинская область",
+    "Магнитогорск": "Челябинская область",
+    "Ярославль": "Ярославская область",
+    "Рыбинск": "Ярославская область",
+    "Биробиджан": "Еврейская автономная область",
+    "Нарьян-Мар": "Ненецкий автономный округ",
+    "Ханты-Мансийск": "Ханты-Мансийский автономный округ",
+    "Сургут": "Ханты-Мансийский автономный округ",
+    "Анадырь": "Чукотский автономный округ",
+    "Салехард": "Ямало-Ненецкий автономный округ",
+    "Новый Уренгой": "Ямало-Ненецкий автономный округ",
+    "Мелитополь": "Запорожская область",
+    "Бердянск": "Запорожская область",
+    "Энергодар": "Запорожская область",
+    "Токмак": "Запорожская область",
+    "Геническ": "Херсонская область",
+    "Скадовск": "Херсонская область",
+    "Новая Каховка": "Херсонская область",
+    "Каховка": "Херсонская область",
+    "Алешки": "Херсонская область",
+    "Донецк": "Донецкая Народная Республика",
+    "Макеевка": "Донецкая Народная Республика",
+    "Горловка": "Донецкая Народная Республика",
+    "Мариуполь": "Донецкая Народная Республика",
+    "Енакиево": "Донецкая Народная Республика",
+    "Луганск": "Луганская Народная Республика",
+    "Алчевск": "Луганская Народная Республика",
+    "Северодонецк": "Луганская Народная Республика",
+    "Лисичанск": "Луганская Народная Республика",
+    "Стаханов": "Луганская Народная Республика",
+}
@@ -1,261 +1,648 @@
-import asyncio
-import os
-from datetime import datetime
-import pytz
-from telegram import Bot
-import asyncpg
-from logger import logger
-from dotenv import load_dotenv
-from config import EXPANDED_ATTACK_TYPES, REGIONS
-
-load_dotenv()
-
-DB_CONFIG = {
-    "user": os.getenv("DB_USER", "postgres"),
-    "password": os.getenv("DB_PASSWORD", 1234),
-    "database": os.getenv("DB_NAME", "attacks"),
-    "host": os.getenv("DB_HOST", "localhost"),
-    "port": int(os.getenv("DB_PORT", 5432)),
-}
-
-BOT_TOKEN = os.getenv("BOT_TOKEN")
-bot = Bot(token=BOT_TOKEN)
-
-_pool_main: asyncpg.Pool | None = None
-_pool_bot: asyncpg.Pool | None = None
-_schema_initialized = False
-_schema_lock = asyncio.Lock()
-
-async def _init_schema(pool: asyncpg.Pool):
-    global _schema_initialized
-    async with pool.acquire() as conn:
-        await conn.execute("""
-        CREATE TABLE IF NOT EXISTS attacks (
-            id SERIAL PRIMARY KEY,
-            region TEXT,
-            attack_type TEXT,
-            status TEXT,
-            source TEXT,
-            timestamp TEXT
-        );
-        """)
-
-        await conn.execute("""
-        CREATE OR REPLACE FUNCTION notify_attack_change()
-        RETURNS trigger AS $$
-        BEGIN
-            PERFORM pg_notify('attack_updates', row_to_json(NEW)::text);
-            RETURN NEW;
-        END;
-        $$ LANGUAGE plpgsql;
-        """)
-
-        await conn.execute("""
-        DO $$
-        BEGIN
-            IF NOT EXISTS (
-                SELECT 1 FROM pg_trigger WHERE tgname = 'attack_insert_trigger'
-            ) THEN
-                CREATE TRIGGER attack_insert_trigger
-                AFTER INSERT ON attacks
-                FOR EACH ROW
-                EXECUTE FUNCTION notify_attack_change();
-            END IF;
-        END;
-        $$;
-        """)
-
-        await conn.execute("""
-        CREATE INDEX IF NOT EXISTS idx_region_attack_type
-        ON attacks(region, attack_type);
-        """)
-
-        await conn.execute("""
-        CREATE TABLE IF NOT EXISTS subscriptions (
-            id SERIAL PRIMARY KEY,
-            user_id BIGINT,
-            region TEXT,
-            is_banned BOOLEAN DEFAULT FALSE,
-            UNIQUE(user_id, region)
-        );
-        """)
-    _schema_initialized = True
-    logger.info("[DB] PostgreSQL initialization finished")
-
-async def get_pool(is_bot: bool = False) -> asyncpg.Pool:
-    global _pool_main, _pool_bot, _schema_initialized
-
-    if is_bot:
-        if _pool_bot is None:
-            _pool_bot = await asyncpg.create_pool(
-                **DB_CONFIG,
-                max_inactive_connection_lifetime=30,
-                loop=asyncio.get_running_loop()
-            )
-            logger.info("[DB] Connection pool created for BOT thread")
-        return _pool_bot
-    else:
-        if _pool_main is None:
-            _pool_main = await asyncpg.create_pool(
-                **DB_CONFIG,
-                max_inactive_connection_lifetime=30,
-                loop=asyncio.get_running_loop()
-            )
-            logger.info("[DB] Connection pool created for MAIN thread")
-        if not _schema_initialized:
-            async with _schema_lock:
-                if not _schema_initialized:
-                    await _init_schema(_pool_main)
-        return _pool_main
-
-async def save_attack(region: str, attack_type: str, status: str, source: str = "manual", use_logger: bool = True, is_bot: bool = False):
-    pool = await get_pool(is_bot=is_bot)
-    timestamp = datetime.now(pytz.timezone("Europe/Moscow")).strftime("%H:%M:%S %d-%m-%Y")
-    if region not in REGIONS or attack_type not in EXPANDED_ATTACK_TYPES:
-        return
-    async with pool.acquire() as conn:
-        await conn.execute(
-            "INSERT INTO attacks (region, attack_type, status, source, timestamp) VALUES ($1, $2, $3, $4, $5)",
-            region, attack_type, status, source, timestamp
-        )
-    if use_logger:
-        logger.info(f"[DB] Attack saved: {region} {attack_type} = {status} (source: {source})")
-
-async def get_attacks_by_region(region: str, limit: int = 5, use_logger: bool = True, is_bot: bool = False):
-    pool = await get_pool(is_bot=is_bot)
-    async with pool.acquire() as conn:
-        rows = await conn.fetch(
-            "SELECT attack_type, status, source, timestamp FROM attacks WHERE region=$1 ORDER BY id DESC LIMIT $2",
-            region, limit
-        )
-    if use_logger:
-        logger.info(f"[DB] Received last {len(rows)} attacks for {region}")
-    return [tuple(row) for row in rows]
-
-async def get_last_status(region: str, attack_type: str = None, use_logger: bool = True, is_bot: bool = False):
-    pool = await get_pool(is_bot=is_bot)
-    async with pool.acquire() as conn:
-        if attack_type:
-            row = await conn.fetchrow(
-                "SELECT status FROM attacks WHERE region=$1 AND attack_type=$2 ORDER BY id DESC LIMIT 1",
-                region, attack_type
-            )
-        else:
-            rows = await conn.fetch(
-                """
-                SELECT attack_type, status
-                FROM (
-                    SELECT DISTINCT ON (attack_type) attack_type, status, id
-                    FROM attacks
-                    WHERE region = $1
-                    ORDER BY attack_type, id DESC
-                ) x
-                """,
-                region
-            )
-            result = {}
-            for r in rows:
-                result[r["attack_type"]] = r["status"]
-
-            return {
-                "region": region,
-                "statuses": result,
-            }
-    if use_logger:
-        logger.debug(f"[DB] Last status {attack_type} for {region}: {row['status'] if row else 'no data'}")
-    return row['status'] if row else None
-
-async def add_subscription(user_id: int, region: str, use_logger: bool = True, is_bot: bool = False) -> bool:
-    pool = await get_pool(is_bot=is_bot)
-    if region not in REGIONS:
-        return
-    async with pool.acquire() as conn:
-        result = await conn.execute(
-            "INSERT INTO subscriptions (user_id, region) VALUES ($1, $2) ON CONFLICT DO NOTHING",
-            user_id, region
-        )
-    added = result == "INSERT 0 1"
-    if use_logger:
-        if added:
-            logger.info(f"[DB] User {user_id} subscribed to {region}")
-        else:
-            logger.info(f"[DB] User {user_id} is already subscribed to {region}")
-    return added
-
-async def remove_subscription(user_id: int, region: str, use_logger: bool = True, is_bot: bool = False) -> bool:
-    pool = await get_pool(is_bot=is_bot)
-    async with pool.acquire() as conn:
-        await conn.execute("DELETE FROM subscriptions WHERE user_id=$1 AND region=$2", user_id, region)
-    if use_logger:
-        logger.info(f"[DB] User {user_id} unsubscribed from {region}")
-    return True
-
-async def get_subscriptions(user_id: int, use_logger: bool = True, is_bot: bool = False):
-    pool = await get_pool(is_bot=is_bot)
-    async with pool.acquire() as conn:
-        rows = await conn.fetch("SELECT region FROM subscriptions WHERE user_id=$1", user_id)
-    subscriptions = [r["region"] for r in rows]
-    if use_logger:
-        logger.info(f"User {user_id} has {len(subscriptions)} subscriptions")
-    return subscriptions
-
-async def get_users_by_region(region: str, use_logger: bool = True, is_bot: bool = False):
-    pool = await get_pool(is_bot=is_bot)
-    async with pool.acquire() as conn:
-        rows = await conn.fetch("SELECT user_id FROM subscriptions WHERE region=$1", region)
-    users = [r["user_id"] for r in rows]
-    if use_logger:
-        logger.info(f"[DB] Found {len(users)} subscribers in {region}")
-    return users
-
-async def get_all_users(use_logger: bool = True, is_bot: bool = False):
-    pool = await get_pool(is_bot=is_bot)
-    async with pool.acquire() as conn:
-        rows = await conn.fetch("SELECT DISTINCT user_id FROM subscriptions")
-    users = [r["user_id"] for r in rows]
-    if use_logger:
-        logger.info(f"[DB] Found {len(users)} total subscribers")
-    return users
-
-async def is_banned(user_id: int, use_logger: bool = True, is_bot: bool = False) -> bool:
-    pool = await get_pool(is_bot=is_bot)
-    async with pool.acquire() as conn:
-        row = await conn.fetchrow(
-            "SELECT 1 FROM subscriptions WHERE user_id=$1 AND is_banned=TRUE LIMIT 1", user_id
-        )
-    banned = row is not None
-    if use_logger:
-        logger.info(f"[DB] User {user_id} is {'banned' if banned else 'not banned'}")
-    return banned
-
-async def ban_user(user_id: int, reason: str = "<не указано>", use_logger: bool = True, is_bot: bool = False):
-    if not await is_banned(user_id=user_id, use_logger=False, is_bot=is_bot):
-        pool = await get_pool(is_bot=is_bot)
-        async with pool.acquire() as conn:
-            exist = await conn.fetchrow("SELECT 1 FROM subscriptions WHERE user_id=$1 LIMIT 1", user_id) is not None
-            if exist: await conn.execute("UPDATE subscriptions SET is_banned=TRUE WHERE user_id=$1", user_id)
-            else: await conn.execute("INSERT INTO subscriptions (user_id, is_banned) VALUES ($1, TRUE)", user_id)
-        if use_logger:
-            logger.info(f"[DB] User {user_id} banned. Reason: {reason}")
-        try:
-            await bot.send_message(chat_id=user_id, text=f"⚠️ Вы заблокированы администратором. Причина: {reason}")
-        except Exception:
-            logger.error(f"[TG/DB] Error sending to user {user_id}", exc_info=True)
-    else:
-        if use_logger:
-            logger.info(f"[DB] User {user_id} is already banned")
-
-async def unban_user(user_id: int, reason: str = "<не указано>", use_logger: bool = True, is_bot: bool = False):
-    if await is_banned(user_id=user_id, use_logger=False, is_bot=is_bot):
-        pool = await get_pool(is_bot=is_bot)
-        async with pool.acquire() as conn:
-            await conn.execute("UPDATE subscriptions SET is_banned=FALSE WHERE user_id=$1", user_id)
-        if use_logger:
-            logger.info(f"[DB] User {user_id} unbanned. Reason: {reason}")
-        try:
-            await bot.send_message(chat_id=user_id, text=f"⚠️ Вы разблокированы администратором. Причина: {reason}")
-        except Exception:
-            logger.error(f"[TG/DB] Error sending to user {user_id}", exc_info=True)
-    else:
-        if use_logger:
-            logger.info(f"[DB] User {user_id} is not banned")
+import asyncio
+from datetime import datetime
+import os
+import time
+from telegram import Bot
+import asyncpg
+from logger import logger
+from dotenv import load_dotenv
+from config import EXPANDED_ATTACK_TYPES, REGIONS
+from migrations import run_migrations
+
+load_dotenv()
+
+DB_CONFIG = {
+    "user": os.getenv("DB_USER", "postgres"),
+    "password": os.getenv("DB_PASSWORD", 1234),
+    "database": os.getenv("DB_NAME", "attacks"),
+    "host": os.getenv("DB_HOST", "localhost"),
+    "port": int(os.getenv("DB_PORT", 5432)),
+}
+
+BOT_TOKEN = os.getenv("BOT_TOKEN")
+bot = Bot(token=BOT_TOKEN)
+
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", 2))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", 10))
+DB_SLOW_STATEMENT_MS = float(os.getenv("DB_SLOW_STATEMENT_MS", 500))
+DB_STATEMENT_STATS = 10
+
+class PoolMetrics:
+    def __init__(self):
+        self.acquires = 0
+        self.acquire_wait = 0.0
+        self.acquire_wait_max = 0.0
+        self.in_use = 0
+        self.in_use_peak = 0
+        self.slow_statements = 0
+        # Normalized statement text -> [calls, errors, total seconds, max seconds]
+        self.statements: dict[str, list] = {}
+
+    def acquired(self, wait: float):
+        self.acquires += 1
+        self.acquire_wait += wait
+        self.acquire_wait_max = max(self.acquire_wait_max, wait)
+        self.in_use += 1
+        self.in_use_peak = max(self.in_use_peak, self.in_use)
+
+    def released(self):
+        self.in_use -= 1
+
+    def record_query(self, record):
+        # Query logger callback (asyncpg LoggedQuery), installed on every pool connection
+        statement = " ".join(record.query.split())
+        stat = self.statements.setdefault(statement, [0, 0, 0.0, 0.0])
+        stat[0] += 1
+        stat[1] += record.exception is not None
+        stat[2] += record.elapsed
+        stat[3] = max(stat[3], record.elapsed)
+        if record.elapsed * 1000 >= DB_SLOW_STATEMENT_MS:
+            self.slow_statements += 1
+            logger.warning(f"[DB] Slow statement ({record.elapsed * 1000:.0f} ms): {statement[:200]}")
+
+    def stats(self, pool: asyncpg.Pool | None) -> dict:
+        top = sorted(self.statements.items(), key=lambda item: item[1][2], reverse=True)[:DB_STATEMENT_STATS]
+        return {
+            "size": pool.get_size() if pool else 0,
+            "idle": pool.get_idle_size() if pool else 0,
+            "min_size": DB_POOL_MIN,
+            "max_size": DB_POOL_MAX,
+            "in_use": self.in_use,
+            "in_use_peak": self.in_use_peak,
+            "acquires": self.acquires,
+            "acquire_wait_avg_ms": round(self.acquire_wait / self.acquires * 1000, 2) if self.acquires else 0.0,
+            "acquire_wait_max_ms": round(self.acquire_wait_max * 1000, 2),
+            "slow_statements": self.slow_statements,
+            "statements": [
+                {
+                    "statement": statement[:200],
+                    "calls": calls,
+                    "errors": errors,
+                    "total_ms": round(total * 1000, 1),
+                    "avg_ms": round(total / calls * 1000, 2),
+                    "max_ms": round(longest * 1000, 2),
+                }
+                for statement, (calls, errors, total, longest) in top
+            ],
+        }
+
+class _PoolAcquire:
+    # Supports both "async with pool.acquire() as conn" and "conn = await pool.acquire()"
+    def __init__(self, pool: "InstrumentedPool", timeout: float | None):
+        self.pool = pool
+        self.timeout = timeout
+        self.conn = None
+
+    def __await__(self):
+        return self.pool._acquire(self.timeout).__await__()
+
+    async def __aenter__(self) -> asyncpg.Connection:
+        self.conn = await self.pool._acquire(self.timeout)
+        return self.conn
+
+    async def __aexit__(self, *exc):
+        await self.pool.release(self.conn)
+
+class InstrumentedPool:
+    # asyncpg.Pool that measures how long callers wait for a connection and how many are checked out
+    def __init__(self, pool: asyncpg.Pool, metrics: PoolMetrics):
+        self.pool = pool
+        self.metrics = metrics
+
+    def acquire(self, timeout: float | None = None) -> _PoolAcquire:
+        return _PoolAcquire(self, timeout)
+
+    async def _acquire(self, timeout: float | None) -> asyncpg.Connection:
+        started = time.perf_counter()
+        conn = await self.pool.acquire(timeout=timeout)
+        self.metrics.acquired(time.perf_counter() - started)
+        return conn
+
+    async def release(self, conn: asyncpg.Connection):
+        try:
+            await self.pool.release(conn)
+        finally:
+            self.metrics.released()
+
+    def __getattr__(self, name):
+        return getattr(self.pool, name)
+
+pool_metrics = PoolMetrics()
+_pool: InstrumentedPool | None = None
+_pool_lock = asyncio.Lock()
+
+async def _init_connection(conn: asyncpg.Connection):
+    conn.add_query_logger(pool_metrics.record_query)
+
+async def _init_schema(pool: asyncpg.Pool):
+    async with pool.acquire() as conn:
+        await run_migrations(conn)
+    logger.info("[DB] PostgreSQL initialization finished")
+
+async def get_pool() -> InstrumentedPool:
+    # One pool for the API, the listener and the bot, which all run on the same event loop
+    global _pool
+    if _pool is None:
+        async with _pool_lock:
+            if _pool is None:
+                pool = await asyncpg.create_pool(
+                    **DB_CONFIG,
+                    min_size=DB_POOL_MIN,
+                    max_size=DB_POOL_MAX,
+                    max_inactive_connection_lifetime=30,
+                    init=_init_connection,
+                )
+                logger.info(f"[DB] Connection pool created ({DB_POOL_MIN}-{DB_POOL_MAX} connections)")
+                await _init_schema(pool)
+                _pool = InstrumentedPool(pool, pool_metrics)
+    return _pool
+
+def get_pool_stats() -> dict:
+    return pool_metrics.stats(_pool.pool if _pool else None)
+
+async def save_attack(region: str, attack_type: str, status: str, source: str = "manual", use_logger: bool = True) -> int | None:
+    pool = await get_pool()
+    if region not in REGIONS or attack_type not in EXPANDED_ATTACK_TYPES:
+        return None
+    async with pool.acquire() as conn:
+        attack_id = await conn.fetchval(
+            "INSERT INTO attacks (region, attack_type, status, source) VALUES ($1, $2, $3, $4) RETURNING id",
+            region, attack_type, status, source
+        )
+    if use_logger:
+        logger.info(f"[DB] Attack saved: {region} {attack_type} = {status} (source: {source})")
+    return attack_id
+
+async def save_attacks_bulk(
+    updates: list[tuple[str, str, str]],
+    source: str = "manual",
+    use_logger: bool = True,
+) -> list[tuple[str, str, str, int]]:
+    # The last update for a (region, attack_type) pair wins, as if they were applied one by one
+    updates = list({(r, at): (r, at, st) for r, at, st in updates if r in REGIONS and at in EXPANDED_ATTACK_TYPES}.values())
+    if not updates:
+        return []
+    pool = await get_pool()
+    regions, attack_types, statuses = (list(col) for col in zip(*updates))
+    async with pool.acquire() as conn:
+        # Diff against current_status for every pair and insert only the changed ones, in one round-trip
+        rows = await conn.fetch(
+            """
+            INSERT INTO attacks (region, attack_type, status, source)
+            SELECT i.region, i.attack_type, i.status, $4
+            FROM unnest($1::text[], $2::text[], $3::text[]) AS i(region, attack_type, status)
+            LEFT JOIN current_status cs ON cs.region = i.region AND cs.attack_type = i.attack_type
+            WHERE cs.status IS DISTINCT FROM i.status
+            RETURNING region, attack_type, status, id
+            """,
+            regions, attack_types, statuses, source
+        )
+    changed = [tuple(r) for r in rows]
+    if use_logger:
+        logger.info(f"[DB] Bulk update: {len(changed)}/{len(updates)} attacks changed (source: {source})")
+    return changed
+
+async def get_current_statuses(use_logger: bool = True) -> list[tuple[str, str, str, int]]:
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        rows = await conn.fetch("SELECT region, attack_type, status, attack_id FROM current_status")
+    if use_logger:
+        logger.info(f"[DB] Loaded {len(rows)} current statuses")
+    return [tuple(r) for r in rows]
+
+async def get_attacks_by_region(region: str, limit: int = 5, use_logger: bool = True):
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        rows = await conn.fetch(
+            "SELECT attack_type, status, source, timestamp FROM attacks WHERE region=$1 ORDER BY id DESC LIMIT $2",
+            region, limit
+        )
+    if use_logger:
+        logger.info(f"[DB] Received last {len(rows)} attacks for {region}")
+    return [tuple(row) for row in rows]
+
+async def get_last_status(region: str, attack_type: str = None, use_logger: bool = True):
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        if attack_type:
+            row = await conn.fetchrow(
+                "SELECT status FROM current_status WHERE region=$1 AND attack_type=$2",
+                region, attack_type
+            )
+        else:
+            rows = await conn.fetch(
+                "SELECT attack_type, status FROM current_status WHERE region = $1",
+                region
+            )
+            result = {}
+            for r in rows:
+                result[r["attack_type"]] = r["status"]
+
+            return {
+                "region": region,
+                "statuses": result,
+            }
+    if use_logger:
+        logger.debug(f"[DB] Last status {attack_type} for {region}: {row['status'] if row else 'no data'}")
+    return row['status'] if row else None
+
+async def add_subscription(user_id: int, region: str, use_logger: bool = True) -> bool:
+    pool = await get_pool()
+    if region not in REGIONS:
+        return
+    async with pool.acquire() as conn:
+        result = await conn.execute(
+            "INSERT INTO subscriptions (user_id, region) VALUES ($1, $2) ON CONFLICT DO NOTHING",
+            user_id, region
+        )
+    added = result == "INSERT 0 1"
+    if use_logger:
+        if added:
+            logger.info(f"[DB] User {user_id} subscribed to {region}")
+        else:
+            logger.info(f"[DB] User {user_id} is already subscribed to {region}")
+    return added
+
+async def remove_subscription(user_id: int, region: str, use_logger: bool = True) -> bool:
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        await conn.execute("DELETE FROM subscriptions WHERE user_id=$1 AND region=$2", user_id, region)
+    if use_logger:
+        logger.info(f"[DB] User {user_id} unsubscribed from {region}")
+    return True
+
+async def add_subscriptions(user_id: int, regions: list[str], use_logger: bool = True) -> list[str]:
+    regions = [region for region in dict.fromkeys(regions) if region in REGIONS]
+    if not regions:
+        return []
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        rows = await conn.fetch(
+            """
+            INSERT INTO subscriptions (user_id, region)
+            SELECT $1, region FROM unnest($2::text[]) AS region
+            ON CONFLICT DO NOTHING
+            RETURNING region
+            """,
+            user_id, regions
+        )
+    added = [r["region"] for r in rows]
+    if use_logger:
+        logger.info(f"[DB] User {user_id} subscribed to {len(added)}/{len(regions)} regions")
+    return added
+
+async def remove_subscriptions(user_id: int, regions: list[str], use_logger: bool = True) -> list[str]:
+    if not regions:
+        return []
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        rows = await conn.fetch(
+            "DELETE FROM subscriptions WHERE user_id=$1 AND region = ANY($2::text[]) RETURNING region",
+            user_id, list(regions)
+        )
+    removed = [r["region"] for r in rows]
+    if use_logger:
+        logger.info(f"[DB] User {user_id} unsubscribed from {len(removed)} regions")
+    return removed
+
+async def get_subscriptions(user_id: int, use_logger: bool = True):
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        rows = await conn.fetch("SELECT region FROM subscriptions WHERE user_id=$1", user_id)
+    subscriptions = [r["region"] for r in rows]
+    if use_logger:
+        logger.info(f"User {user_id} has {len(subscriptions)} subscriptions")
+    return subscriptions
+
+async def get_users_by_region(region: str, use_logger: bool = True):
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        rows = await conn.fetch("SELECT user_id FROM subscriptions WHERE region=$1", region)
+    users = [r["user_id"] for r in rows]
+    if use_logger:
+        logger.info(f"[DB] Found {len(users)} subscribers in {region}")
+    return users
+
+async def get_users_by_regions(regions: list[str], use_logger: bool = True) -> dict[str, list[int]]:
+    if not regions:
+        return {}
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        rows = await conn.fetch(
+            "SELECT region, array_agg(user_id) AS users FROM subscriptions WHERE region = ANY($1::text[]) GROUP BY region",
+            list(regions)
+        )
+    users = {r["region"]: list(r["users"]) for r in rows}
+    if use_logger:
+        logger.info(f"[DB] Found subscribers in {len(users)}/{len(regions)} regions")
+    return users
+
+async def get_all_subscribers(use_logger: bool = True) -> dict[str, list[int]]:
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        rows = await conn.fetch(
+            "SELECT region, array_agg(user_id) AS users FROM subscriptions WHERE region IS NOT NULL GROUP BY region"
+        )
+    users = {r["region"]: list(r["users"]) for r in rows}
+    if use_logger:
+        logger.info(f"[DB] Loaded subscribers of {len(users)} regions")
+    return users
+
+async def get_all_users(use_logger: bool = True):
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        rows = await conn.fetch("SELECT DISTINCT user_id FROM subscriptions")
+    users = [r["user_id"] for r in rows]
+    if use_logger:
+        logger.info(f"[DB] Found {len(users)} total subscribers")
+    return users
+
+async def is_banned(user_id: int, use_logger: bool = True) -> bool:
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        row = await conn.fetchrow(
+            "SELECT 1 FROM subscriptions WHERE user_id=$1 AND is_banned=TRUE LIMIT 1", user_id
+        )
+    banned = row is not None
+    if use_logger:
+        logger.info(f"[DB] User {user_id} is {'banned' if banned else 'not banned'}")
+    return banned
+
+async def ban_user(user_id: int, reason: str = "<не указано>", use_logger: bool = True):
+    if not await is_banned(user_id=user_id, use_logger=False):
+        pool = await get_pool()
+        async with pool.acquire() as conn:
+            exist = await conn.fetchrow("SELECT 1 FROM subscriptions WHERE user_id=$1 LIMIT 1", user_id) is not None
+            if exist: await conn.execute("UPDATE subscriptions SET is_banned=TRUE WHERE user_id=$1", user_id)
+            else: await conn.execute("INSERT INTO subscriptions (user_id, is_banned) VALUES ($1, TRUE)", user_id)
+        if use_logger:
+            logger.info(f"[DB] User {user_id} banned. Reason: {reason}")
+        try:
+            await bot.send_message(chat_id=user_id, text=f"⚠️ Вы заблокированы администратором. Причина: {reason}")
+        except Exception:
+            logger.error(f"[TG/DB] Error sending to user {user_id}", exc_info=True)
+    else:
+        if use_logger:
+            logger.info(f"[DB] User {user_id} is already banned")
+
+async def unban_user(user_id: int, reason: str = "<не указано>", use_logger: bool = True):
+    if await is_banned(user_id=user_id, use_logger=False):
+        pool = await get_pool()
+        async with pool.acquire() as conn:
+            await conn.execute("UPDATE subscriptions SET is_banned=FALSE WHERE user_id=$1", user_id)
+        if use_logger:
+            logger.info(f"[DB] User {user_id} unbanned. Reason: {reason}")
+        try:
+            await bot.send_message(chat_id=user_id, text=f"⚠️ Вы разблокированы администратором. Причина: {reason}")
+        except Exception:
+            logger.error(f"[TG/DB] Error sending to user {user_id}", exc_info=True)
+    else:
+        if use_logger:
+            logger.info(f"[DB] User {user_id} is not banned")
+
+async def get_watermarks(channels: list[str] | None = None, use_logger: bool = True) -> dict[str, dict]:
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        if channels is None:
+            rows = await conn.fetch("SELECT channel, post_id, content_hash, fetched_at FROM listener_watermarks")
+        else:
+            rows = await conn.fetch(
+                "SELECT channel, post_id, content_hash, fetched_at FROM listener_watermarks WHERE channel = ANY($1::text[])",
+                channels
+            )
+    watermarks = {r["channel"]: {"post_id": r["post_id"], "content_hash": r["content_hash"], "fetched_at": r["fetched_at"]} for r in rows}
+    if use_logger:
+        logger.info(f"[DB] Loaded {len(watermarks)} listener watermarks")
+    return watermarks
+
+async def save_watermarks(watermarks: dict[str, dict], use_logger: bool = True):
+    if not watermarks:
+        return
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        await conn.executemany(
+            """
+            INSERT INTO listener_watermarks (channel, post_id, content_hash, fetched_at)
+            VALUES ($1, $2, $3, $4)
+            ON CONFLICT (channel) DO UPDATE
+            SET post_id = GREATEST(listener_watermarks.post_id, EXCLUDED.post_id),
+                content_hash = EXCLUDED.content_hash,
+                fetched_at = EXCLUDED.fetched_at
+            """,
+            [(ch, w["post_id"], w["content_hash"], w["fetched_at"]) for ch, w in watermarks.items()]
+        )
+    if use_logger:
+        logger.debug(f"[DB] Saved {len(watermarks)} listener watermarks")
+
+async def heartbeat_worker(worker_id: str, ttl: float, use_logger: bool = True) -> int:
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            await conn.execute(
+                """
+                INSERT INTO listener_workers (worker_id, heartbeat_at) VALUES ($1, now())
+                ON CONFLICT (worker_id) DO UPDATE SET heartbeat_at = now()
+                """,
+                worker_id
+            )
+            await conn.execute(
+                "DELETE FROM listener_workers WHERE heartbeat_at < now() - make_interval(secs => $1)",
+                ttl
+            )
+            live = await conn.fetchval("SELECT count(*) FROM listener_workers")
+    if use_logger:
+        logger.debug(f"[DB] Worker {worker_id} heartbeat, {live} live listener workers")
+    return live
+
+async def sync_channel_leases(worker_id: str, channels: list[str], share: int, ttl: float, use_logger: bool = True) -> list[str]:
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            await conn.execute(
+                "INSERT INTO channel_leases (channel) SELECT unnest($1::text[]) ON CONFLICT DO NOTHING",
+                channels
+            )
+            owned = [r["channel"] for r in await conn.fetch(
+                """
+                UPDATE channel_leases SET expires_at = now() + make_interval(secs => $2)
+                WHERE owner = $1 AND channel = ANY($3::text[])
+                RETURNING channel
+                """,
+                worker_id, ttl, channels
+            )]
+            owned.sort()
+
+            if len(owned) > share:
+                released, owned = owned[share:], owned[:share]
+                await conn.execute(
+                    "UPDATE channel_leases SET owner = NULL, expires_at = now() WHERE owner = $1 AND channel = ANY($2::text[])",
+                    worker_id, released
+                )
+            elif len(owned) < share:
+                owned += [r["channel"] for r in await conn.fetch(
+                    """
+                    UPDATE channel_leases SET owner = $1, expires_at = now() + make_interval(secs => $2)
+                    WHERE channel IN (
+                        SELECT channel FROM channel_leases
+                        WHERE channel = ANY($3::text[]) AND (owner IS NULL OR expires_at < now())
+                        ORDER BY channel
+                        LIMIT $4
+                        FOR UPDATE SKIP LOCKED
+                    )
+                    RETURNING channel
+                    """,
+                    worker_id, ttl, channels, share - len(owned)
+                )]
+    if use_logger:
+        logger.debug(f"[DB] Worker {worker_id} holds {len(owned)} channel leases")
+    return owned
+
+async def release_channel_leases(worker_id: str, use_logger: bool = True):
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            await conn.execute("UPDATE channel_leases SET owner = NULL, expires_at = now() WHERE owner = $1", worker_id)
+            await conn.execute("DELETE FROM listener_workers WHERE worker_id = $1", worker_id)
+    if use_logger:
+        logger.info(f"[DB] Worker {worker_id} released its channel leases")
+
+async def get_cached_analysis(key: str, ttl: float, use_logger: bool = True) -> str | None:
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        result = await conn.fetchval(
+            "SELECT result FROM analyzer_cache WHERE key = $1 AND created_at > now() - make_interval(secs => $2)",
+            key, ttl
+        )
+    if use_logger:
+        logger.debug(f"[DB] Analyzer cache {'hit' if result is not None else 'miss'} for {key[:12]}")
+    return result
+
+async def save_cached_analysis(key: str, result: str, use_logger: bool = True):
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        await conn.execute(
+            """
+            INSERT INTO analyzer_cache (key, result, created_at) VALUES ($1, $2, now())
+            ON CONFLICT (key) DO UPDATE SET result = EXCLUDED.result, created_at = EXCLUDED.created_at
+            """,
+            key, result
+        )
+    if use_logger:
+        logger.debug(f"[DB] Analyzer result cached for {key[:12]}")
+
+ANALYZER_CALL_COLUMNS = [
+    "created_at", "channel", "provider", "model", "latency_ms", "first_entry_ms", "prompt_tokens",
+    "completion_tokens", "cache_hit", "rule_hit", "fallback", "hedged", "failsafe", "entries", "batch_size",
+]
+
+async def save_analyzer_calls(rows: list[tuple], use_logger: bool = True):
+    if not rows:
+        return
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        await conn.copy_records_to_table("analyzer_calls", records=rows, columns=ANALYZER_CALL_COLUMNS)
+    if use_logger:
+        logger.debug(f"[DB] Appended {len(rows)} analyzer calls")
+
+async def get_analyzer_ledger(hours: float, use_logger: bool = True) -> list[dict]:
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        rows = await conn.fetch(
+            """
+            SELECT channel,
+                   count(*) AS calls,
+                   count(*) FILTER (WHERE provider IS NOT NULL) AS llm_calls,
+                   count(*) FILTER (WHERE cache_hit) AS cache_hits,
+                   count(*) FILTER (WHERE rule_hit) AS rule_hits,
+                   count(*) FILTER (WHERE fallback IS NOT NULL) AS fallbacks,
+                   count(*) FILTER (WHERE failsafe) AS failsafes,
+                   coalesce(sum(prompt_tokens), 0) AS prompt_tokens,
+                   coalesce(sum(completion_tokens), 0) AS completion_tokens,
+                   percentile_cont(0.5) WITHIN GROUP (ORDER BY latency_ms) FILTER (WHERE provider IS NOT NULL) AS p50_ms,
+                   percentile_cont(0.95) WITHIN GROUP (ORDER BY latency_ms) FILTER (WHERE provider IS NOT NULL) AS p95_ms,
+                   percentile_cont(0.99) WITHIN GROUP (ORDER BY latency_ms) FILTER (WHERE provider IS NOT NULL) AS p99_ms,
+                   percentile_cont(0.5) WITHIN GROUP (ORDER BY first_entry_ms) FILTER (WHERE provider IS NOT NULL) AS p50_first_entry_ms
+            FROM analyzer_calls
+            WHERE created_at > now() - make_interval(secs => $1)
+            GROUP BY channel
+            ORDER BY calls DESC
+            """,
+            hours * 3600
+        )
+    if use_logger:
+        logger.debug(f"[DB] Analyzer ledger aggregated for {len(rows)} channels")
+    return [dict(r) for r in rows]
+
+async def ensure_attack_partitions(unit: str, ahead: int, since: datetime | None = None, use_logger: bool = True) -> int:
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        # Starts at the oldest row of the default partition, so rows left there get a partition of their own, but
+        # never before `since`: partitions past the retention period would only be archived right away
+        created = await conn.fetchval(
+            """
+            SELECT ensure_attack_partitions(
+                $1,
+                GREATEST(LEAST(now(), (SELECT min(timestamp) FROM attacks_default)), $3::timestamptz),
+                now() + $2 * ('1 ' || $1)::interval
+            )
+            """,
+            unit, ahead, since
+        )
+    if use_logger and created:
+        logger.info(f"[DB] Created {created} attacks partitions")
+    return created
+
+async def detach_expired_partitions(cutoff: datetime, use_logger: bool = True) -> list[str]:
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            # Upper bound parsed from "FOR VALUES FROM (...) TO (...)"; the default partition has none
+            rows = await conn.fetch(
+                """
+                SELECT relname FROM (
+                    SELECT c.relname,
+                           substring(pg_get_expr(c.relpartbound, c.oid) FROM 'TO \\(''([^'']+)''\\)')::timestamptz AS upper_bound
+                    FROM pg_inherits i
+                    JOIN pg_class c ON c.oid = i.inhrelid
+                    WHERE i.inhparent = 'attacks'::regclass AND c.relname ~ '^attacks_p[0-9]{8}$'
+                ) p
+                WHERE upper_bound <= $1
+                ORDER BY relname
+                """,
+                cutoff
+            )
+            names = [r["relname"] for r in rows]
+            for name in names:
+                await conn.execute(f'ALTER TABLE attacks DETACH PARTITION "{name}"')
+    if use_logger and names:
+        logger.info(f"[DB] Detached attacks partitions: {', '.join(names)}")
+    return names
+
+async def get_detached_partitions(use_logger: bool = True) -> list[str]:
+    # Detached but not archived yet, e.g. the process stopped in between
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        rows = await conn.fetch(
+            """
+            SELECT relname FROM pg_class
+            WHERE relkind = 'r' AND NOT relispartition AND relname ~ '^attacks_p[0-9]{8}$'
+              AND relnamespace = 'public'::regnamespace
+            ORDER BY relname
+            """
+        )
+    return [r["relname"] for r in rows]
+
+async def export_partition(name: str, output, use_logger: bool = True) -> str:
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        status = await conn.copy_from_table(name, output=output, format="csv", header=True)
+    if use_logger:
+        logger.info(f"[DB] Exported partition {name}: {status}")
+    return status
+
+async def drop_partition(name: str, use_logger: bool = True):
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        await conn.execute(f'DROP TABLE IF EXISTS "{name}"')
+    if use_logger:
+        logger.info(f"[DB] Dropped partition {name}")
@@ -0,0 +1,100 @@
+import html
+import os
+import re
+from typing import Optional
+from bs4 import BeautifulSoup
+from logger import logger
+
+EXTRACTOR = os.getenv("EXTRACTOR", "fast")
+
+POST_MARKER = '<div class="tgme_widget_message'
+POST_RE = re.compile(r'<div class="tgme_widget_message\b[^"]*"[^>]*\bdata-post="([^"]+)"')
+TEXT_RE = re.compile(r'<div class="tgme_widget_message_text\b[^"]*"[^>]*>')
+TITLE_RE = re.compile(r'<div class="tgme_channel_info_header_title\b[^"]*"[^>]*>(.*?)</div>', re.S)
+DIV_RE = re.compile(r"<(/?)div\b[^>]*>", re.I)
+TAG_RE = re.compile(r"<[^>]*>")
+
+def parse_post_id(data_post: str) -> Optional[int]:
+    try:
+        return int(data_post.rsplit("/", 1)[1])
+    except (IndexError, ValueError):
+        return None
+
+def _html_to_text(fragment: str, separator: str = "\n") -> str:
+    # Same output as BeautifulSoup's get_text(separator, strip=True): every text node stripped, empty ones dropped
+    parts = (html.unescape(chunk).strip() for chunk in TAG_RE.split(fragment))
+    return separator.join(p for p in parts if p)
+
+def _inner_div(page: str, start: int) -> str:
+    depth = 1
+    for match in DIV_RE.finditer(page, start):
+        depth += -1 if match.group(1) else 1
+        if depth == 0:
+            return page[start:match.start()]
+    return page[start:]
+
+def _posts_from_end(page: str):
+    # Newest posts are at the bottom of the page, so walking back from the end lets the caller stop at the watermark
+    end = search_end = len(page)
+    while (start := page.rfind(POST_MARKER, 0, search_end)) != -1:
+        search_end = start
+        match = POST_RE.match(page, start)
+        if match:
+            yield start, end, parse_post_id(match.group(1))
+            end = start
+
+def extract_posts_fast(page: str, after: Optional[int] = None) -> dict:
+    posts = []
+    for start, end, post_id in _posts_from_end(page):
+        if post_id is None:
+            continue
+        text = TEXT_RE.search(page, start, end)
+        posts.append({
+            "post_id": post_id,
+            "message": _html_to_text(_inner_div(page, text.end())) if text else None,
+        })
+        if after is not None and post_id <= after:
+            # The watermark post is kept for edit detection, nothing older is parsed
+            break
+
+    title = TITLE_RE.search(page)
+    return {
+        "posts": sorted(posts, key=lambda p: p["post_id"]),
+        "channel_name": _html_to_text(title.group(1), "") if title else None,
+    }
+
+def extract_posts_bs4(page: str, after: Optional[int] = None) -> dict:
+    soup = BeautifulSoup(page, "html.parser")
+
+    posts = []
+    for node in soup.select("div.tgme_widget_message[data-post]"):
+        post_id = parse_post_id(node["data-post"])
+        if post_id is None:
+            continue
+        text = node.select_one("div.tgme_widget_message_text")
+        posts.append({
+            "post_id": post_id,
+            "message": text.get_text("\n", strip=True) if text else None,
+        })
+
+    channel_title = soup.select_one("div.tgme_channel_info_header_title")
+    return {
+        "posts": sorted(posts, key=lambda p: p["post_id"]),
+        "channel_name": channel_title.get_text(strip=True) if channel_title else None,
+    }
+
+def extract_posts(page: str, after: Optional[int] = None) -> dict:
+    if EXTRACTOR == "bs4":
+        return extract_posts_bs4(page, after)
+
+    try:
+        result = extract_posts_fast(page, after)
+    except Exception:
+        logger.error("[EXTR] Fast extractor failed, falling back to BeautifulSoup", exc_info=True)
+        return extract_posts_bs4(page, after)
+
+    # Markup we do not recognise (e.g. t.me layout change) must not look like "no posts"
+    if not result["posts"] and "data-post=" in page:
+        logger.warning("[EXTR] Fast extractor found no posts on a page that has them, falling back to BeautifulSoup")
+        return extract_posts_bs4(page, after)
+    return result
@@ -0,0 +1,136 @@
+import re
+from typing import Optional
+from config import CITY_REGIONS, REGIONS
+from regions import ALIASES, phrase_forms
+
+ADJECTIVE_ENDINGS = r"(?:ая|ой|ую|ий|ого|ому|ом|ем|ей)"
+OBLAST = r"(?:област\w*|обл\b\.?)"
+KRAI = r"(?:кра[йяюе]|краем|кра[яе]х|краям)"
+
+CITY_PATTERN_OVERRIDES = {
+    "Орёл": r"ор[её]л|орл(?:а|у|е|ом)",
+    "Грозный": r"грозн(?:ый|ого|ому|ом)",
+    "Шахты": r"шахт(?:ы|ах|ам)",
+    "Ростов-на-Дону": r"ростов(?:а|у|е|ом)?(?:-на-дону)?",
+    "Славянск-на-Кубани": r"славянск(?:а|у|е|ом)?-на-кубани",
+}
+
+GLOBAL_PATTERN = re.compile(
+    r"по\s+всей\s+(?:территории\s+)?росси[июй]|по\s+(?:всей\s+)?стране|во\s+всех\s+регионах|по\s+всем\s+регионам",
+    flags=re.IGNORECASE,
+)
+
+# Capitalised words in the middle of a sentence, i.e. most likely place names
+PROPER_NAME = re.compile(r"(?<![\w-])[А-ЯЁ][а-яё]{2,}(?:-[А-ЯЁа-яё]+)*")
+SENTENCE_START = re.compile(r"(?:^|[.!?:;\n])[\W_]*$")
+
+def _form_pattern(form: str) -> str:
+    # Forms come normalized by regions.normalize_name: lower case, "ё" as "е", dashes without spaces
+    return r"\s+".join(
+        re.escape(word).replace("е", "[её]").replace(r"\-", r"\s*[-–—]\s*") for word in form.split()
+    )
+
+def _abbreviated_pattern(region: str) -> Optional[str]:
+    # "Курской обл.", "в Краснодарском и Ставропольском краях": forms the alias table can't list
+    adjective, _, kind = region.partition(" ")
+    stem = adjective.lower()[:-2]
+    if kind == "область":
+        return rf"{stem}{ADJECTIVE_ENDINGS}\s+{OBLAST}"
+    if kind == "край":
+        return rf"{stem}{ADJECTIVE_ENDINGS}\s+{KRAI}"
+    return None
+
+def _region_pattern(region: str) -> re.Pattern:
+    # Same names as RegionResolver: the official one and every alias, in all case forms
+    names = [region] + [alias for alias, target in ALIASES.items() if target == region]
+    forms = sorted({form for name in names for form in phrase_forms(name)}, key=len, reverse=True)
+    alternatives = [_form_pattern(form) for form in forms]
+    if abbreviated := _abbreviated_pattern(region):
+        alternatives.append(abbreviated)
+    return re.compile(rf"(?<![\w-])(?:{"|".join(alternatives)})(?![\w-])", flags=re.IGNORECASE)
+
+REGION_PATTERNS = {region: _region_pattern(region) for region in REGIONS if region != "Россия"}
+
+def _noun_forms(word: str) -> str:
+    if word.endswith(("а", "я")):
+        return word[:-1] + r"(?:а|я|ы|и|е|у|ю|ой|ей)"
+    if word.endswith("ь"):
+        return word[:-1] + r"(?:ь|и|ю|ем|ём)"
+    if word.endswith(("ый", "ий", "ой")):
+        return word[:-2] + r"(?:ый|ий|ой|ого|ому|ом|ым)"
+    if word.endswith("ое"):
+        return word[:-2] + r"(?:ое|ого|ому|ом|ым)"
+    if word.endswith("о") and word[-2] not in "аеиоуыэюя":
+        # "Иваново", "Кемерово": declined like neuter nouns
+        return word[:-1] + r"(?:о|а|у|ом|е)"
+    if word.endswith(("ы", "и")):
+        # Plural names ("Валуйки", "Ливны"); also harmless for indeclinable ones like "Сочи"
+        return word[:-1] + rf"(?:{word[-1]}|ам|ах|ами)"
+    if word.endswith(("о", "е", "у", "э")):
+        return word
+    return word + r"(?:а|у|е|ом)?"
+
+def _city_pattern(city: str) -> str:
+    if city in CITY_PATTERN_OVERRIDES:
+        return CITY_PATTERN_OVERRIDES[city]
+    parts = re.split(r"([-\s])", city.lower())
+    if len(parts) == 1:
+        return _noun_forms(parts[0])
+    # Compound names: every part may be declined ("Набережных Челнах", "Улан-Удэ")
+    return "".join(
+        r"\s+" if part == " " else "-" if part == "-" else part if len(part) <= 2 else part.rstrip("аяьйоеиыуэ") + r"\w*"
+        for part in parts
+    )
+
+CITY_PATTERNS = [
+    (re.compile(rf"(?<![\w-])(?:{_city_pattern(city)})(?![\w-])", flags=re.IGNORECASE), region)
+    for city, region in CITY_REGIONS.items()
+]
+
+def is_global(text: str) -> bool:
+    return GLOBAL_PATTERN.search(text) is not None
+
+def find_regions(text: str) -> list[str]:
+    found = []
+    for region, pattern in REGION_PATTERNS.items():
+        match = pattern.search(text)
+        if match:
+            found.append((match.start(), region))
+    return [region for _, region in sorted(found)]
+
+def _locate(text: str) -> tuple[set[str], list[tuple[int, int]]]:
+    found, spans = set(), []
+    patterns = list(REGION_PATTERNS.items()) + [(region, pattern) for pattern, region in CITY_PATTERNS]
+    for region, pattern in patterns:
+        for match in pattern.finditer(text):
+            found.add(region)
+            spans.append(match.span())
+    if match := GLOBAL_PATTERN.search(text):
+        found.add("Россия")
+        spans.append(match.span())
+    return found, spans
+
+def _unplaced(text: str, spans: list[tuple[int, int]]) -> list[str]:
+    return [
+        match.group()
+        for match in PROPER_NAME.finditer(text)
+        if not SENTENCE_START.search(text, 0, match.start())
+        and not any(start <= match.start() < end for start, end in spans)
+    ]
+
+def has_unplaced_names(text: str) -> bool:
+    # A place name the gazetteer doesn't know ("в Иванове" before it was added, a village): the regions
+    # it did find are only part of the picture
+    return bool(_unplaced(text, _locate(text)[1]))
+
+def find_candidate_regions(text: str) -> set[str]:
+    return _locate(text)[0]
+
+def candidate_regions(text: str, allowed: list[str]) -> list[str]:
+    found, spans = _locate(text)
+    candidates = [r for r in allowed if r in found]
+    # Nothing recognised (an unknown village, an implicit region of the channel) or only part of the places in the
+    # message: let the LLM see every option rather than a prompt missing the right one
+    if not candidates or _unplaced(text, spans):
+        return allowed
+    return candidates
@@ -0,0 +1,100 @@
+import asyncio
+import os
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Optional
+import db
+from logger import logger
+
+ANALYZER_LEDGER = os.getenv("ANALYZER_LEDGER", "true").lower() in ("1", "true", "yes")
+ANALYZER_LEDGER_FLUSH_SEC = float(os.getenv("ANALYZER_LEDGER_FLUSH_SEC", 5))
+ANALYZER_LEDGER_BUFFER = int(os.getenv("ANALYZER_LEDGER_BUFFER", 5000))
+
+class CallRecord:
+    __slots__ = (
+        "created_at", "started", "channel", "provider", "model", "latency_ms", "first_entry_ms",
+        "prompt_tokens", "completion_tokens", "cache_hit", "rule_hit", "fallbacks", "hedged",
+        "failsafe", "entries", "batch_size",
+    )
+
+    def __init__(self, channel: str):
+        self.created_at = datetime.now(timezone.utc)
+        self.started = time.monotonic()
+        self.channel = channel
+        self.provider: Optional[str] = None
+        self.model: Optional[str] = None
+        self.latency_ms: Optional[int] = None
+        self.first_entry_ms: Optional[int] = None
+        self.prompt_tokens: Optional[int] = None
+        self.completion_tokens: Optional[int] = None
+        self.cache_hit = False
+        self.rule_hit = False
+        self.fallbacks: list[str] = []
+        self.hedged = False
+        self.failsafe = False
+        self.entries = 0
+        self.batch_size = 1
+
+    def elapsed_ms(self) -> int:
+        return int((time.monotonic() - self.started) * 1000)
+
+    def entry(self):
+        if self.first_entry_ms is None:
+            self.first_entry_ms = self.elapsed_ms()
+        self.entries += 1
+
+    def share(self, batch: "CallRecord", size: int):
+        # One request answered several posts: each post carries its share of the tokens
+        self.provider = batch.provider
+        self.model = batch.model
+        self.fallbacks = list(batch.fallbacks)
+        self.hedged = batch.hedged
+        self.failsafe = batch.failsafe
+        self.batch_size = size
+        if batch.prompt_tokens is not None:
+            self.prompt_tokens = round(batch.prompt_tokens / size)
+        if batch.completion_tokens is not None:
+            self.completion_tokens = round(batch.completion_tokens / size)
+
+    def row(self) -> tuple:
+        return (
+            self.created_at, self.channel, self.provider, self.model, self.latency_ms, self.first_entry_ms,
+            self.prompt_tokens, self.completion_tokens, self.cache_hit, self.rule_hit,
+            "; ".join(self.fallbacks) or None, self.hedged, self.failsafe, self.entries, self.batch_size,
+        )
+
+class AnalyzerLedger:
+    def __init__(self, flush_interval: float = ANALYZER_LEDGER_FLUSH_SEC, buffer_size: int = ANALYZER_LEDGER_BUFFER):
+        self.flush_interval = flush_interval
+        self.buffer: deque[tuple] = deque(maxlen=buffer_size)
+        self.lock = asyncio.Lock()
+
+    def record(self, call: CallRecord):
+        if not ANALYZER_LEDGER:
+            return
+        if call.latency_ms is None:
+            call.latency_ms = call.elapsed_ms()
+        self.buffer.append(call.row())
+
+    async def flush(self):
+        async with self.lock:
+            rows = [self.buffer.popleft() for _ in range(len(self.buffer))]
+            if not rows:
+                return
+            try:
+                await db.save_analyzer_calls(rows, use_logger=False)
+            except Exception:
+                self.buffer.extendleft(reversed(rows))
+                logger.error("[LEDGER] Failed to flush analyzer calls", exc_info=True)
+
+    async def run(self):
+        # Write-behind: analyzer calls only touch memory, the table is appended to every flush_interval
+        try:
+            while True:
+                await asyncio.sleep(self.flush_interval)
+                await self.flush()
+        finally:
+            await self.flush()
+
+ledger = AnalyzerLedger()
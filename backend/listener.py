@@ -1,228 +1,439 @@
-import asyncio
-import aiohttp
-from typing import Optional, Iterable
-from bs4 import BeautifulSoup
-from config import TELEGRAM_CHANNELS, REGIONS, BANWORDS, ATTACK_TYPES, EXPANDED_ATTACK_TYPES, UB_ALLOWED_REGIONS, ALL_AC_EXCLUDED_REGIONS
-import db
-from analyzer import analyze_message
-from telegram import Bot, InlineKeyboardButton, InlineKeyboardMarkup, WebAppInfo
-from notifications import format_notification
-from logger import logger
-import os
-
-BOT_TOKEN = os.getenv("BOT_TOKEN")
-BOT = Bot(token=BOT_TOKEN)
-
-REGION_MAP = {r.lower(): r for r in REGIONS}
-
-HEADERS = {
-    "User-Agent": (
-        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-        "AppleWebKit/537.36 (KHTML, like Gecko) "
-        "Chrome/117.0 Safari/537.36"
-    ),
-    "Cache-Control": "no-cache",
-    "Pragma": "no-cache",
-}
-
-last_seen_messages = {}
-
-def preprocess_message(message: str):
-    msg_lower = message.lower()
-    for banword in BANWORDS:
-        if banword in msg_lower:
-            logger.info(f"[LSNR] Message contains banword '{banword}', skipping.")
-            return None
-    return message
-
-def normalize_region(name: str) -> Optional[str]:
-    name_l = name.lower()
-
-    if name_l in REGION_MAP:
-        return REGION_MAP[name_l]
-
-    for key, value in REGION_MAP.items():
-        if name_l in key:
-            return value
-
-    return None
-
-def expand_targets(region: str, attack_type: str, status: str) -> Iterable[tuple[str, str]]:
-    targets = []
-
-    if region != "Россия":
-        if attack_type == "ALL" and status == "AC":
-            targets.extend((region, at) for at in EXPANDED_ATTACK_TYPES)
-        elif attack_type == "ALL" and status != "AC":
-            return []
-        else:
-            if attack_type == "UB" and region not in UB_ALLOWED_REGIONS:
-                return []
-            targets.append((region, attack_type))
-    elif region == "Россия" and status == "AC":
-        for r in REGIONS:
-            if r in ALL_AC_EXCLUDED_REGIONS:
-                continue
-            if attack_type == "ALL":
-                targets.extend((r, at) for at in EXPANDED_ATTACK_TYPES)
-            else:
-                if attack_type == "UB" and r not in UB_ALLOWED_REGIONS:
-                    continue
-                targets.append((r, attack_type))
-
-    return targets
-
-async def notify_users(users: list[int], text: str):
-    async def send(user_id: int):
-        try:
-            await BOT.send_message(
-                chat_id=user_id,
-                text=text,
-                parse_mode="HTML",
-                reply_markup=InlineKeyboardMarkup([
-                    [InlineKeyboardButton(
-                        "🌐 Открыть онлайн-карту",
-                        web_app=WebAppInfo(url="https://radarone.online")
-                    )]
-                ])
-            )
-            await asyncio.sleep(0.05)
-        except Exception:
-            logger.exception(f"[TG] Failed to send to {user_id}")
-
-    await asyncio.gather(*(send(uid) for uid in users))
-
-async def handle_attack_update(
-    region: str,
-    attack_type: str,
-    status: str,
-    source: str,
-    comment: Optional[str],
-    is_bot: bool,
-):
-    if region not in REGIONS or attack_type not in EXPANDED_ATTACK_TYPES:
-        return
-
-    last_status = await db.get_last_status(
-        region=region,
-        attack_type=attack_type,
-        is_bot=is_bot
-    )
-
-    if last_status == status:
-        logger.warning(f"Repeat, skipping ({status}/{region}/{attack_type})")
-        return
-
-    await db.save_attack(
-        region=region,
-        attack_type=attack_type,
-        status=status,
-        source=source,
-        is_bot=is_bot
-    )
-
-    users = await db.get_users_by_region(region=region, is_bot=is_bot)
-    if not users:
-        return
-
-    text = format_notification(region, attack_type, status, source, comment)
-    await notify_users(users, text)
-
-async def get_last_message(channel: str, session: aiohttp.ClientSession) -> Optional[dict]:
-    url = f"https://t.me/s/{channel}"
-
-    async with session.get(url, headers=HEADERS) as response:
-        response.raise_for_status()
-        html = await response.text()
-
-    soup = BeautifulSoup(html, "html.parser")
-
-    messages = soup.select("div.tgme_widget_message_text")
-    if not messages:
-        logger.warning(f"[LSNR] No messages found in {channel}")
-        return None
-
-    channel_title = soup.select_one("div.tgme_channel_info_header_title")
-
-    return {
-        "last_message": messages[-1].get_text("\n", strip=True),
-        "channel_name": channel_title.get_text(strip=True) if channel_title else "<неизвестно>",
-    }
-
-async def process_message(
-    message: str,
-    channel_name: str,
-    source: str,
-    comment: str | None = None,
-    is_bot: bool = False,
-):
-    message = preprocess_message(message)
-    if not message:
-        return
-
-    try:
-        result = analyze_message(message, source=source, channel_name=channel_name)
-    except Exception:
-        logger.error("[LSNR] Error while analyzing message", exc_info=True)
-        return
-
-    for chunk in result.replace("\n", ",").split(","):
-        parts = [p.strip() for p in chunk.split("/")]
-        if len(parts) != 3:
-            continue
-
-        status, region_raw, attack_type = parts
-
-        if attack_type not in ATTACK_TYPES:
-            continue
-
-        region = normalize_region(region_raw)
-        if not region:
-            continue
-
-        targets = expand_targets(region, attack_type, status)
-        if not targets:
-            logger.debug(f"[LSNR] No targets expanded: region={region}, type={attack_type}, status={status}")
-            continue
-        for r, at in targets:
-            await handle_attack_update(
-                region=r,
-                attack_type=at,
-                status=status,
-                source=source,
-                comment=comment,
-                is_bot=is_bot,
-            )
-
-async def listener_loop(poll_interval: int = 10):
-    logger.info("[LSNR] Listener started (aiohttp + BS4)")
-
-    async with aiohttp.ClientSession() as session:
-        while True:
-            tasks = []
-
-            for channel in TELEGRAM_CHANNELS:
-                tasks.append(get_last_message(channel, session))
-
-            results = await asyncio.gather(*tasks, return_exceptions=True)
-
-            for channel, result in zip(TELEGRAM_CHANNELS, results):
-                if not result or isinstance(result, Exception):
-                    continue
-
-                message = result["last_message"]
-                last = last_seen_messages.get(channel)
-
-                if message == last:
-                    continue
-
-                last_seen_messages[channel] = message
-                logger.info(f"[LSNR] New message from {channel}")
-
-                await process_message(
-                    message,
-                    channel_name=result["channel_name"],
-                    source=channel,
-                )
-
-            await asyncio.sleep(poll_interval)
+import asyncio
+import aiohttp
+from typing import AsyncIterator, Optional, Iterable
+from config import TELEGRAM_CHANNELS, REGIONS, BANWORDS, ATTACK_TYPES, EXPANDED_ATTACK_TYPES, UB_ALLOWED_REGIONS, ALL_AC_EXCLUDED_REGIONS
+import db
+from analyzer import analyze_message_stream
+from telegram import Bot, InlineKeyboardButton, InlineKeyboardMarkup, WebAppInfo
+from notifications import format_notification
+from regions import resolve_region
+from state import status_store
+from subscribers import subscriber_index
+from pipeline import ShardedQueue, start_workers
+from watermarks import WatermarkStore, content_hash
+from scheduler import PollScheduler, parse_retry_after
+from extractor import extract_posts
+from scraper import create_session, fetch_page
+from sharding import LISTENER_SHARDING, LeaseManager
+from logger import logger
+import os
+
+BOT_TOKEN = os.getenv("BOT_TOKEN")
+BOT = Bot(token=BOT_TOKEN)
+
+LISTENER_QUEUE_SIZE = int(os.getenv("LISTENER_QUEUE_SIZE", 100))
+LISTENER_ANALYZE_WORKERS = int(os.getenv("LISTENER_ANALYZE_WORKERS", 4))
+LISTENER_PERSIST_WORKERS = int(os.getenv("LISTENER_PERSIST_WORKERS", 2))
+LISTENER_NOTIFY_WORKERS = int(os.getenv("LISTENER_NOTIFY_WORKERS", 4))
+LISTENER_BULK_THRESHOLD = int(os.getenv("LISTENER_BULK_THRESHOLD", 8))
+
+watermarks = WatermarkStore()
+
+def preprocess_message(message: str):
+    msg_lower = message.lower()
+    for banword in BANWORDS:
+        if banword in msg_lower:
+            logger.info(f"[LSNR] Message contains banword '{banword}', skipping.")
+            return None
+    return message
+
+def expand_targets(region: str, attack_type: str, status: str) -> Iterable[tuple[str, str]]:
+    targets = []
+
+    if region != "Россия":
+        if attack_type == "ALL" and status == "AC":
+            targets.extend((region, at) for at in EXPANDED_ATTACK_TYPES)
+        elif attack_type == "ALL" and status != "AC":
+            return []
+        else:
+            if attack_type == "UB" and region not in UB_ALLOWED_REGIONS:
+                return []
+            targets.append((region, attack_type))
+    elif region == "Россия" and status == "AC":
+        for r in REGIONS:
+            if r in ALL_AC_EXCLUDED_REGIONS:
+                continue
+            if attack_type == "ALL":
+                targets.extend((r, at) for at in EXPANDED_ATTACK_TYPES)
+            else:
+                if attack_type == "UB" and r not in UB_ALLOWED_REGIONS:
+                    continue
+                targets.append((r, attack_type))
+
+    return targets
+
+async def notify_users(users: list[int], text: str):
+    async def send(user_id: int):
+        try:
+            await BOT.send_message(
+                chat_id=user_id,
+                text=text,
+                parse_mode="HTML",
+                reply_markup=InlineKeyboardMarkup([
+                    [InlineKeyboardButton(
+                        "🌐 Открыть онлайн-карту",
+                        web_app=WebAppInfo(url="https://radarone.online")
+                    )]
+                ])
+            )
+            await asyncio.sleep(0.05)
+        except Exception:
+            logger.exception(f"[TG] Failed to send to {user_id}")
+
+    await asyncio.gather(*(send(uid) for uid in users))
+
+async def persist_attack_update(
+    region: str,
+    attack_type: str,
+    status: str,
+    source: str,
+) -> bool:
+    if region not in REGIONS or attack_type not in EXPANDED_ATTACK_TYPES:
+        return False
+
+    # Only a store kept current by LISTEN may turn a write into a repeat, otherwise the database decides
+    if status_store.fresh:
+        last_status = status_store.get(region, attack_type)
+    else:
+        last_status = await db.get_last_status(region=region, attack_type=attack_type)
+
+    if last_status == status:
+        logger.warning(f"Repeat, skipping ({status}/{region}/{attack_type})")
+        return False
+
+    attack_id = await db.save_attack(
+        region=region,
+        attack_type=attack_type,
+        status=status,
+        source=source,
+    )
+    if attack_id is not None:
+        status_store.apply(region, attack_type, status, attack_id)
+    return True
+
+async def notify_attack_update(
+    region: str,
+    attack_type: str,
+    status: str,
+    source: str,
+    comment: Optional[str],
+):
+    if subscriber_index.loaded:
+        users = subscriber_index.users(region)
+    else:
+        users = await db.get_users_by_region(region=region)
+    if not users:
+        return
+
+    text = format_notification(region, attack_type, status, source, comment)
+    await notify_users(users, text)
+
+async def handle_attack_update(
+    region: str,
+    attack_type: str,
+    status: str,
+    source: str,
+    comment: Optional[str],
+):
+    if await persist_attack_update(region, attack_type, status, source):
+        await notify_attack_update(region, attack_type, status, source, comment)
+
+async def persist_attack_updates(
+    targets: list[tuple[str, str, str]],
+    source: str,
+) -> list[tuple[str, str, str]]:
+    if status_store.fresh:
+        # Most of a nationwide expansion usually repeats the current state, those never reach the database
+        fresh = [t for t in targets if status_store.get(t[0], t[1]) != t[2]]
+    else:
+        fresh = targets
+    changed = await db.save_attacks_bulk(fresh, source=source) if fresh else []
+    for region, attack_type, status, attack_id in changed:
+        status_store.apply(region, attack_type, status, attack_id)
+    if len(changed) < len(targets):
+        logger.warning(f"Repeat, skipping {len(targets) - len(changed)} of {len(targets)} targets from {source}")
+    return [(region, attack_type, status) for region, attack_type, status, _ in changed]
+
+async def notify_attack_updates(
+    changed: list[tuple[str, str, str]],
+    source: str,
+    comment: Optional[str],
+):
+    grouped: dict[tuple[str, str], list[str]] = {}
+    for region, attack_type, status in changed:
+        grouped.setdefault((region, status), []).append(attack_type)
+
+    regions = list({region for region, _ in grouped})
+    if subscriber_index.loaded:
+        users_by_region = subscriber_index.users_by_regions(regions)
+    else:
+        users_by_region = await db.get_users_by_regions(regions)
+    sends = []
+    for (region, status), attack_types in grouped.items():
+        users = users_by_region.get(region)
+        if users:
+            sends.append(notify_users(users, format_notification(region, attack_types, status, source, comment)))
+    await asyncio.gather(*sends)
+
+async def handle_attack_updates(
+    targets: list[tuple[str, str, str]],
+    source: str,
+    comment: Optional[str],
+):
+    # One diff+insert query and one subscriber query for the whole set, e.g. an "AC/Россия/ALL" expansion
+    changed = await persist_attack_updates(targets, source)
+    if changed:
+        await notify_attack_updates(changed, source, comment)
+
+async def get_channel_posts(channel: str, session: aiohttp.ClientSession, after: Optional[int] = None) -> Optional[dict]:
+    url = f"https://t.me/s/{channel}"
+    # t.me only renders posts newer than `after`, so known channels fetch just the delta
+    params = {"after": after} if after else None
+
+    html = await fetch_page(session, url, params=params)
+    if html is None:
+        # 304 Not Modified: nothing new since the last fetch
+        return None
+
+    result = extract_posts(html, after=after)
+
+    if not result["posts"] and not after:
+        logger.warning(f"[LSNR] No messages found in {channel}")
+        return None
+
+    result["channel_name"] = result["channel_name"] or "<неизвестно>"
+    return result
+
+def select_new_posts(channel: str, posts: list[dict]) -> list[dict]:
+    watermark = watermarks.get(channel)
+    if not posts:
+        return []
+
+    if watermark is None:
+        # First poll of a channel: only the latest post is treated as new, older ones are history
+        new_posts = posts[-1:]
+    else:
+        new_posts = [p for p in posts if p["post_id"] > watermark]
+
+    latest = posts[-1]
+    latest_hash = content_hash(latest["message"])
+    if latest["post_id"] == watermark and latest_hash != watermarks.get_hash(channel):
+        logger.info(f"[LSNR] Post {channel}/{latest['post_id']} was edited, not re-analyzing")
+    new_posts = [p for p in new_posts if p["message"]]
+    if latest["post_id"] >= (watermark or 0):
+        watermarks.advance(channel, latest["post_id"], latest_hash, [p["post_id"] for p in new_posts])
+    return new_posts
+
+def parse_entry(entry: str) -> list[tuple[str, str, str]]:
+    parts = [p.strip() for p in entry.split("/")]
+    if len(parts) != 3:
+        return []
+
+    status, region_raw, attack_type = parts
+
+    if attack_type not in ATTACK_TYPES:
+        return []
+
+    region = resolve_region(region_raw)
+    if not region:
+        return []
+
+    expanded = expand_targets(region, attack_type, status)
+    if not expanded:
+        logger.debug(f"[LSNR] No targets expanded: region={region}, type={attack_type}, status={status}")
+        return []
+    return [(r, at, status) for r, at in expanded]
+
+async def analyze_targets(message: str, channel_name: str, source: str) -> AsyncIterator[list[tuple[str, str, str]]]:
+    message = preprocess_message(message)
+    if not message:
+        return
+
+    # Targets are yielded per analyzer entry, so the first region is handled while the model is still answering
+    try:
+        async for entry in analyze_message_stream(message, source=source, channel_name=channel_name):
+            targets = parse_entry(entry)
+            if targets:
+                yield targets
+    except Exception:
+        logger.error("[LSNR] Error while analyzing message", exc_info=True)
+
+async def process_message(
+    message: str,
+    channel_name: str,
+    source: str,
+    comment: str | None = None,
+):
+    async for targets in analyze_targets(message, channel_name=channel_name, source=source):
+        if len(targets) >= LISTENER_BULK_THRESHOLD:
+            await handle_attack_updates(targets, source=source, comment=comment)
+            continue
+        for r, at, status in targets:
+            await handle_attack_update(
+                region=r,
+                attack_type=at,
+                status=status,
+                source=source,
+                comment=comment,
+            )
+
+class ListenerPipeline:
+    def __init__(
+        self,
+        queue_size: int = LISTENER_QUEUE_SIZE,
+        analyze_workers: int = LISTENER_ANALYZE_WORKERS,
+        persist_workers: int = LISTENER_PERSIST_WORKERS,
+        notify_workers: int = LISTENER_NOTIFY_WORKERS,
+    ):
+        self.analyze_queue: asyncio.Queue[tuple[str, dict]] = asyncio.Queue(queue_size)
+        # Updates for one region always land on the same persist worker, so they are applied in order
+        self.persist_queue = ShardedQueue(persist_workers, queue_size)
+        # Sharded by region too: concurrent notify workers could otherwise deliver an alert after the all-clear
+        # that follows it
+        self.notify_queue = ShardedQueue(notify_workers, queue_size)
+        self.analyze_workers = analyze_workers
+        self.channel_locks: dict[str, asyncio.Lock] = {}
+        self.tasks: list[asyncio.Task] = []
+
+    def start(self):
+        self.tasks += start_workers("analyze", self.analyze_workers, self.analyze_queue, self.analyze_stage)
+        for i, queue in enumerate(self.persist_queue.queues):
+            self.tasks += start_workers(f"persist{i}", 1, queue, self.persist_stage)
+        for i, queue in enumerate(self.notify_queue.queues):
+            self.tasks += start_workers(f"notify{i}", 1, queue, self.notify_stage)
+        logger.info(
+            f"[PIPE] Started pipeline: {self.analyze_workers} analyze, "
+            f"{len(self.persist_queue.queues)} persist, {len(self.notify_queue.queues)} notify workers"
+        )
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks.clear()
+
+    async def submit(self, channel: str, post: dict):
+        # Every post is submitted once (the watermark moves past it), so there is nothing to merge while it waits
+        await self.analyze_queue.put((channel, post))
+
+    async def analyze_stage(self, entry: tuple[str, dict]):
+        channel, post = entry
+        lock = self.channel_locks.setdefault(channel, asyncio.Lock())
+        try:
+            async with lock:
+                await self.analyze_post(channel, post)
+        except asyncio.CancelledError:
+            # Left in flight: the stored watermark stays before the post, so the next run fetches it again
+            raise
+        except Exception:
+            # A post that keeps failing must not hold the channel's watermark back forever
+            watermarks.done(channel, post["post_id"])
+            raise
+        watermarks.done(channel, post["post_id"])
+
+    async def analyze_post(self, channel: str, post: dict):
+        async for targets in analyze_targets(post["message"], channel_name=post["channel_name"], source=channel):
+            if len(targets) >= LISTENER_BULK_THRESHOLD:
+                # Each persist shard gets its own slice of the bulk update, so per-region ordering still holds
+                for queue, shard_targets in self.persist_queue.partition(targets, key=lambda t: t[0]):
+                    await queue.put({"targets": shard_targets, "source": channel, "comment": post.get("comment")})
+                continue
+            for r, at, status in targets:
+                await self.persist_queue.put(r, {
+                    "region": r,
+                    "attack_type": at,
+                    "status": status,
+                    "source": channel,
+                    "comment": post.get("comment"),
+                })
+
+    async def persist_stage(self, update: dict):
+        if "targets" in update:
+            changed = await persist_attack_updates(update["targets"], update["source"])
+            for queue, shard_changed in self.notify_queue.partition(changed, key=lambda t: t[0]):
+                await queue.put({"changed": shard_changed, "source": update["source"], "comment": update["comment"]})
+            return
+        if await persist_attack_update(update["region"], update["attack_type"], update["status"], update["source"]):
+            await self.notify_queue.put(update["region"], update)
+
+    async def notify_stage(self, update: dict):
+        if "changed" in update:
+            await notify_attack_updates(update["changed"], update["source"], update["comment"])
+            return
+        await notify_attack_update(
+            update["region"], update["attack_type"], update["status"], update["source"], update["comment"]
+        )
+
+async def poll_channel(channel: str, session: aiohttp.ClientSession, pipeline: ListenerPipeline, scheduler: PollScheduler):
+    try:
+        result = await get_channel_posts(channel, session, after=watermarks.get(channel))
+    except aiohttp.ClientResponseError as e:
+        retry_after = parse_retry_after(e.headers.get("Retry-After")) if e.headers else None
+        if e.status == 429 and retry_after is None:
+            retry_after = scheduler.max_interval
+        logger.warning(f"[LSNR] HTTP {e.status} while fetching {channel}")
+        scheduler.record_error(channel, retry_after=retry_after)
+        return
+    except Exception:
+        logger.warning(f"[LSNR] Failed to fetch {channel}", exc_info=True)
+        scheduler.record_error(channel)
+        return
+
+    new_posts = select_new_posts(channel, result["posts"]) if result else []
+    scheduler.record_success(channel, len(new_posts))
+    if not new_posts:
+        return
+
+    logger.info(f"[LSNR] {len(new_posts)} new message(s) from {channel}")
+
+    for post in new_posts:
+        # Blocks while the analyze queue is full, which slows polling down instead of piling up work
+        await pipeline.submit(channel, {
+            "post_id": post["post_id"],
+            "message": post["message"],
+            "channel_name": result["channel_name"],
+        })
+
+async def listener_loop(poll_interval: int = 10):
+    logger.info("[LSNR] Listener started (aiohttp)")
+
+    await watermarks.load()
+    watermarks_task = asyncio.create_task(watermarks.run())
+
+    pipeline = ListenerPipeline()
+    pipeline.start()
+
+    scheduler = PollScheduler([] if LISTENER_SHARDING else TELEGRAM_CHANNELS, base_interval=poll_interval)
+    polls: set[asyncio.Task] = set()
+
+    lease_task = None
+    if LISTENER_SHARDING:
+        async def on_leases_changed(acquired: set[str], released: set[str]):
+            if acquired:
+                # Another worker may have advanced these channels since we last saw them
+                await watermarks.load(sorted(acquired))
+            scheduler.set_channels(lease_manager.owned)
+
+        lease_manager = LeaseManager(TELEGRAM_CHANNELS, on_change=on_leases_changed, before_sync=watermarks.flush)
+        lease_task = asyncio.create_task(lease_manager.run())
+
+    try:
+        async with create_session() as session:
+            while True:
+                for channel in scheduler.due():
+                    task = asyncio.create_task(poll_channel(channel, session, pipeline, scheduler))
+                    polls.add(task)
+                    task.add_done_callback(polls.discard)
+
+                await asyncio.sleep(scheduler.next_delay())
+    finally:
+        for task in polls:
+            task.cancel()
+        await asyncio.gather(*polls, return_exceptions=True)
+        await pipeline.stop()
+        watermarks_task.cancel()
+        await asyncio.gather(watermarks_task, return_exceptions=True)
+        if lease_task:
+            # Released only after the last watermarks are flushed, so the next owner does not redo our posts
+            lease_task.cancel()
+            await asyncio.gather(lease_task, return_exceptions=True)
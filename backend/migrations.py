@@ -0,0 +1,391 @@
+import asyncpg
+from logger import logger
+
+# Serializes migrations between processes starting at the same time (API, extra listener workers)
+MIGRATION_LOCK_ID = 48151623
+
+# Everything the schema had before migrations were versioned. All statements are idempotent, so existing
+# databases that were created by the old ad-hoc initialization pass through it unchanged.
+BASELINE = [
+    """
+    CREATE TABLE IF NOT EXISTS attacks (
+        id SERIAL PRIMARY KEY,
+        region TEXT,
+        attack_type TEXT,
+        status TEXT,
+        source TEXT,
+        timestamp TEXT
+    );
+    """,
+    # Statement-level trigger: a bulk insert sends one notification per affected region
+    # (with the latest row of each attack type), not one per row
+    """
+    CREATE OR REPLACE FUNCTION notify_attack_changes()
+    RETURNS trigger AS $$
+    DECLARE
+        r RECORD;
+    BEGIN
+        FOR r IN
+            SELECT region, json_agg(json_build_object('attack_type', attack_type, 'status', status, 'id', id)) AS updates
+            FROM (
+                SELECT DISTINCT ON (region, attack_type) region, attack_type, status, id
+                FROM new_rows
+                ORDER BY region, attack_type, id DESC
+            ) latest
+            GROUP BY region
+        LOOP
+            PERFORM pg_notify('attack_updates', json_build_object('region', r.region, 'updates', r.updates)::text);
+        END LOOP;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+    """,
+    """
+    DO $$
+    BEGIN
+        DROP TRIGGER IF EXISTS attack_insert_trigger ON attacks;
+        DROP FUNCTION IF EXISTS notify_attack_change();
+        IF NOT EXISTS (
+            SELECT 1 FROM pg_trigger WHERE tgname = 'attack_insert_stmt_trigger'
+        ) THEN
+            CREATE TRIGGER attack_insert_stmt_trigger
+            AFTER INSERT ON attacks
+            REFERENCING NEW TABLE AS new_rows
+            FOR EACH STATEMENT
+            EXECUTE FUNCTION notify_attack_changes();
+        END IF;
+    END;
+    $$;
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_region_attack_type
+    ON attacks(region, attack_type);
+    """,
+    # Latest status per (region, attack_type), maintained by a trigger in the inserting transaction,
+    # so reads never have to scan the history with DISTINCT ON
+    """
+    CREATE TABLE IF NOT EXISTS current_status (
+        region TEXT NOT NULL,
+        attack_type TEXT NOT NULL,
+        status TEXT NOT NULL,
+        attack_id INT NOT NULL,
+        changed_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+        version BIGINT NOT NULL DEFAULT 1,
+        PRIMARY KEY (region, attack_type)
+    );
+    """,
+    """
+    CREATE OR REPLACE FUNCTION update_current_status()
+    RETURNS trigger AS $$
+    BEGIN
+        INSERT INTO current_status AS cs (region, attack_type, status, attack_id, changed_at)
+        SELECT DISTINCT ON (region, attack_type) region, attack_type, status, id, now()
+        FROM new_rows
+        ORDER BY region, attack_type, id DESC
+        ON CONFLICT (region, attack_type) DO UPDATE
+        SET status = EXCLUDED.status,
+            attack_id = EXCLUDED.attack_id,
+            changed_at = EXCLUDED.changed_at,
+            version = cs.version + 1
+        WHERE cs.attack_id < EXCLUDED.attack_id;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+    """,
+    """
+    DO $$
+    BEGIN
+        IF NOT EXISTS (
+            SELECT 1 FROM pg_trigger WHERE tgname = 'attack_current_status_trigger'
+        ) THEN
+            CREATE TRIGGER attack_current_status_trigger
+            AFTER INSERT ON attacks
+            REFERENCING NEW TABLE AS new_rows
+            FOR EACH STATEMENT
+            EXECUTE FUNCTION update_current_status();
+        END IF;
+    END;
+    $$;
+    """,
+    # One-off backfill for databases that already had history before current_status existed
+    """
+    INSERT INTO current_status (region, attack_type, status, attack_id)
+    SELECT DISTINCT ON (region, attack_type) region, attack_type, status, id
+    FROM attacks
+    WHERE NOT EXISTS (SELECT 1 FROM current_status)
+    ORDER BY region, attack_type, id DESC
+    ON CONFLICT DO NOTHING;
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS subscriptions (
+        id SERIAL PRIMARY KEY,
+        user_id BIGINT,
+        region TEXT,
+        is_banned BOOLEAN DEFAULT FALSE,
+        UNIQUE(user_id, region)
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS listener_watermarks (
+        channel TEXT PRIMARY KEY,
+        post_id BIGINT NOT NULL,
+        content_hash TEXT,
+        fetched_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS listener_workers (
+        worker_id TEXT PRIMARY KEY,
+        heartbeat_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS channel_leases (
+        channel TEXT PRIMARY KEY,
+        owner TEXT,
+        expires_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS analyzer_cache (
+        key TEXT PRIMARY KEY,
+        result TEXT NOT NULL,
+        created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS analyzer_calls (
+        created_at TIMESTAMPTZ NOT NULL,
+        channel TEXT NOT NULL,
+        provider TEXT,
+        model TEXT,
+        latency_ms INT NOT NULL,
+        first_entry_ms INT,
+        prompt_tokens INT,
+        completion_tokens INT,
+        cache_hit BOOLEAN NOT NULL,
+        rule_hit BOOLEAN NOT NULL,
+        fallback TEXT,
+        hedged BOOLEAN NOT NULL,
+        failsafe BOOLEAN NOT NULL,
+        entries SMALLINT NOT NULL,
+        batch_size SMALLINT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS analyzer_calls_created_at_brin ON analyzer_calls USING brin (created_at);
+    """,
+]
+
+TYPED_TIMESTAMPS = [
+    """
+    DO $$
+    BEGIN
+        IF (
+            SELECT data_type FROM information_schema.columns
+            WHERE table_name = 'attacks' AND column_name = 'timestamp'
+        ) = 'text' THEN
+            ALTER TABLE attacks
+            ALTER COLUMN timestamp TYPE TIMESTAMPTZ
+            USING to_timestamp(timestamp, 'HH24:MI:SS DD-MM-YYYY')::timestamp AT TIME ZONE 'Europe/Moscow';
+        END IF;
+    END;
+    $$;
+    """,
+    """
+    ALTER TABLE attacks ALTER COLUMN timestamp SET DEFAULT now();
+    """,
+]
+
+COVERING_INDEXES = [
+    # Latest status of one pair: index-only scan
+    """
+    CREATE INDEX IF NOT EXISTS attacks_region_type_id_idx
+    ON attacks (region, attack_type, id DESC) INCLUDE (status);
+    """,
+    # Recent history of a region (/status): index-only scan
+    """
+    CREATE INDEX IF NOT EXISTS attacks_region_id_idx
+    ON attacks (region, id DESC) INCLUDE (attack_type, status, source, timestamp);
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS attacks_timestamp_brin
+    ON attacks USING brin (timestamp);
+    """,
+    # Superseded by attacks_region_type_id_idx
+    """
+    DROP INDEX IF EXISTS idx_region_attack_type;
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS subscriptions_region_idx
+    ON subscriptions (region) INCLUDE (user_id);
+    """,
+]
+
+PARTITIONED_ATTACKS = [
+    # Partitions are named after their lower bound in UTC (attacks_p20250101). A range that overlaps partitions
+    # made with another interval is skipped, the default partition catches rows in such gaps. Rows of a new range
+    # already sitting in the default partition are moved into the new partition before it is attached.
+    """
+    CREATE OR REPLACE FUNCTION ensure_attack_partitions(unit TEXT, from_ts TIMESTAMPTZ, to_ts TIMESTAMPTZ)
+    RETURNS INT AS $$
+    DECLARE
+        step INTERVAL := ('1 ' || unit)::interval;
+        lower_bound TIMESTAMP := date_trunc(unit, from_ts AT TIME ZONE 'UTC');
+        part_name TEXT;
+        created INT := 0;
+    BEGIN
+        WHILE lower_bound <= to_ts AT TIME ZONE 'UTC' LOOP
+            part_name := 'attacks_p' || to_char(lower_bound, 'YYYYMMDD');
+            IF to_regclass(part_name) IS NULL THEN
+                BEGIN
+                    EXECUTE format(
+                        'CREATE TABLE %I PARTITION OF attacks FOR VALUES FROM (%L) TO (%L)',
+                        part_name, lower_bound AT TIME ZONE 'UTC', (lower_bound + step) AT TIME ZONE 'UTC'
+                    );
+                    created := created + 1;
+                EXCEPTION
+                    WHEN invalid_object_definition THEN
+                        NULL;
+                    WHEN check_violation THEN
+                        BEGIN
+                            EXECUTE format('CREATE TABLE %I (LIKE attacks INCLUDING DEFAULTS)', part_name);
+                            EXECUTE format(
+                                'WITH moved AS (DELETE FROM attacks_default WHERE timestamp >= %L AND timestamp < %L RETURNING *) '
+                                'INSERT INTO %I SELECT * FROM moved',
+                                lower_bound AT TIME ZONE 'UTC', (lower_bound + step) AT TIME ZONE 'UTC', part_name
+                            );
+                            EXECUTE format(
+                                'ALTER TABLE attacks ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                                part_name, lower_bound AT TIME ZONE 'UTC', (lower_bound + step) AT TIME ZONE 'UTC'
+                            );
+                            created := created + 1;
+                        EXCEPTION
+                            WHEN invalid_object_definition THEN
+                                NULL;
+                        END;
+                END;
+            END IF;
+            lower_bound := lower_bound + step;
+        END LOOP;
+        RETURN created;
+    END;
+    $$ LANGUAGE plpgsql;
+    """,
+    # The sequence is kept, so ids continue where the old table stopped. The partition key has to be part of the
+    # primary key, hence (id, timestamp) and a NOT NULL timestamp.
+    """
+    ALTER SEQUENCE attacks_id_seq OWNED BY NONE;
+    ALTER TABLE attacks RENAME TO attacks_unpartitioned;
+    ALTER TABLE attacks_unpartitioned RENAME CONSTRAINT attacks_pkey TO attacks_unpartitioned_pkey;
+    CREATE TABLE attacks (
+        id INT NOT NULL DEFAULT nextval('attacks_id_seq'),
+        region TEXT,
+        attack_type TEXT,
+        status TEXT,
+        source TEXT,
+        timestamp TIMESTAMPTZ NOT NULL DEFAULT now(),
+        PRIMARY KEY (id, timestamp)
+    ) PARTITION BY RANGE (timestamp);
+    ALTER SEQUENCE attacks_id_seq OWNED BY attacks.id;
+    CREATE TABLE attacks_default PARTITION OF attacks DEFAULT;
+    """,
+    # Everything lands in the default partition; the partitions themselves depend on ATTACKS_PARTITION_INTERVAL and
+    # are split off by PartitionMaintainer (partitions.py) at startup. Rows without a timestamp (written before it
+    # was typed) are the oldest ones and get the earliest known timestamp.
+    """
+    INSERT INTO attacks (id, region, attack_type, status, source, timestamp)
+    SELECT id, region, attack_type, status, source,
+           COALESCE(timestamp, (SELECT min(timestamp) FROM attacks_unpartitioned), now())
+    FROM attacks_unpartitioned;
+    DROP TABLE attacks_unpartitioned;
+    """,
+    # Partitioned indexes; the BRIN on timestamp is replaced by partition pruning
+    """
+    CREATE INDEX attacks_region_type_id_idx ON attacks (region, attack_type, id DESC) INCLUDE (status);
+    CREATE INDEX attacks_region_id_idx ON attacks (region, id DESC) INCLUDE (attack_type, status, source, timestamp);
+    """,
+    # Created after the copy, so moving the history neither notifies nor touches current_status
+    """
+    CREATE TRIGGER attack_insert_stmt_trigger
+    AFTER INSERT ON attacks
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION notify_attack_changes();
+    CREATE TRIGGER attack_current_status_trigger
+    AFTER INSERT ON attacks
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION update_current_status();
+    """,
+]
+
+# One notification per user and statement, so /subscribe all is a single message. Payloads over the NOTIFY
+# limit (8000 bytes) are replaced by a request to reload that user's subscriptions.
+SUBSCRIPTION_NOTIFICATIONS = [
+    """
+    CREATE OR REPLACE FUNCTION notify_subscription_changes()
+    RETURNS trigger AS $$
+    DECLARE
+        r RECORD;
+        payload TEXT;
+    BEGIN
+        FOR r IN
+            SELECT user_id, json_agg(region) AS regions
+            FROM changed_rows
+            WHERE region IS NOT NULL
+            GROUP BY user_id
+        LOOP
+            payload := json_build_object('op', TG_ARGV[0], 'user_id', r.user_id, 'regions', r.regions)::text;
+            IF octet_length(payload) > 7900 THEN
+                payload := json_build_object('op', 'reload', 'user_id', r.user_id)::text;
+            END IF;
+            PERFORM pg_notify('subscription_updates', payload);
+        END LOOP;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+    """,
+    # Transition tables allow only one event per trigger
+    """
+    CREATE TRIGGER subscriptions_insert_notify
+    AFTER INSERT ON subscriptions
+    REFERENCING NEW TABLE AS changed_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION notify_subscription_changes('add');
+    CREATE TRIGGER subscriptions_delete_notify
+    AFTER DELETE ON subscriptions
+    REFERENCING OLD TABLE AS changed_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION notify_subscription_changes('remove');
+    """,
+]
+
+# Append only: a released migration is never edited, changes go into a new version
+MIGRATIONS: list[tuple[int, str, list[str]]] = [
+    (1, "baseline schema", BASELINE),
+    (2, "attacks.timestamp as timestamptz", TYPED_TIMESTAMPS),
+    (3, "covering indexes for history and subscriber lookups", COVERING_INDEXES),
+    (4, "attacks partitioned by time", PARTITIONED_ATTACKS),
+    (5, "notifications on subscription changes", SUBSCRIPTION_NOTIFICATIONS),
+]
+
+async def run_migrations(conn: asyncpg.Connection):
+    await conn.execute("""
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INT PRIMARY KEY,
+        name TEXT NOT NULL,
+        applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    );
+    """)
+    await conn.execute("SELECT pg_advisory_lock($1)", MIGRATION_LOCK_ID)
+    try:
+        applied = {r["version"] for r in await conn.fetch("SELECT version FROM schema_migrations")}
+        for version, name, statements in MIGRATIONS:
+            if version in applied:
+                continue
+            async with conn.transaction():
+                for statement in statements:
+                    await conn.execute(statement)
+                await conn.execute("INSERT INTO schema_migrations (version, name) VALUES ($1, $2)", version, name)
+            logger.info(f"[DB] Applied migration {version}: {name}")
+    finally:
+        await conn.execute("SELECT pg_advisory_unlock($1)", MIGRATION_LOCK_ID)
@@ -0,0 +1,71 @@
+import asyncio
+import gzip
+import os
+from datetime import datetime, timedelta, timezone
+import db
+from logger import logger
+
+# Range of one attacks partition; also the unit of ATTACKS_PARTITIONS_AHEAD
+ATTACKS_PARTITION_INTERVAL = os.getenv("ATTACKS_PARTITION_INTERVAL", "month").lower()
+if ATTACKS_PARTITION_INTERVAL not in ("day", "week", "month", "year"):
+    raise ValueError(f"ATTACKS_PARTITION_INTERVAL must be day, week, month or year, got {ATTACKS_PARTITION_INTERVAL!r}")
+ATTACKS_PARTITIONS_AHEAD = int(os.getenv("ATTACKS_PARTITIONS_AHEAD", 2))
+# 0 keeps every partition
+ATTACKS_RETENTION_DAYS = float(os.getenv("ATTACKS_RETENTION_DAYS", 365))
+ATTACKS_ARCHIVE_DIR = os.getenv("ATTACKS_ARCHIVE_DIR", "archive")
+PARTITION_MAINTENANCE_SEC = float(os.getenv("PARTITION_MAINTENANCE_SEC", 3600))
+
+class PartitionMaintainer:
+    # Keeps ATTACKS_PARTITIONS_AHEAD future partitions of attacks, splits partitions for rows waiting in the default
+    # partition (the history copied in by the partitioning migration) and moves partitions older than the retention
+    # period out of the database: detach, export to <archive_dir>/<partition>.csv.gz, drop.
+    def __init__(
+        self,
+        unit: str = ATTACKS_PARTITION_INTERVAL,
+        ahead: int = ATTACKS_PARTITIONS_AHEAD,
+        retention_days: float = ATTACKS_RETENTION_DAYS,
+        archive_dir: str = ATTACKS_ARCHIVE_DIR,
+        interval: float = PARTITION_MAINTENANCE_SEC,
+    ):
+        self.unit = unit
+        self.ahead = ahead
+        self.retention_days = retention_days
+        self.archive_dir = archive_dir
+        self.interval = interval
+
+    async def archive(self, name: str):
+        os.makedirs(self.archive_dir, exist_ok=True)
+        path = os.path.join(self.archive_dir, f"{name}.csv.gz")
+        tmp_path = f"{path}.part"
+        archive = await asyncio.to_thread(gzip.open, tmp_path, "wb")
+        try:
+            async def write(chunk: bytes):
+                await asyncio.to_thread(archive.write, chunk)
+
+            await db.export_partition(name, write)
+        finally:
+            await asyncio.to_thread(archive.close)
+        # The table is dropped only once the complete archive is in place
+        os.replace(tmp_path, path)
+        await db.drop_partition(name)
+        logger.info(f"[PARTITIONS] Archived {name} to {path}")
+
+    async def maintain(self):
+        if self.retention_days <= 0:
+            await db.ensure_attack_partitions(self.unit, self.ahead)
+            return
+        cutoff = datetime.now(timezone.utc) - timedelta(days=self.retention_days)
+        await db.ensure_attack_partitions(self.unit, self.ahead, since=cutoff)
+        await db.detach_expired_partitions(cutoff)
+        for name in await db.get_detached_partitions():
+            await self.archive(name)
+
+    async def run(self):
+        while True:
+            try:
+                await self.maintain()
+            except Exception:
+                logger.error("[PARTITIONS] Maintenance failed", exc_info=True)
+            await asyncio.sleep(self.interval)
+
+partition_maintainer = PartitionMaintainer()
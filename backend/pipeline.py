@@ -0,0 +1,39 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Hashable
+from logger import logger
+
+class ShardedQueue:
+    def __init__(self, shards: int, maxsize: int = 0):
+        self.queues = [asyncio.Queue(maxsize) for _ in range(max(1, shards))]
+
+    def shard(self, key: Hashable) -> asyncio.Queue:
+        return self.queues[hash(key) % len(self.queues)]
+
+    async def put(self, key: Hashable, item: Any):
+        await self.shard(key).put(item)
+
+    async def join(self):
+        for queue in self.queues:
+            await queue.join()
+
+    def partition(self, items: list, key: Callable[[Any], Hashable]) -> list[tuple[asyncio.Queue, list]]:
+        # Splits a bulk update so every shard gets the items it would have received one by one
+        groups: dict[int, list] = {}
+        for item in items:
+            groups.setdefault(hash(key(item)) % len(self.queues), []).append(item)
+        return [(self.queues[i], group) for i, group in groups.items()]
+
+def start_workers(name: str, count: int, queue: asyncio.Queue, handler: Callable[[Any], Awaitable[None]]) -> list[asyncio.Task]:
+    async def worker(index: int):
+        while True:
+            item = await queue.get()
+            try:
+                await handler(item)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.error(f"[PIPE] {name} worker #{index} failed to handle item", exc_info=True)
+            finally:
+                queue.task_done()
+
+    return [asyncio.create_task(worker(i), name=f"{name}-{i}") for i in range(max(1, count))]
@@ -0,0 +1,261 @@
+import asyncio
+import os
+import re
+from typing import AsyncIterator, Optional
+import openai
+from openai import AsyncOpenAI
+from ollama import AsyncClient
+from scheduler import CircuitBreaker
+from ledger import CallRecord
+from logger import logger
+
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "o3-mini")
+OLLAMA_MODEL = os.getenv("OLLAMA_MODEL")
+OLLAMA_HOST = os.getenv("OLLAMA_HOST", "https://ollama.com")
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", 30))
+OLLAMA_TIMEOUT = float(os.getenv("OLLAMA_TIMEOUT", 60))
+FAKE_PROVIDER_RESULT = os.getenv("FAKE_PROVIDER_RESULT", "")
+FAKE_PROVIDER_DELAY = float(os.getenv("FAKE_PROVIDER_DELAY", 0))
+FAKE_PROVIDER_FAIL = os.getenv("FAKE_PROVIDER_FAIL", "false").lower() in ("1", "true", "yes")
+
+ANALYZER_PROVIDERS = [p.strip() for p in os.getenv("ANALYZER_PROVIDERS", "openai,ollama").split(",") if p.strip()]
+ANALYZER_HEDGE_AFTER = float(os.getenv("ANALYZER_HEDGE_AFTER", 0)) or None
+ANALYZER_BREAKER_FAILURES = int(os.getenv("ANALYZER_BREAKER_FAILURES", 3))
+ANALYZER_BREAKER_COOLDOWN = float(os.getenv("ANALYZER_BREAKER_COOLDOWN", 60))
+
+TEXT_MARKER = "Текст для анализа:\n"
+
+class AllProvidersFailed(Exception):
+    pass
+
+class Provider:
+    name = "provider"
+    tag = "[LLM]"
+
+    def __init__(self, model: Optional[str], timeout: float):
+        self.model = model
+        self.timeout = timeout
+        self.breaker = CircuitBreaker(ANALYZER_BREAKER_FAILURES, ANALYZER_BREAKER_COOLDOWN)
+
+    def stream(self, messages: list[dict], usage: dict) -> AsyncIterator[str]:
+        # Implementations fill usage["prompt_tokens"] / usage["completion_tokens"] when the provider reports them
+        raise NotImplementedError
+
+    def describe_error(self, error: Exception) -> str:
+        if isinstance(error, asyncio.TimeoutError):
+            return f"no answer in {self.timeout}s"
+        return f"{type(error).__name__}: {error}"
+
+class OpenAIProvider(Provider):
+    name = "openai"
+    tag = "[GPT]"
+
+    def __init__(self):
+        super().__init__(OPENAI_MODEL, OPENAI_TIMEOUT)
+        self.client = AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            timeout=OPENAI_TIMEOUT,
+            max_retries=0,
+        )
+
+    async def stream(self, messages: list[dict], usage: dict) -> AsyncIterator[str]:
+        response = await self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+        async for chunk in response:
+            if chunk.usage:
+                usage["prompt_tokens"] = chunk.usage.prompt_tokens
+                usage["completion_tokens"] = chunk.usage.completion_tokens
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+    def describe_error(self, error: Exception) -> str:
+        if isinstance(error, openai.RateLimitError): return "rate limit exceeded"
+        if isinstance(error, openai.PermissionDeniedError): return "unsupported request country"
+        if isinstance(error, openai.AuthenticationError): return "authentication error"
+        if isinstance(error, openai.APITimeoutError): return f"no answer in {self.timeout}s"
+        return super().describe_error(error)
+
+class OllamaProvider(Provider):
+    name = "ollama"
+    tag = "[OLLAMA]"
+
+    def __init__(self):
+        super().__init__(OLLAMA_MODEL, OLLAMA_TIMEOUT)
+        self.client = AsyncClient(
+            host=OLLAMA_HOST,
+            headers={"Authorization": f"Bearer {os.getenv("OLLAMA_API_KEY")}"},
+            timeout=OLLAMA_TIMEOUT,
+        )
+
+    async def stream(self, messages: list[dict], usage: dict) -> AsyncIterator[str]:
+        async for part in await self.client.chat(self.model, messages=messages, stream=True):
+            if part.get('done'):
+                usage["prompt_tokens"] = part.get('prompt_eval_count')
+                usage["completion_tokens"] = part.get('eval_count')
+            yield part['message']['content']
+
+class FakeProvider(Provider):
+    name = "fake"
+    tag = "[FAKE]"
+
+    def __init__(
+        self,
+        result: Optional[str] = None,
+        delay: float = FAKE_PROVIDER_DELAY,
+        fail: bool = FAKE_PROVIDER_FAIL,
+        fail_after: Optional[int] = None,
+        name: str = "fake",
+        timeout: float = OPENAI_TIMEOUT,
+    ):
+        super().__init__("fake", timeout)
+        # A fixed result skips the rule classifier; fail_after breaks the stream after that many chunks
+        self.result = result
+        self.delay = delay
+        self.fail = fail
+        self.fail_after = fail_after
+        self.name = name
+        self.calls = 0
+
+    def answer(self, text: str) -> str:
+        if self.result is not None:
+            return self.result
+        from classifier import classify
+
+        return classify(text, None) or FAKE_PROVIDER_RESULT
+
+    async def stream(self, messages: list[dict], usage: dict) -> AsyncIterator[str]:
+        # Offline stand-in for local runs and tests: answers with the rule classifier or a fixed result
+        self.calls += 1
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("fake provider configured to fail")
+        content = messages[-1]["content"]
+        numbered = re.split(r"^\[(\d+)\]$", content, flags=re.M)
+        if len(numbered) > 1:
+            # Batched prompt: one "N: result" line per numbered message
+            chunks = [
+                f"{number}: {self.answer(body.rsplit(TEXT_MARKER, 1)[-1].strip())}\n"
+                for number, body in zip(numbered[1::2], numbered[2::2])
+            ]
+        else:
+            entries = self.answer(content.rsplit(TEXT_MARKER, 1)[-1].strip()).split(",")
+            chunks = [entry + ("," if i < len(entries) - 1 else "") for i, entry in enumerate(entries)]
+        for i, chunk in enumerate(chunks):
+            if i == self.fail_after:
+                raise RuntimeError(f"fake provider failed after {i} chunks")
+            if i and self.delay:
+                await asyncio.sleep(self.delay)
+            yield chunk
+
+PROVIDER_CLASSES = {
+    "openai": OpenAIProvider,
+    "ollama": OllamaProvider,
+    "fake": FakeProvider,
+}
+
+def build_providers(names: list[str] = ANALYZER_PROVIDERS) -> list[Provider]:
+    providers = []
+    for name in names:
+        if name not in PROVIDER_CLASSES:
+            logger.error(f"[ROUTER] Unknown analyzer provider '{name}', skipping")
+            continue
+        providers.append(PROVIDER_CLASSES[name]())
+    return providers
+
+class ProviderRouter:
+    def __init__(self, providers: list[Provider], hedge_after: Optional[float] = ANALYZER_HEDGE_AFTER):
+        self.providers = providers
+        self.hedge_after = hedge_after
+
+    def candidates(self) -> list[Provider]:
+        healthy = [p for p in self.providers if p.breaker.allow()]
+        # Every circuit open: still try them in order rather than failing every message
+        return healthy or list(self.providers)
+
+    async def _pump(self, provider: Provider, messages: list[dict], out: asyncio.Queue):
+        logger.info(f"{provider.tag} Analyzing message using {provider.name} (model {provider.model})")
+        result = ""
+        usage = {}
+        try:
+            async with asyncio.timeout(provider.timeout):
+                async for chunk in provider.stream(messages, usage):
+                    result += chunk
+                    await out.put((provider, chunk))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if provider.breaker.record_failure():
+                logger.warning(f"[ROUTER] Circuit opened for {provider.name} for {provider.breaker.cooldown:.0f}s")
+            logger.error(f"{provider.tag} Error in analyze_message(), {provider.describe_error(e)}")
+            await out.put((provider, e))
+            return
+        provider.breaker.record_success()
+        logger.info(f"{provider.tag} Analysis result: {result.strip()}")
+        await out.put((provider, usage))
+
+    async def stream(self, messages: list[dict], call: Optional[CallRecord] = None) -> AsyncIterator[tuple[Provider, Optional[str]]]:
+        # Yields (provider, chunk). When the answering provider fails mid-stream (provider, None) is yielded and the
+        # next one starts from scratch: callers either drop the partial output or stop consuming.
+        queue = self.candidates()
+        out: asyncio.Queue = asyncio.Queue()
+        running: dict[Provider, asyncio.Task] = {}
+        winner: Optional[Provider] = None
+
+        def launch():
+            provider = queue.pop(0)
+            running[provider] = asyncio.create_task(self._pump(provider, messages, out))
+
+        launch()
+        try:
+            while running:
+                # Hedging only races for the first chunk, once a provider is answering it is not interrupted
+                timeout = self.hedge_after if winner is None and queue and self.hedge_after else None
+                try:
+                    provider, item = await asyncio.wait_for(out.get(), timeout)
+                except asyncio.TimeoutError:
+                    logger.info(f"[ROUTER] No answer in {self.hedge_after}s, hedging with {queue[0].name}")
+                    if call:
+                        call.hedged = True
+                    launch()
+                    continue
+                if provider not in running:
+                    continue
+                if isinstance(item, str):
+                    if winner is None:
+                        winner = provider
+                        hedges = [p for p in running if p is not provider]
+                        for other in hedges:
+                            running.pop(other).cancel()
+                        # Still healthy, they are the fallback should the winner fail later
+                        queue[:0] = hedges
+                    yield provider, item
+                    continue
+                running.pop(provider)
+                if isinstance(item, dict):
+                    if call:
+                        call.provider, call.model = provider.name, provider.model
+                        call.prompt_tokens = item.get("prompt_tokens")
+                        call.completion_tokens = item.get("completion_tokens")
+                    return
+                if call:
+                    call.fallbacks.append(f"{provider.name}: {provider.describe_error(item)}")
+                if provider is winner:
+                    winner = None
+                    yield provider, None
+                if queue and not running:
+                    launch()
+        finally:
+            for task in running.values():
+                task.cancel()
+        raise AllProvidersFailed("every analyzer provider failed")
+
+    def stats(self) -> dict:
+        return {
+            p.name: {"model": p.model, "circuit": p.breaker.state, "failures": p.breaker.failures}
+            for p in self.providers
+        }
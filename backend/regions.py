@@ -0,0 +1,213 @@
+import re
+from typing import Optional
+from config import REGIONS
+
+# GeoJSON names used by the map (frontend/js/map.js, nameMap) that differ from the official ones
+MAP_ALIASES = {
+    "Адыгея": "Республика Адыгея",
+    "Алтай": "Республика Алтай",
+    "Башкортостан": "Республика Башкортостан",
+    "Бурятия": "Республика Бурятия",
+    "Дагестан": "Республика Дагестан",
+    "Ингушетия": "Республика Ингушетия",
+    "Марий Эл": "Республика Марий Эл",
+    "Северная Осетия - Алания": "Республика Северная Осетия (Алания)",
+    "Татарстан": "Республика Татарстан",
+    "Тыва": "Республика Тыва",
+    "Чувашия": "Чувашская Республика",
+    "Ханты-Мансийский автономный округ - Югра": "Ханты-Мансийский автономный округ",
+    "Автономна Республіка Крим": "Республика Крым",
+    "Донецька область": "Донецкая Народная Республика",
+    "Луганська область": "Луганская Народная Республика",
+    "Запорізька область": "Запорожская область",
+    "Херсонська область": "Херсонская область",
+    "м. Севастополь": "Севастополь",
+}
+
+# Official long forms from the Constitution that add an appositive to the name used in REGIONS
+LONG_FORM_ALIASES = {
+    "Кемеровская область - Кузбасс": "Кемеровская область",
+    "Чувашская Республика - Чувашия": "Чувашская Республика",
+    "Республика Северная Осетия - Алания": "Республика Северная Осетия (Алания)",
+    "Республика Адыгея (Адыгея)": "Республика Адыгея",
+    "Республика Татарстан (Татарстан)": "Республика Татарстан",
+}
+
+# Short and colloquial names seen in channel posts and model answers
+EXTRA_ALIASES = {
+    "Горный Алтай": "Республика Алтай",
+    "Башкирия": "Республика Башкортостан",
+    "КБР": "Кабардино-Балкарская Республика",
+    "Кабардино-Балкария": "Кабардино-Балкарская Республика",
+    "КЧР": "Карачаево-Черкесская Республика",
+    "Карачаево-Черкесия": "Карачаево-Черкесская Республика",
+    "Крым": "Республика Крым",
+    "Якутия": "Республика Саха (Якутия)",
+    "Саха": "Республика Саха (Якутия)",
+    "Северная Осетия": "Республика Северная Осетия (Алания)",
+    "Алания": "Республика Северная Осетия (Алания)",
+    "Тува": "Республика Тыва",
+    "Удмуртия": "Удмуртская Республика",
+    "Хакасия": "Республика Хакасия",
+    "Чечня": "Чеченская Республика",
+    "Калмыкия": "Республика Калмыкия",
+    "Карелия": "Республика Карелия",
+    "Коми": "Республика Коми",
+    "Мордовия": "Республика Мордовия",
+    "Кузбасс": "Кемеровская область",
+    "Подмосковье": "Московская область",
+    "Кубань": "Краснодарский край",
+    "Ставрополье": "Ставропольский край",
+    "Приморье": "Приморский край",
+    "Забайкалье": "Забайкальский край",
+    "Прикамье": "Пермский край",
+    "Мск": "Москва",
+    "СПб": "Санкт-Петербург",
+    "Петербург": "Санкт-Петербург",
+    "ЕАО": "Еврейская автономная область",
+    "НАО": "Ненецкий автономный округ",
+    "ХМАО": "Ханты-Мансийский автономный округ",
+    "Югра": "Ханты-Мансийский автономный округ",
+    "Чукотка": "Чукотский автономный округ",
+    "ЯНАО": "Ямало-Ненецкий автономный округ",
+    "Ямал": "Ямало-Ненецкий автономный округ",
+    "ДНР": "Донецкая Народная Республика",
+    "ЛНР": "Луганская Народная Республика",
+    "РФ": "Россия",
+}
+
+# Shared with the gazetteer, so the resolver and the prompt prefilter know the same names
+ALIASES = MAP_ALIASES | LONG_FORM_ALIASES | EXTRA_ALIASES
+
+# Words naming the kind of subject; dropped to get the core name ("Курской области" -> "курской")
+KIND_WORDS = {"область", "обл", "край", "республика", "округ", "автономный", "автономная", "народная", "ао", "респ"}
+INDECLINABLE = {"марий", "эл", "коми", "саха", "ханты", "ямало", "кабардино", "карачаево", "санкт"}
+# Feminine nouns in "-ь", declined unlike "Севастополь" or "Ярославль"
+FEMININE_SOFT = {"кубань"}
+SOFT_STEMS = tuple("кгхжшчщ")
+CASES = 6
+
+def normalize_name(name: str) -> str:
+    name = name.lower().replace("ё", "е")
+    name = re.sub(r"\s*[-–—]\s*", "-", name)
+    name = re.sub(r"[^\w\s()-]", " ", name)
+    return " ".join(name.split())
+
+def _word_forms(word: str) -> list[str]:
+    # Nominative, genitive, dative, accusative, instrumental, prepositional
+    if "-" in word:
+        head, _, tail = word.rpartition("-")
+        return [f"{head}-{form}" for form in _word_forms(tail)]
+    if word in INDECLINABLE or word.startswith("(") or len(word) < 3:
+        return [word] * CASES
+    if word.endswith("ая"):
+        s = word[:-2]
+        return [word, s + "ой", s + "ой", s + "ую", s + "ой", s + "ой"]
+    if word.endswith(("ий", "ый")):
+        s = word[:-2]
+        return [word, s + "ого", s + "ому", word, s + ("им" if word.endswith("ий") else "ым"), s + "ом"]
+    if word == "область":
+        return [word, "области", "области", word, "областью", "области"]
+    if word.endswith(("ия", "ея")):
+        s = word[:-1]
+        soft = "и" if word.endswith("ия") else "е"
+        return [word, s + "и", s + soft, s + "ю", s + "ей", s + soft]
+    if word.endswith("я"):
+        s = word[:-1]
+        return [word, s + "и", s + "е", s + "ю", s + "ей", s + "е"]
+    if word.endswith("ье"):
+        s = word[:-1]
+        return [word, s + "я", s + "ю", word, s + "ем", word]
+    if word.endswith("а"):
+        s = word[:-1]
+        return [word, s + ("и" if s.endswith(SOFT_STEMS) else "ы"), s + "е", s + "у", s + "ой", s + "е"]
+    if word in FEMININE_SOFT:
+        s = word[:-1]
+        return [word, s + "и", s + "и", word, s + "ью", s + "и"]
+    if word.endswith(("ь", "й")):
+        s = word[:-1]
+        return [word, s + "я", s + "ю", word, s + "ем", s + "е"]
+    if word[-1] in "аеиоуыэюя":
+        return [word] * CASES
+    return [word, word + "а", word + "у", word, word + "ом", word + "е"]
+
+KIND_FORMS = {form for word in KIND_WORDS for form in _word_forms(word)}
+
+def core_name(key: str) -> str:
+    return " ".join(w for w in key.split() if w not in KIND_FORMS)
+
+def _phrase_cases(name: str) -> list[str]:
+    words = [_word_forms(w) for w in normalize_name(name).split()]
+    return [" ".join(w[case] for w in words) for case in range(CASES)]
+
+def phrase_forms(name: str) -> set[str]:
+    # "Кемеровская область - Кузбасс": the appositive after a spaced dash is written both as is and declined
+    # along with the name ("Северной Осетии - Алании")
+    head, *appositive = re.split(r"\s+[-–—]\s+", name, maxsplit=1)
+    if appositive:
+        heads, tails = _phrase_cases(head), _phrase_cases(appositive[0])
+        return {f"{h}-{tails[0]}" for h in heads} | {f"{h}-{t}" for h, t in zip(heads, tails)}
+    return set(_phrase_cases(name))
+
+class RegionResolver:
+    # Built once at import: exact keys (official names, aliases and their case forms), the same keys
+    # without kind words ("курской" for "Курская область"), and a prefix trie for partial names.
+    AMBIGUOUS = object()
+
+    def __init__(self, regions: list[str], aliases: dict[str, str], min_prefix: int = 3):
+        self.regions = regions
+        self.min_prefix = min_prefix
+        self.exact: dict[str, object] = {}
+        self.core: dict[str, object] = {}
+        self.trie: dict = {}
+
+        names = [(region, region) for region in regions] + list(aliases.items())
+        for name, region in names:
+            for key in phrase_forms(name) | {normalize_name(name)}:
+                self._add(self.exact, key, region)
+                core = core_name(key)
+                if core and core != key:
+                    self._add(self.core, core, region)
+                # Every word start is indexed too, so "петербург" finds "санкт-петербург" like a substring match did
+                for start in [0] + [m.end() for m in re.finditer(r"[\s-]", key)]:
+                    self._insert(key[start:], region)
+
+    def _add(self, index: dict, key: str, region: str):
+        if index.get(key, region) != region:
+            index[key] = self.AMBIGUOUS
+        else:
+            index[key] = region
+
+    def _insert(self, key: str, region: str):
+        node = self.trie
+        for char in key:
+            node = node.setdefault(char, {})
+            self._add(node, "", region)
+
+    def resolve(self, name: str) -> Optional[str]:
+        key = normalize_name(name)
+        if not key:
+            return None
+        for index, lookup in ((self.exact, key), (self.core, core_name(key))):
+            region = index.get(lookup)
+            if region is not None:
+                return region if region is not self.AMBIGUOUS else None
+        return self._prefix(key) or self._prefix(core_name(key))
+
+    def _prefix(self, key: str) -> Optional[str]:
+        if len(key) < self.min_prefix:
+            return None
+        node = self.trie
+        for char in key:
+            node = node.get(char)
+            if node is None:
+                return None
+        region = node.get("")
+        # Partial names shared by several subjects ("нов": Новгородская and Новосибирская) are rejected instead of
+        # picking one at random
+        return region if region is not self.AMBIGUOUS else None
+
+resolver = RegionResolver(REGIONS, ALIASES)
+
+def resolve_region(name: str) -> Optional[str]:
+    return resolver.resolve(name)
@@ -0,0 +1,159 @@
+import os
+import random
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Iterable, Optional
+from logger import logger
+
+POLL_MIN_INTERVAL = float(os.getenv("POLL_MIN_INTERVAL", 3))
+POLL_MAX_INTERVAL = float(os.getenv("POLL_MAX_INTERVAL", 120))
+POLL_BACKOFF_FACTOR = float(os.getenv("POLL_BACKOFF_FACTOR", 1.5))
+POLL_JITTER = float(os.getenv("POLL_JITTER", 0.2))
+POLL_FAILURE_THRESHOLD = int(os.getenv("POLL_FAILURE_THRESHOLD", 5))
+POLL_CIRCUIT_COOLDOWN = float(os.getenv("POLL_CIRCUIT_COOLDOWN", 300))
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int, cooldown: float):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.open_until = 0.0
+
+    @property
+    def state(self) -> str:
+        if self.failures < self.failure_threshold:
+            return "closed"
+        return "open" if time.monotonic() < self.open_until else "half-open"
+
+    def allow(self) -> bool:
+        return self.state != "open"
+
+    def record_success(self):
+        self.failures = 0
+        self.open_until = 0.0
+
+    def record_failure(self) -> bool:
+        self.failures += 1
+        if self.failures >= self.failure_threshold:
+            self.open_until = time.monotonic() + self.cooldown
+            return True
+        return False
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+class ChannelSchedule:
+    def __init__(self, interval: float, failure_threshold: int, cooldown: float):
+        self.interval = interval
+        self.next_due = 0.0
+        self.in_flight = False
+        self.polls = 0
+        self.errors = 0
+        self.breaker = CircuitBreaker(failure_threshold, cooldown)
+
+class PollScheduler:
+    def __init__(
+        self,
+        channels: Iterable[str],
+        base_interval: float = 10,
+        min_interval: float = POLL_MIN_INTERVAL,
+        max_interval: float = POLL_MAX_INTERVAL,
+        backoff_factor: float = POLL_BACKOFF_FACTOR,
+        jitter: float = POLL_JITTER,
+        failure_threshold: int = POLL_FAILURE_THRESHOLD,
+        cooldown: float = POLL_CIRCUIT_COOLDOWN,
+    ):
+        self.base_interval = base_interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff_factor = backoff_factor
+        self.jitter = jitter
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.channels: dict[str, ChannelSchedule] = {}
+        self.set_channels(channels)
+
+    def set_channels(self, channels: Iterable[str]):
+        channels = list(channels)
+        for channel in channels:
+            if channel not in self.channels:
+                self.channels[channel] = ChannelSchedule(self.base_interval, self.failure_threshold, self.cooldown)
+        for channel in list(self.channels):
+            if channel not in channels:
+                del self.channels[channel]
+
+    def _schedule(self, state: ChannelSchedule, delay: float):
+        # Jitter keeps channels that share an interval from being polled in lockstep
+        spread = delay * self.jitter
+        state.next_due = time.monotonic() + max(0.0, delay + random.uniform(-spread, spread))
+
+    def due(self) -> list[str]:
+        now = time.monotonic()
+        ready = []
+        for channel, state in self.channels.items():
+            if state.in_flight or state.next_due > now or not state.breaker.allow():
+                continue
+            state.in_flight = True
+            ready.append(channel)
+        return ready
+
+    def next_delay(self) -> float:
+        now = time.monotonic()
+        pending = [s.next_due for s in self.channels.values() if not s.in_flight]
+        if not pending:
+            return self.min_interval
+        return min(max(0.0, min(pending) - now), self.max_interval)
+
+    def record_success(self, channel: str, new_posts: int):
+        state = self.channels.get(channel)
+        if state is None:
+            return
+        state.in_flight = False
+        state.polls += 1
+        state.breaker.record_success()
+        if new_posts:
+            # Channel is active (an attack is likely ongoing): poll it as fast as allowed
+            state.interval = self.min_interval
+        else:
+            state.interval = min(self.max_interval, max(state.interval, self.min_interval) * self.backoff_factor)
+        self._schedule(state, state.interval)
+
+    def record_error(self, channel: str, retry_after: Optional[float] = None):
+        state = self.channels.get(channel)
+        if state is None:
+            return
+        state.in_flight = False
+        state.polls += 1
+        state.errors += 1
+        tripped = state.breaker.record_failure()
+        backoff = min(self.max_interval, self.base_interval * self.backoff_factor ** state.breaker.failures)
+        state.interval = max(state.interval, backoff)
+        if tripped:
+            logger.warning(f"[SCHED] Circuit opened for {channel} for {self.cooldown:.0f}s after {state.breaker.failures} failures")
+            state.next_due = state.breaker.open_until
+        elif retry_after is not None:
+            logger.warning(f"[SCHED] {channel} is rate limited, retrying after {retry_after:.0f}s")
+            state.next_due = time.monotonic() + max(retry_after, state.interval)
+        else:
+            self._schedule(state, state.interval)
+
+    def stats(self) -> dict[str, dict]:
+        return {
+            channel: {
+                "interval": round(state.interval, 2),
+                "polls": state.polls,
+                "errors": state.errors,
+                "circuit": state.breaker.state,
+            }
+            for channel, state in self.channels.items()
+        }
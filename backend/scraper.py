@@ -0,0 +1,70 @@
+import os
+from typing import Optional
+import aiohttp
+from yarl import URL
+from logger import logger
+
+SCRAPER_CONN_LIMIT = int(os.getenv("SCRAPER_CONN_LIMIT", 100))
+SCRAPER_CONN_LIMIT_PER_HOST = int(os.getenv("SCRAPER_CONN_LIMIT_PER_HOST", 20))
+SCRAPER_DNS_TTL = int(os.getenv("SCRAPER_DNS_TTL", 300))
+SCRAPER_KEEPALIVE = float(os.getenv("SCRAPER_KEEPALIVE", 60))
+SCRAPER_TIMEOUT_TOTAL = float(os.getenv("SCRAPER_TIMEOUT_TOTAL", 15))
+SCRAPER_TIMEOUT_CONNECT = float(os.getenv("SCRAPER_TIMEOUT_CONNECT", 5))
+SCRAPER_TIMEOUT_READ = float(os.getenv("SCRAPER_TIMEOUT_READ", 10))
+
+HEADERS = {
+    "User-Agent": (
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+        "AppleWebKit/537.36 (KHTML, like Gecko) "
+        "Chrome/117.0 Safari/537.36"
+    ),
+    "Accept": "text/html,application/xhtml+xml",
+    "Accept-Encoding": "gzip, deflate",
+}
+
+# url -> (query, ETag, Last-Modified) of the last 200 response, for conditional requests. Keyed without the query,
+# so each channel keeps one entry however often its ?after= watermark moves; validators are only sent for the
+# exact query they were returned for.
+validators: dict[str, tuple[str, Optional[str], Optional[str]]] = {}
+
+def create_session() -> aiohttp.ClientSession:
+    connector = aiohttp.TCPConnector(
+        limit=SCRAPER_CONN_LIMIT,
+        limit_per_host=SCRAPER_CONN_LIMIT_PER_HOST,
+        ttl_dns_cache=SCRAPER_DNS_TTL,
+        keepalive_timeout=SCRAPER_KEEPALIVE,
+        enable_cleanup_closed=True,
+    )
+    timeout = aiohttp.ClientTimeout(
+        total=SCRAPER_TIMEOUT_TOTAL,
+        sock_connect=SCRAPER_TIMEOUT_CONNECT,
+        sock_read=SCRAPER_TIMEOUT_READ,
+    )
+    logger.info(
+        f"[HTTP] Scraper session: {SCRAPER_CONN_LIMIT} connections ({SCRAPER_CONN_LIMIT_PER_HOST} per host), "
+        f"DNS cache {SCRAPER_DNS_TTL}s, timeout {SCRAPER_TIMEOUT_TOTAL}s"
+    )
+    return aiohttp.ClientSession(connector=connector, timeout=timeout, headers=HEADERS, auto_decompress=True)
+
+async def fetch_page(session: aiohttp.ClientSession, url: str, params: Optional[dict] = None) -> Optional[str]:
+    query = URL(url).with_query(params or {}).query_string
+    headers = {}
+    cached_query, etag, last_modified = validators.get(url, (None, None, None))
+    if cached_query == query:
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+
+    async with session.get(url, params=params, headers=headers) as response:
+        if response.status == 304:
+            return None
+        response.raise_for_status()
+        page = await response.text()
+        new_validators = (response.headers.get("ETag"), response.headers.get("Last-Modified"))
+
+    if any(new_validators):
+        validators[url] = (query, *new_validators)
+    else:
+        validators.pop(url, None)
+    return page
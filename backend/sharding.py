@@ -0,0 +1,78 @@
+import asyncio
+import math
+import os
+import socket
+import time
+from typing import Awaitable, Callable, Iterable
+import db
+from logger import logger
+
+LISTENER_SHARDING = os.getenv("LISTENER_SHARDING", "false").lower() in ("1", "true", "yes")
+LISTENER_WORKER_ID = os.getenv("LISTENER_WORKER_ID") or f"{socket.gethostname()}-{os.getpid()}"
+LISTENER_LEASE_TTL = float(os.getenv("LISTENER_LEASE_TTL", 30))
+
+class LeaseManager:
+    def __init__(
+        self,
+        channels: Iterable[str],
+        on_change: Callable[[set[str], set[str]], Awaitable[None]],
+        before_sync: Callable[[], Awaitable[None]] | None = None,
+        worker_id: str = LISTENER_WORKER_ID,
+        ttl: float = LISTENER_LEASE_TTL,
+    ):
+        self.channels = sorted(channels)
+        self.on_change = on_change
+        self.before_sync = before_sync
+        self.worker_id = worker_id
+        self.ttl = ttl
+        self.owned: set[str] = set()
+        # Monotonic time the last successful renewal started; the database counts the TTL from no earlier than that
+        self.renewed_at: float | None = None
+
+    async def sync(self):
+        started = time.monotonic()
+        live = await db.heartbeat_worker(self.worker_id, self.ttl, use_logger=False)
+        share = math.ceil(len(self.channels) / max(live, 1))
+        if self.before_sync:
+            # e.g. flush watermarks, so whoever takes over a released channel resumes from the right post
+            await self.before_sync()
+        owned = set(await db.sync_channel_leases(self.worker_id, self.channels, share, self.ttl, use_logger=False))
+        self.renewed_at = started
+
+        acquired, released = owned - self.owned, self.owned - owned
+        self.owned = owned
+        if acquired or released:
+            logger.info(
+                f"[SHARD] Worker {self.worker_id}: {live} live worker(s), owns {len(owned)}/{len(self.channels)} channels "
+                f"(+{len(acquired)} -{len(released)})"
+            )
+            await self.on_change(acquired, released)
+
+    async def expire(self):
+        # Leases that may run out before the next renewal attempt are given up, another worker may take the channels
+        # over as soon as they expire and both would poll them
+        if not self.owned or self.renewed_at is None:
+            return
+        if time.monotonic() - self.renewed_at < self.ttl - self.ttl / 3:
+            return
+        released, self.owned = self.owned, set()
+        logger.warning(f"[SHARD] Worker {self.worker_id} could not renew its leases, stops polling {len(released)} channels")
+        await self.on_change(set(), released)
+
+    async def run(self):
+        try:
+            while True:
+                try:
+                    # A hanging sync must not keep the expiry check waiting past the TTL
+                    async with asyncio.timeout(self.ttl / 3):
+                        await self.sync()
+                except Exception:
+                    logger.error(f"[SHARD] Lease sync failed for worker {self.worker_id}", exc_info=True)
+                    await self.expire()
+                # Renew well before the lease expires, so a live worker never loses its channels
+                await asyncio.sleep(self.ttl / 3)
+        finally:
+            try:
+                await db.release_channel_leases(self.worker_id)
+            except Exception:
+                logger.error(f"[SHARD] Failed to release leases of worker {self.worker_id}", exc_info=True)
@@ -0,0 +1,133 @@
+import asyncio
+import json
+import os
+from typing import Awaitable, Callable, Optional
+import db
+from logger import logger
+
+PG_LISTEN_CHANNEL = os.getenv("PG_NOTIFY_CHANNEL", "attack_updates")
+# How often the LISTEN connection is checked, and how long to wait before listening again once it is lost
+STATE_LISTEN_CHECK_SEC = float(os.getenv("STATE_LISTEN_CHECK_SEC", 30))
+STATE_RECONNECT_SEC = float(os.getenv("STATE_RECONNECT_SEC", 5))
+
+class StatusStore:
+    # Current status of every (region, attack_type), kept next to the attack id that set it. Local writes and
+    # NOTIFY from other writers may arrive in any order, the higher id always wins.
+    def __init__(self):
+        self.statuses: dict[str, dict[str, tuple[str, int]]] = {}
+        self.loaded = False
+        # True while LISTEN is up and the store was loaded after it started: nothing written through the
+        # trigger path can be missing, so the store may be trusted to skip repeats
+        self.listening = False
+        # Updates applied while a load is running, replayed on top of the loaded rows
+        self.pending: Optional[list[tuple[str, str, str, int]]] = None
+        self.lock = asyncio.Lock()
+
+    @property
+    def fresh(self) -> bool:
+        return self.loaded and self.listening
+
+    async def load(self, use_logger: bool = True):
+        # Replaces the store with current_status, so rows changed outside the trigger path are picked up too
+        async with self.lock:
+            self.pending = []
+            try:
+                rows = await db.get_current_statuses(use_logger=False)
+                pending, self.pending = self.pending, None
+                self.statuses = {}
+                for row in rows + pending:
+                    self.apply(*row)
+                self.loaded = True
+            finally:
+                self.pending = None
+        if use_logger:
+            logger.info(f"[STATE] Loaded {len(rows)} current statuses")
+
+    def apply(self, region: str, attack_type: str, status: str, attack_id: int) -> bool:
+        if self.pending is not None:
+            self.pending.append((region, attack_type, status, attack_id))
+        types = self.statuses.setdefault(region, {})
+        current = types.get(attack_type)
+        if current is not None and current[1] >= attack_id:
+            return False
+        types[attack_type] = (status, attack_id)
+        return True
+
+    def get(self, region: str, attack_type: str) -> Optional[str]:
+        current = self.statuses.get(region, {}).get(attack_type)
+        return current[0] if current else None
+
+    def region(self, region: str) -> dict:
+        statuses = {at: st for at, (st, _) in self.statuses.get(region, {}).items()}
+        return {"region": region, "statuses": statuses}
+
+    def snapshot(self) -> dict[str, dict[str, str]]:
+        return {region: {at: st for at, (st, _) in types.items()} for region, types in self.statuses.items() if types}
+
+    def apply_notification(self, payload: str) -> Optional[str]:
+        try:
+            data = json.loads(payload)
+        except ValueError:
+            logger.error("[STATE] Invalid payload")
+            return None
+
+        region = data.get("region")
+        if not region:
+            logger.error("[STATE] No region in payload")
+            return None
+
+        for update in data.get("updates", []):
+            self.apply(region, update["attack_type"], update["status"], update["id"])
+        return region
+
+    async def listen(self, on_change: Optional[Callable[[str], Awaitable[None]]] = None):
+        # Keeps the store in sync with writes from other processes (extra listener workers, manual inserts).
+        # A lost connection is reopened and the store reloaded, notifications sent in between are never delivered.
+        while True:
+            try:
+                await self.listen_once(on_change)
+            except asyncio.CancelledError:
+                logger.info("[STATE] Listener cancelled")
+                return
+            except Exception:
+                logger.error(f"[STATE] LISTEN connection lost, reconnecting in {STATE_RECONNECT_SEC}s", exc_info=True)
+            await asyncio.sleep(STATE_RECONNECT_SEC)
+
+    async def listen_once(self, on_change: Optional[Callable[[str], Awaitable[None]]] = None):
+        logger.info(f"[STATE] Starting LISTEN on channel '{PG_LISTEN_CHANNEL}'")
+        pool = await db.get_pool()
+        conn = await pool.acquire()
+        lost = asyncio.Event()
+
+        def _listener(conn_obj, pid, channel, payload):
+            region = self.apply_notification(payload)
+            if region and on_change:
+                asyncio.create_task(on_change(region))
+
+        def _terminated(conn_obj):
+            lost.set()
+
+        try:
+            conn.add_termination_listener(_terminated)
+            await conn.add_listener(PG_LISTEN_CHANNEL, _listener)
+            # Writes made before LISTEN started would otherwise be missed
+            await self.load()
+            self.listening = True
+            while True:
+                try:
+                    await asyncio.wait_for(lost.wait(), timeout=STATE_LISTEN_CHECK_SEC)
+                except TimeoutError:
+                    # A half-open connection never reports termination, a query on it fails instead
+                    await conn.execute("SELECT 1")
+                    continue
+                raise ConnectionError("LISTEN connection terminated")
+        finally:
+            self.listening = False
+            try:
+                await conn.remove_listener(PG_LISTEN_CHANNEL, _listener)
+                conn.remove_termination_listener(_terminated)
+            except Exception:
+                pass
+            await pool.release(conn)
+
+status_store = StatusStore()
@@ -0,0 +1,99 @@
+import asyncio
+import json
+from typing import Iterable, Optional
+import db
+from logger import logger
+
+PG_SUBSCRIPTIONS_CHANNEL = "subscription_updates"
+
+class SubscriberIndex:
+    # Subscribers of every region, so the fan-out of an attack update is a memory read. Local subscribe and
+    # unsubscribe calls update it directly, changes made by other processes arrive through NOTIFY.
+    def __init__(self):
+        self.regions: dict[str, set[int]] = {}
+        self.loaded = False
+        # Notifications received while the initial load is running, replayed on top of it
+        self.pending: Optional[list[str]] = None
+
+    async def load(self):
+        self.pending = []
+        try:
+            subscribers = await db.get_all_subscribers()
+            self.regions = {region: set(users) for region, users in subscribers.items()}
+            self.loaded = True
+            for payload in self.pending:
+                user_id = self.apply_notification(payload)
+                if user_id is not None:
+                    await self.reload_user(user_id)
+        finally:
+            self.pending = None
+        logger.info(f"[SUBSCRIBERS] Loaded {sum(map(len, self.regions.values()))} subscriptions in {len(self.regions)} regions")
+
+    def add(self, user_id: int, regions: Iterable[str]):
+        for region in regions:
+            self.regions.setdefault(region, set()).add(user_id)
+
+    def remove(self, user_id: int, regions: Iterable[str]):
+        for region in regions:
+            users = self.regions.get(region)
+            if users is not None:
+                users.discard(user_id)
+
+    def users(self, region: str) -> list[int]:
+        return list(self.regions.get(region, ()))
+
+    def users_by_regions(self, regions: Iterable[str]) -> dict[str, list[int]]:
+        return {region: list(users) for region in regions if (users := self.regions.get(region))}
+
+    async def reload_user(self, user_id: int):
+        regions = await db.get_subscriptions(user_id=user_id, use_logger=False)
+        for users in self.regions.values():
+            users.discard(user_id)
+        self.add(user_id, regions)
+
+    def apply_notification(self, payload: str) -> Optional[int]:
+        # Returns the user whose subscriptions did not fit into the payload and have to be reloaded
+        try:
+            data = json.loads(payload)
+            op, user_id = data["op"], data["user_id"]
+        except (ValueError, KeyError):
+            logger.error("[SUBSCRIBERS] Invalid payload")
+            return None
+
+        if op == "add":
+            self.add(user_id, data.get("regions", []))
+        elif op == "remove":
+            self.remove(user_id, data.get("regions", []))
+        elif op == "reload":
+            return user_id
+        return None
+
+    async def listen(self):
+        logger.info(f"[SUBSCRIBERS] Starting LISTEN on channel '{PG_SUBSCRIPTIONS_CHANNEL}'")
+        pool = await db.get_pool()
+        conn = await pool.acquire()
+
+        def _listener(conn_obj, pid, channel, payload):
+            if self.pending is not None:
+                self.pending.append(payload)
+                return
+            user_id = self.apply_notification(payload)
+            if user_id is not None:
+                asyncio.create_task(self.reload_user(user_id))
+
+        try:
+            await conn.add_listener(PG_SUBSCRIPTIONS_CHANNEL, _listener)
+            # Subscriptions changed before LISTEN started would otherwise be missed
+            await self.load()
+            while True:
+                await asyncio.sleep(3600)
+        except asyncio.CancelledError:
+            logger.info("[SUBSCRIBERS] Listener cancelled")
+        finally:
+            try:
+                await conn.remove_listener(PG_SUBSCRIPTIONS_CHANNEL, _listener)
+            except Exception:
+                pass
+            await pool.release(conn)
+
+subscriber_index = SubscriberIndex()
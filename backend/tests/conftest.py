@@ -0,0 +1,39 @@
+import asyncio
+import os
+import sys
+import uuid
+import asyncpg
+import pytest
+
+# Modules are imported flat, as main.py does when started from backend/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("BOT_TOKEN", "1:test")
+os.environ.setdefault("ANALYZER_PROVIDERS", "fake")
+os.environ.setdefault("ANALYZER_LEDGER", "false")
+os.environ.setdefault("ANALYZER_CACHE_PERSIST", "false")
+
+# PostgreSQL for the tests that need a real database (migrations, catalog checks); they are skipped without it.
+# Every test gets a schema of its own, dropped afterwards.
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+@pytest.fixture
+def pg():
+    if not TEST_DATABASE_URL:
+        pytest.skip("TEST_DATABASE_URL is not set")
+    schema = f"test_{uuid.uuid4().hex[:12]}"
+
+    async def connect() -> asyncpg.Connection:
+        conn = await asyncpg.connect(TEST_DATABASE_URL)
+        await conn.execute(f"CREATE SCHEMA {schema}")
+        await conn.execute(f"SET search_path TO {schema}")
+        return conn
+
+    loop = asyncio.new_event_loop()
+    conn = loop.run_until_complete(connect())
+    try:
+        yield loop, conn
+    finally:
+        loop.run_until_complete(conn.execute(f"DROP SCHEMA {schema} CASCADE"))
+        loop.run_until_complete(conn.close())
+        loop.close()
@@ -0,0 +1,14 @@
+from analysis_cache import cache_key, normalize_text
+
+def test_status_emoji_keep_cache_keys_apart():
+    threat = cache_key("🔴 Курская область — БПЛА", "radarrussiia", "v1")
+    all_clear = cache_key("🟢 Курская область — БПЛА", "radarrussiia", "v1")
+    assert threat != all_clear
+
+def test_reposts_share_a_cache_key():
+    original = cache_key("🔴 Курская область — угроза БПЛА!", "radarrussiia", "v1")
+    repost = cache_key("🔴️  курская область: угроза бпла\n", "radarrussiia", "v1")
+    assert original == repost
+
+def test_normalized_text_keeps_answer_separators():
+    assert normalize_text("HD/Курская область/UAV.") == "hd/курская область/uav"
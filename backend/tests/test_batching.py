@@ -0,0 +1,78 @@
+import asyncio
+import re
+import analyzer
+from analysis_cache import analysis_cache, cache_key
+from analyzer import PROMPT_VERSION, AnalyzerEngine, analyze_message
+from providers import FakeProvider, ProviderRouter
+
+class SkippingProvider(FakeProvider):
+    # Batched prompts get a line only for the first message; single prompts are answered normally
+    async def stream(self, messages: list[dict], usage: dict):
+        self.calls += 1
+        content = messages[-1]["content"]
+        if re.search(r"^\[2\]$", content, flags=re.M):
+            yield "1: HD/Москва/UAV\n"
+            return
+        yield "MD/Курская область/UAV"
+
+class NumberingProvider(FakeProvider):
+    # Answers every numbered message of a batch and keeps the prompts it was sent
+    def __init__(self):
+        super().__init__()
+        self.prompts = []
+
+    async def stream(self, messages: list[dict], usage: dict):
+        self.calls += 1
+        content = messages[-1]["content"]
+        self.prompts.append(content)
+        for number in re.findall(r"^\[(\d+)\]$", content, flags=re.M):
+            yield f"{number}: HD/Москва/UAV\n"
+
+def run_batch(provider: FakeProvider, messages: list[str], sources: list[str] | None = None) -> list[str]:
+    async def main():
+        engine = AnalyzerEngine(ProviderRouter([provider]))
+        engine.batcher.window = 0.05
+        engine.batcher.max_size = 8
+        analyzer._engine = engine
+        try:
+            return await asyncio.gather(*(
+                analyze_message(m, source=source, channel_name="test")
+                for m, source in zip(messages, sources or ["test"] * len(messages))
+            ))
+        finally:
+            analyzer._engine = None
+
+    return asyncio.run(main())
+
+def test_missing_batch_line_is_analyzed_separately():
+    messages = ["первое сообщение о беспилотниках", "второе сообщение без строки в ответе"]
+    provider = SkippingProvider()
+    results = run_batch(provider, messages)
+    assert results == ["HD/Москва/UAV", "MD/Курская область/UAV"]
+    assert provider.calls == 2
+    # The re-run answer is cached, an empty "no alerts" result never is
+    assert analysis_cache.entries[cache_key(messages[1], "test", PROMPT_VERSION)][1] == "MD/Курская область/UAV"
+
+def test_batch_answers_every_message():
+    messages = ["третье сообщение", "четвертое сообщение"]
+    provider = FakeProvider(result="AC/Москва/UAV")
+    results = run_batch(provider, messages)
+    assert results == ["AC/Москва/UAV", "AC/Москва/UAV"]
+    assert provider.calls == 1
+
+def test_failed_batch_is_not_cached():
+    messages = ["пятое сообщение", "шестое сообщение"]
+    results = run_batch(FakeProvider(fail=True), messages)
+    assert results == [analyzer.FAILSAFE_RESULT, analyzer.FAILSAFE_RESULT]
+    for message in messages:
+        assert cache_key(message, "test", PROMPT_VERSION) not in analysis_cache.entries
+
+def test_posts_of_different_channels_share_a_batch():
+    messages = ["угроза БПЛА, канал один", "угроза БПЛА, канал два", "угроза БПЛА, канал три", "угроза БПЛА, канал четыре"]
+    sources = ["radarrussiia", "RDFradar", "lpr1_Kherson_alarm", "test"]
+    provider = NumberingProvider()
+    results = run_batch(provider, messages, sources)
+    assert results == ["HD/Москва/UAV"] * 4
+    assert provider.calls == 1
+    # Every post keeps the region list of its own channel
+    assert provider.prompts[0].count("РЕГИОНЫ:") == 4
@@ -0,0 +1,31 @@
+import pytest
+from classifier import classify
+
+@pytest.mark.parametrize("message, expected", [
+    ("Угроза атаки БПЛА в Курской области", "HD/Курская область/UAV"),
+    ("Ракетная опасность в Белгородской области", "HD/Белгородская область/ROCKET"),
+    ("Отбой БПЛА в Курской области", "AC/Курская область/UAV"),
+    ("Отбой ракетной тревоги в Брянской области", "AC/Брянская область/ROCKET"),
+    ("Тишина по всей России", "AC/Россия/ALL"),
+])
+def test_formulaic_posts_are_classified(message, expected):
+    assert classify(message, None) == expected
+
+@pytest.mark.parametrize("message", [
+    "Угрозы БПЛА в Курской области не наблюдается",
+    "Угроза атаки БПЛА в Курской области миновала",
+    "Атака БПЛА на Курскую область отражена",
+    "Тревога БПЛА в Курской области снята",
+    "Последствия атаки БПЛА в Курской области ликвидированы",
+    "Атак БПЛА в Курской области не фиксируется",
+])
+def test_negated_or_finished_threats_are_left_to_the_llm(message):
+    assert classify(message, None) is None
+
+@pytest.mark.parametrize("message", [
+    "Возможна атака БПЛА в Курской области",
+    "Угроза БПЛА в Курской области и Шуе",
+    "Угроза БПЛА и ракетная опасность в Курской области",
+])
+def test_ambiguous_posts_are_left_to_the_llm(message):
+    assert classify(message, None) is None
@@ -0,0 +1,27 @@
+import glob
+import os
+import pytest
+from extractor import extract_posts, extract_posts_bs4, extract_posts_fast
+
+PAGES = sorted(glob.glob(os.path.join(os.path.dirname(os.path.dirname(__file__)), "benchmarks", "fixtures", "*.html")))
+
+def read(path: str) -> str:
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+@pytest.mark.parametrize("path", PAGES, ids=os.path.basename)
+def test_fast_extractor_matches_beautifulsoup(path):
+    page = read(path)
+    assert extract_posts_fast(page) == extract_posts_bs4(page)
+
+@pytest.mark.parametrize("path", PAGES, ids=os.path.basename)
+def test_fast_extractor_stops_at_the_watermark(path):
+    page = read(path)
+    posts = extract_posts_bs4(page)["posts"]
+    after = posts[-3]["post_id"]
+    assert extract_posts_fast(page, after)["posts"] == posts[-3:]
+
+def test_watermark_newer_than_the_page_keeps_the_newest_post():
+    page = read(PAGES[0])
+    newest = extract_posts_bs4(page)["posts"][-1]
+    assert extract_posts(page, after=newest["post_id"] + 100)["posts"] == [newest]
@@ -0,0 +1,18 @@
+from config import REGIONS
+from gazetteer import candidate_regions, find_regions
+
+def test_aliases_from_the_region_table_narrow_the_prompt():
+    assert candidate_regions("Москва и Подмосковье: угроза БПЛА", REGIONS) == ["Московская область", "Москва"]
+    assert find_regions("Отбой в Кузбассе") == ["Кемеровская область"]
+
+def test_declined_city_names_are_found():
+    assert candidate_regions("Угроза БПЛА в Иванове", REGIONS) == ["Ивановская область"]
+
+def test_abbreviated_region_names_are_found():
+    assert find_regions("Отбой в Курской обл. и Белгородской области") == ["Курская область", "Белгородская область"]
+
+def test_unknown_place_keeps_the_full_list():
+    assert candidate_regions("Тревога в Ивановской области и в Шуе", REGIONS) == REGIONS
+
+def test_nothing_recognised_keeps_the_full_list():
+    assert candidate_regions("Внимание, угроза атаки БПЛА", REGIONS) == REGIONS
@@ -0,0 +1,55 @@
+import importlib
+import migrations
+from migrations import run_migrations
+
+def test_migrations_do_not_depend_on_the_partition_interval(monkeypatch):
+    default = [statements for _, _, statements in migrations.MIGRATIONS]
+    monkeypatch.setenv("ATTACKS_PARTITION_INTERVAL", "day")
+    try:
+        assert [statements for _, _, statements in importlib.reload(migrations).MIGRATIONS] == default
+    finally:
+        monkeypatch.undo()
+        importlib.reload(migrations)
+
+def migrate_with_history(pg, monkeypatch) -> None:
+    # Legacy rows written before the partitioning migration, one of them without a timestamp
+    loop, conn = pg
+    monkeypatch.setattr(migrations, "MIGRATIONS", migrations.MIGRATIONS[:1])
+    loop.run_until_complete(run_migrations(conn))
+    loop.run_until_complete(conn.execute(
+        """
+        INSERT INTO attacks (region, attack_type, status, source, timestamp) VALUES
+            ('Москва', 'UAV', 'HD', 'test', '10:00:00 01-02-2025'),
+            ('Москва', 'UAV', 'AC', 'test', '11:00:00 15-03-2025'),
+            ('Курская область', 'UAV', 'HD', 'test', NULL)
+        """
+    ))
+    monkeypatch.undo()
+    loop.run_until_complete(run_migrations(conn))
+
+def test_partitioned_attacks_have_a_primary_key(pg, monkeypatch):
+    loop, conn = pg
+    migrate_with_history(pg, monkeypatch)
+    columns = loop.run_until_complete(conn.fetch(
+        """
+        SELECT a.attname
+        FROM pg_index i
+        JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey)
+        WHERE i.indrelid = 'attacks'::regclass AND i.indisprimary
+        """
+    ))
+    assert {r["attname"] for r in columns} == {"id", "timestamp"}
+    assert loop.run_until_complete(conn.fetchval("SELECT count(*) FROM attacks WHERE timestamp IS NULL")) == 0
+    assert loop.run_until_complete(conn.fetchval("SELECT count(*) FROM attacks")) == 3
+
+def test_history_moves_out_of_the_default_partition(pg, monkeypatch):
+    loop, conn = pg
+    migrate_with_history(pg, monkeypatch)
+    # The migration creates no partitions, the maintainer splits them off the default partition
+    assert loop.run_until_complete(conn.fetchval("SELECT count(*) FROM attacks_default")) == 3
+    created = loop.run_until_complete(conn.fetchval(
+        "SELECT ensure_attack_partitions('month', (SELECT min(timestamp) FROM attacks_default), now())"
+    ))
+    assert created >= 2
+    assert loop.run_until_complete(conn.fetchval("SELECT count(*) FROM attacks_default")) == 0
+    assert loop.run_until_complete(conn.fetchval("SELECT count(*) FROM attacks_p20250201")) == 2
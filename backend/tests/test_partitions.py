@@ -0,0 +1,25 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+import db
+from partitions import PartitionMaintainer
+
+def test_partitions_are_created_from_the_retention_cutoff(monkeypatch):
+    calls = []
+
+    async def ensure_attack_partitions(unit, ahead, since=None, use_logger=True):
+        calls.append(since)
+        return 0
+
+    async def nothing(*args, **kwargs):
+        return []
+
+    monkeypatch.setattr(db, "ensure_attack_partitions", ensure_attack_partitions)
+    monkeypatch.setattr(db, "detach_expired_partitions", nothing)
+    monkeypatch.setattr(db, "get_detached_partitions", nothing)
+
+    asyncio.run(PartitionMaintainer(retention_days=30).maintain())
+    expected = datetime.now(timezone.utc) - timedelta(days=30)
+    assert abs(calls[0] - expected) < timedelta(minutes=1)
+
+    asyncio.run(PartitionMaintainer(retention_days=0).maintain())
+    assert calls[1] is None
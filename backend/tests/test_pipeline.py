@@ -0,0 +1,39 @@
+import asyncio
+import random
+import listener
+from listener import ListenerPipeline
+
+def test_notifications_keep_per_region_order(monkeypatch):
+    sent: list[tuple[str, str]] = []
+
+    async def persist(region, attack_type, status, source):
+        return True
+
+    async def notify(region, attack_type, status, source, comment):
+        # Uneven send times would reorder the updates if several workers served one region
+        await asyncio.sleep(random.uniform(0, 0.01))
+        sent.append((region, status))
+
+    monkeypatch.setattr(listener, "persist_attack_update", persist)
+    monkeypatch.setattr(listener, "notify_attack_update", notify)
+
+    async def main():
+        pipeline = ListenerPipeline(persist_workers=2, notify_workers=4)
+        pipeline.start()
+        regions = ["Москва", "Курская область", "Белгородская область"]
+        expected = {region: [] for region in regions}
+        for i in range(30):
+            region = regions[i % len(regions)]
+            status = ("HD", "AC", "MD")[i % 3 if i % 2 else 0]
+            expected[region].append(status)
+            await pipeline.persist_queue.put(region, {
+                "region": region, "attack_type": "UAV", "status": status, "source": "test", "comment": None,
+            })
+        await pipeline.persist_queue.join()
+        await pipeline.notify_queue.join()
+        await pipeline.stop()
+        return expected
+
+    expected = asyncio.run(main())
+    for region, statuses in expected.items():
+        assert [status for r, status in sent if r == region] == statuses
@@ -0,0 +1,93 @@
+import asyncio
+import pytest
+from analyzer import FAILSAFE_RESULT, AnalyzerEngine, is_reliable
+from ledger import CallRecord
+from providers import AllProvidersFailed, FakeProvider, ProviderRouter
+from scheduler import CircuitBreaker
+
+MESSAGES = [{"role": "user", "content": "Текст для анализа:\nтест"}]
+
+async def collect(router: ProviderRouter, call: CallRecord | None = None) -> list[tuple[str, str | None]]:
+    return [(provider.name, chunk) async for provider, chunk in router.stream(MESSAGES, call)]
+
+async def analyze(router: ProviderRouter) -> tuple[list[str], CallRecord]:
+    call = CallRecord("test")
+    engine = AnalyzerEngine(router)
+    entries = [entry async for entry in engine.analyze_stream(MESSAGES, call=call)]
+    return entries, call
+
+def test_failover_to_next_provider():
+    first = FakeProvider(fail=True, name="first")
+    second = FakeProvider(result="HD/Москва/UAV", name="second")
+    call = CallRecord("test")
+    chunks = asyncio.run(collect(ProviderRouter([first, second]), call))
+    assert chunks == [("second", "HD/Москва/UAV")]
+    assert call.provider == "second"
+    assert len(call.fallbacks) == 1 and call.fallbacks[0].startswith("first")
+
+def test_every_provider_failing_raises():
+    router = ProviderRouter([FakeProvider(fail=True, name="a"), FakeProvider(fail=True, name="b")])
+    with pytest.raises(AllProvidersFailed):
+        asyncio.run(collect(router))
+
+def test_hedge_wins_and_slow_provider_is_cancelled():
+    slow = FakeProvider(result="HD/Москва/UAV", delay=1, name="slow")
+    fast = FakeProvider(result="MD/Курская область/UAV", name="fast")
+    call = CallRecord("test")
+    chunks = asyncio.run(collect(ProviderRouter([slow, fast], hedge_after=0.05), call))
+    assert chunks == [("fast", "MD/Курская область/UAV")]
+    assert call.hedged
+    assert call.provider == "fast"
+    assert not call.fallbacks
+
+def test_hedge_is_restarted_when_winner_fails():
+    winner = FakeProvider(result="HD/Москва/UAV,MD/Курская область/UAV", delay=0.05, fail_after=1, name="winner")
+    hedge = FakeProvider(result="AC/Москва/UAV", delay=0.3, name="hedge")
+    chunks = asyncio.run(collect(ProviderRouter([winner, hedge], hedge_after=0.01)))
+    assert chunks == [("winner", "HD/Москва/UAV,"), ("winner", None), ("hedge", "AC/Москва/UAV")]
+    assert hedge.calls == 2
+
+def test_breaker_opens_and_skips_provider():
+    broken = FakeProvider(fail=True, name="broken")
+    broken.breaker = CircuitBreaker(2, 60)
+    healthy = FakeProvider(result="AC/Москва/UAV", name="healthy")
+    router = ProviderRouter([broken, healthy])
+    for _ in range(2):
+        asyncio.run(collect(router))
+    assert broken.breaker.state == "open"
+    assert router.candidates() == [healthy]
+    asyncio.run(collect(router))
+    assert broken.calls == 2
+
+def test_every_breaker_open_still_tries_providers():
+    broken = FakeProvider(fail=True, name="broken")
+    broken.breaker = CircuitBreaker(1, 60)
+    broken.breaker.record_failure()
+    assert ProviderRouter([broken]).candidates() == [broken]
+
+def test_failure_after_first_entry_keeps_partial_answer():
+    first = FakeProvider(result="HD/Москва/UAV,HD/Курская область/UAV", fail_after=1, name="first")
+    second = FakeProvider(result="AC/Тверская область/UAV", name="second")
+    entries, call = asyncio.run(analyze(ProviderRouter([first, second])))
+    assert entries == ["HD/Москва/UAV"]
+    assert FAILSAFE_RESULT not in entries
+    assert second.calls == 0
+    assert not is_reliable(call, entries)
+
+def test_failure_before_first_entry_falls_back():
+    first = FakeProvider(result="HD/Москва/UAV", fail_after=0, name="first")
+    second = FakeProvider(result="AC/Тверская область/UAV", name="second")
+    entries, call = asyncio.run(analyze(ProviderRouter([first, second])))
+    assert entries == ["AC/Тверская область/UAV"]
+    assert not call.failsafe
+
+def test_failsafe_only_when_nothing_was_produced():
+    entries, call = asyncio.run(analyze(ProviderRouter([FakeProvider(fail=True)])))
+    assert entries == [FAILSAFE_RESULT]
+    assert call.failsafe
+    assert not is_reliable(call, entries)
+
+def test_clean_answer_is_reliable():
+    entries, call = asyncio.run(analyze(ProviderRouter([FakeProvider(result="HD/Москва/UAV,AC/Москва/AIR")])))
+    assert entries == ["HD/Москва/UAV", "AC/Москва/AIR"]
+    assert is_reliable(call, entries)
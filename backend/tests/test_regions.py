@@ -0,0 +1,16 @@
+from regions import resolve_region
+
+def test_official_long_forms_resolve():
+    assert resolve_region("Кемеровской области - Кузбасс") == "Кемеровская область"
+    assert resolve_region("Кемеровская область — Кузбасс") == "Кемеровская область"
+    assert resolve_region("Северной Осетии - Алании") == "Республика Северная Осетия (Алания)"
+    assert resolve_region("Республики Татарстан (Татарстан)") == "Республика Татарстан"
+
+def test_case_forms_and_aliases_resolve():
+    assert resolve_region("Курской области") == "Курская область"
+    assert resolve_region("Подмосковья") == "Московская область"
+    assert resolve_region("Кубани") == "Краснодарский край"
+
+def test_prefix_shared_by_several_subjects_is_rejected():
+    assert resolve_region("Нов") is None
+    assert resolve_region("Новос") == "Новосибирская область"
@@ -0,0 +1,40 @@
+import asyncio
+import scraper
+
+class FakeResponse:
+    def __init__(self, status: int, etag: str):
+        self.status = status
+        self.headers = {"ETag": etag}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def raise_for_status(self):
+        pass
+
+    async def text(self):
+        return "<html></html>"
+
+class FakeSession:
+    def __init__(self):
+        self.sent = []
+
+    def get(self, url, params=None, headers=None):
+        self.sent.append(headers)
+        return FakeResponse(200, f'"{(params or {}).get("after")}"')
+
+def test_validators_keep_one_entry_per_channel(monkeypatch):
+    monkeypatch.setattr(scraper, "validators", {})
+    session = FakeSession()
+
+    async def poll():
+        for after in (None, 100, 100, 105):
+            await scraper.fetch_page(session, "https://t.me/s/chan", params={"after": after} if after else None)
+
+    asyncio.run(poll())
+    assert list(scraper.validators) == ["https://t.me/s/chan"]
+    # Validators are only sent for the same query they were returned for
+    assert session.sent == [{}, {}, {"If-None-Match": '"100"'}, {}]
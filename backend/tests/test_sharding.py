@@ -0,0 +1,45 @@
+import asyncio
+import db
+from sharding import LeaseManager
+
+def test_channels_are_released_when_leases_cannot_be_renewed(monkeypatch):
+    changes = []
+
+    async def on_change(acquired, released):
+        changes.append((acquired, released))
+
+    async def heartbeat_worker(worker_id, ttl, use_logger=True):
+        return 1
+
+    async def sync_channel_leases(worker_id, channels, share, ttl, use_logger=True):
+        return channels[:share]
+
+    async def failing(*args, **kwargs):
+        raise ConnectionError("database is gone")
+
+    async def release_channel_leases(worker_id, use_logger=True):
+        pass
+
+    monkeypatch.setattr(db, "heartbeat_worker", heartbeat_worker)
+    monkeypatch.setattr(db, "sync_channel_leases", sync_channel_leases)
+    monkeypatch.setattr(db, "release_channel_leases", release_channel_leases)
+
+    async def main():
+        manager = LeaseManager(["a", "b"], on_change=on_change, ttl=0.3)
+        task = asyncio.create_task(manager.run())
+        await asyncio.sleep(0.05)
+        assert manager.owned == {"a", "b"}
+
+        monkeypatch.setattr(db, "heartbeat_worker", failing)
+        await asyncio.sleep(0.4)
+        assert manager.owned == set()
+
+        monkeypatch.setattr(db, "heartbeat_worker", heartbeat_worker)
+        await asyncio.sleep(0.2)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return manager
+
+    manager = asyncio.run(main())
+    assert changes == [({"a", "b"}, set()), (set(), {"a", "b"}), ({"a", "b"}, set())]
+    assert manager.owned == {"a", "b"}
@@ -0,0 +1,44 @@
+import asyncio
+import db
+import listener
+from state import StatusStore
+
+def test_load_replaces_the_store_and_keeps_updates_made_meanwhile(monkeypatch):
+    store = StatusStore()
+    store.apply("Москва", "UAV", "HD", 5)
+    store.apply("Курская область", "UAV", "HD", 6)
+
+    async def get_current_statuses(use_logger=True):
+        # A local write lands while the query runs
+        store.apply("Москва", "UAV", "AC", 9)
+        return [("Москва", "UAV", "MD", 7)]
+
+    monkeypatch.setattr(db, "get_current_statuses", get_current_statuses)
+    asyncio.run(store.load())
+
+    # Rows gone from current_status are dropped, the write made during the load is not lost
+    assert store.snapshot() == {"Москва": {"UAV": "AC"}}
+
+def test_repeats_are_checked_in_the_database_unless_the_store_is_fresh(monkeypatch):
+    store = StatusStore()
+    store.loaded = True
+    store.apply("Москва", "UAV", "HD", 5)
+    monkeypatch.setattr(listener, "status_store", store)
+    saved = []
+
+    async def get_last_status(region, attack_type, use_logger=True):
+        return "AC"
+
+    async def save_attack(region, attack_type, status, source, use_logger=True):
+        saved.append((region, attack_type, status))
+        return 10
+
+    monkeypatch.setattr(db, "get_last_status", get_last_status)
+    monkeypatch.setattr(db, "save_attack", save_attack)
+
+    # Without LISTEN the stale HD in memory must not turn this change into a repeat
+    assert asyncio.run(listener.persist_attack_update("Москва", "UAV", "HD", "test"))
+    assert saved == [("Москва", "UAV", "HD")]
+
+    store.listening = True
+    assert not asyncio.run(listener.persist_attack_update("Москва", "UAV", "HD", "test"))
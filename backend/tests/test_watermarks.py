@@ -0,0 +1,23 @@
+from watermarks import WatermarkStore
+
+def test_stored_watermark_waits_for_pending_posts():
+    store = WatermarkStore()
+    store.advance("chan", 12, "h12", [10, 11, 12])
+
+    # Fetching goes on from the latest post, the stored mark stays before the first unanalyzed one
+    assert store.get("chan") == 12
+    assert store.marks["chan"]["post_id"] == 9
+
+    store.done("chan", 11)
+    assert store.marks["chan"]["post_id"] == 9
+    store.done("chan", 10)
+    assert store.marks["chan"]["post_id"] == 11
+    store.done("chan", 12)
+    assert store.marks["chan"]["post_id"] == 12
+    assert store.marks["chan"]["content_hash"] == "h12"
+
+def test_watermark_without_pending_posts_is_stored_at_once():
+    store = WatermarkStore()
+    store.advance("chan", 5, "h5", [])
+    assert store.marks["chan"]["post_id"] == 5
+    assert "chan" in store.dirty
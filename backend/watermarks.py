@@ -0,0 +1,101 @@
+import asyncio
+import hashlib
+import os
+from datetime import datetime, timezone
+from typing import Optional
+import db
+from logger import logger
+
+WATERMARK_FLUSH_SEC = float(os.getenv("WATERMARK_FLUSH_SEC", 5))
+
+def content_hash(text: Optional[str]) -> Optional[str]:
+    if text is None:
+        return None
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+class WatermarkStore:
+    def __init__(self, flush_interval: float = WATERMARK_FLUSH_SEC):
+        self.flush_interval = flush_interval
+        self.marks: dict[str, dict] = {}
+        self.dirty: set[str] = set()
+        # Fetch position of every channel. The stored mark trails it while fetched posts are still being analyzed,
+        # so a restart re-fetches those instead of skipping them.
+        self.fetched: dict[str, tuple[int, Optional[str]]] = {}
+        self.in_flight: dict[str, set[int]] = {}
+        self.lock = asyncio.Lock()
+
+    async def load(self, channels: Optional[list[str]] = None):
+        try:
+            self.marks.update(await db.get_watermarks(channels))
+            for channel in channels or list(self.fetched):
+                if not self.in_flight.get(channel):
+                    self.fetched.pop(channel, None)
+        except Exception:
+            logger.error("[WM] Failed to load listener watermarks, starting from scratch", exc_info=True)
+
+    def get(self, channel: str) -> Optional[int]:
+        if channel in self.fetched:
+            return self.fetched[channel][0]
+        mark = self.marks.get(channel)
+        return mark["post_id"] if mark else None
+
+    def get_hash(self, channel: str) -> Optional[str]:
+        if channel in self.fetched:
+            return self.fetched[channel][1]
+        mark = self.marks.get(channel)
+        return mark["content_hash"] if mark else None
+
+    def advance(self, channel: str, post_id: int, content_hash: Optional[str], pending: list[int]):
+        # Fetching moves on at once, the stored mark only once every pending post is done()
+        current = self.get(channel)
+        if current is not None and post_id < current:
+            return
+        self.fetched[channel] = (post_id, content_hash)
+        self.in_flight.setdefault(channel, set()).update(pending)
+        self.commit(channel)
+
+    def done(self, channel: str, post_id: int):
+        self.in_flight.get(channel, set()).discard(post_id)
+        self.commit(channel)
+
+    def commit(self, channel: str):
+        if channel not in self.fetched:
+            return
+        waiting = self.in_flight.get(channel)
+        if waiting:
+            self.update(channel, min(waiting) - 1, None)
+        else:
+            self.update(channel, *self.fetched[channel])
+
+    def update(self, channel: str, post_id: int, content_hash: Optional[str]):
+        current = self.marks.get(channel)
+        if current and (post_id, content_hash) == (current["post_id"], current["content_hash"]):
+            return
+        if current and post_id < current["post_id"]:
+            return
+        self.marks[channel] = {
+            "post_id": post_id,
+            "content_hash": content_hash,
+            "fetched_at": datetime.now(timezone.utc),
+        }
+        self.dirty.add(channel)
+
+    async def flush(self):
+        async with self.lock:
+            if not self.dirty:
+                return
+            channels, self.dirty = self.dirty, set()
+            try:
+                await db.save_watermarks({ch: self.marks[ch] for ch in channels}, use_logger=False)
+            except Exception:
+                self.dirty |= channels
+                logger.error("[WM] Failed to flush listener watermarks", exc_info=True)
+
+    async def run(self):
+        # Write-behind: polling only touches memory, the database catches up every flush_interval
+        try:
+            while True:
+                await asyncio.sleep(self.flush_interval)
+                await self.flush()
+        finally:
+            await self.flush()